@@ -1,49 +1,166 @@
-from flask import Flask, render_template, request, jsonify
-from flask_socketio import SocketIO, emit
+from flask import Flask, Response, render_template, request, jsonify
+from flask_socketio import SocketIO, emit, join_room
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
+import atexit
 import json
+import logging
 from datetime import datetime
 
 # Import orchestration
 from orchestration import my_async_flow
+from nodes import agent, agent_model, memory_model, memory_client, cancel_summary, flush_unpersisted
+from logs import configure_logging
+from memory import ChromaMemory
+from metrics import REGISTRY, PROMETHEUS_CONTENT_TYPE
+from runtime import AsyncRuntime
+from sessions import SessionStore
+from utils import prompt_cache
+from warmup import ModelWarmer
+
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'anemone-secret-key'
 socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
 
-# Global state
-conversation_state = {
-    "history": [],
-    "loop_count": 0,
-    "retrieved_memory": "",
-    "memory_action": ""
-}
-
-# Thread pool for async operations
-executor = ThreadPoolExecutor(max_workers=3)
-
-def run_async_in_thread(coro):
-    """Helper to run async code in Flask's sync context"""
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
+# One conversation per session token, each talking to its own Socket.IO room;
+# an expired one hands its not yet persisted messages to memory
+sessions = SessionStore(socketio, on_expire=lambda session: runtime.submit(retire_session(session)))
+
+# Keeps the node models loaded in Ollama between turns
+model_warmer = ModelWarmer([agent_model, memory_model])
+
+# Every flow runs on this one long-lived event loop
+runtime = AsyncRuntime()
+atexit.register(runtime.stop)
+
+def memory_queue_depths():
+    depths = {"executor": 0, "write_behind": 0}
+    for memory in list(ChromaMemory._instances.values()):
+        for queue, depth in memory.queue_depths().items():
+            depths[queue] += depth
+    return depths
+
+def memory_cache_stat(stats, field):
+    """Gauge callback summing one field of a cache's stats() over every memory store"""
+    return lambda: sum(stats(memory)[field] for memory in list(ChromaMemory._instances.values()))
+
+REGISTRY.gauge("anemone_memory_queue_depth", "Memory work waiting, by queue", ("queue",),
+               callback=memory_queue_depths)
+for field in ("hits", "misses"):
+    REGISTRY.gauge(f"anemone_retrieval_cache_{field}", f"Retrieval cache {field} since start",
+                   callback=memory_cache_stat(lambda memory: memory.cache.stats(), field))
+    REGISTRY.gauge(f"anemone_embedding_cache_{field}", f"Embedding cache {field} since start",
+                   callback=memory_cache_stat(lambda memory: memory.embedder.stats(), field))
+REGISTRY.gauge("anemone_runtime_tasks", "Tasks (turns, background summaries) on the runtime loop",
+               callback=lambda: len(asyncio.all_tasks(runtime.loop)) if runtime.running else 0)
+
+async def run_turn(session, user_msg):
+    """Runs one user turn of a session through the orchestration"""
+    room = session.token
+    # Turns of one session run one at a time, other sessions are unaffected
+    async with session.lock:
+        conversation_state = session.state
+        try:
+            # Add user message to history
+            conversation_state['history'].append({
+                'role': 'user',
+                'content': user_msg,
+                'timestamp': datetime.now().isoformat()
+            })
+
+            # Run the async flow
+            await my_async_flow.run_async(conversation_state)
+            
+            # Memory retrieval is now emitted by RagNode.post_async
+            # Keep this as backup but don't clear retrieved_memory here
+            # (Agent.post_async will clear it after use)
+            
+            # Emit final state update
+            socketio.emit('state_update', {
+                'loop_count': conversation_state['loop_count'],
+                'memory_action': conversation_state.get('memory_action', ''),
+                'prompt_tokens': conversation_state.get('prompt_tokens', 0),
+                'context_limit': agent.budget.limit
+            }, to=room)
+            
+            # Clear processing status
+            socketio.emit('status_update', {
+                'status': 'idle',
+                'message': ''
+            }, to=room)
+            
+        except Exception as e:
+            logger.exception("Error in run_turn: %s", e)
+            socketio.emit('status_update', {
+                'status': 'error',
+                'message': f'Error: {str(e)}'
+            }, to=room)
+
+async def flush_session(session):
+    """Stops the session's background summary, if any, then persists what it has not stored yet"""
+    await cancel_summary(session.state)
+    await flush_unpersisted(session.state)
+
+async def clear_session(session):
+    """Resets a session once its in-flight turn, if any, has finished"""
+    async with session.lock:
+        await flush_session(session)
+        session.clear()
+    socketio.emit('conversation_cleared', {}, to=session.token)
+
+async def retire_session(session):
+    """Persists what an expired session has not stored yet"""
+    async with session.lock:
+        await flush_session(session)
+
+async def flush_sessions():
+    await asyncio.gather(*(flush_session(session) for session in sessions))
+
+def flush_sessions_at_exit(timeout=10.0):
+    """Persists every live session's pending messages before memory and the runtime shut down"""
+    if not runtime.running:
+        return
     try:
-        return loop.run_until_complete(coro)
-    finally:
-        loop.close()
+        runtime.run(flush_sessions(), timeout)
+    except Exception as e:
+        logger.error("Failed to persist sessions at shutdown: %s", e)
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
+@app.route('/api/models')
+def models_status():
+    """Load state of the warmed Ollama models"""
+    return jsonify(model_warmer.status())
+
+@app.route('/metrics')
+def metrics():
+    """Node and turn latencies, flow hops and queue depths, for Prometheus to scrape"""
+    return Response(REGISTRY.render(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+@app.route('/api/prompt_cache')
+def prompt_cache_status():
+    """How much of each prompt Ollama served from its cached prefix"""
+    return jsonify(prompt_cache.report())
+
 @socketio.on('connect')
-def handle_connect():
-    """Send current state when client connects"""
+def handle_connect(auth=None):
+    """Attach the client to its session and send that session's state"""
+    token = auth.get('session') if isinstance(auth, dict) else None
+    session = sessions.connect(request.sid, token)
+    join_room(session.token)
+    emit('session', {'token': session.token})
     emit('state_update', {
-        'loop_count': conversation_state['loop_count'],
-        'history': conversation_state['history']
+        'loop_count': session.state['loop_count'],
+        'history': session.state['history']
     })
 
+@socketio.on('disconnect')
+def handle_disconnect():
+    sessions.disconnect(request.sid)
+
 @socketio.on('user_message')
 def handle_message(data):
     """Process user message through the orchestration"""
@@ -51,85 +168,55 @@ def handle_message(data):
     
     if not user_msg:
         return
-    
-    # Add user message to history
-    conversation_state['history'].append({
-        'role': 'user',
-        'content': user_msg,
-        'timestamp': datetime.now().isoformat()
-    })
-    
-    # Pass socketio instance to the orchestration
-    conversation_state['socketio'] = socketio
+
+    session = sessions.get(request.sid)
+    if session is None:
+        emit('error', {'message': 'Error: No session for this connection, please reload.'})
+        return
+    room = session.token
     
     # Emit user message immediately
     emit('new_message', {
         'role': 'user',
         'content': user_msg,
         'timestamp': datetime.now().isoformat()
-    }, broadcast=True)
+    }, to=room)
     
     # Emit processing status
     emit('status_update', {
         'status': 'processing',
         'message': 'Anemone is thinking...'
-    }, broadcast=True)
+    }, to=room)
     
     try:
-        # Run the async flow in background
-        def run_flow():
-            try:
-                # Run the async flow
-                run_async_in_thread(my_async_flow.run_async(conversation_state))
-                
-                # Memory retrieval is now emitted by RagNode.post_async
-                # Keep this as backup but don't clear retrieved_memory here
-                # (Agent.post_async will clear it after use)
-                pass
-                
-                # Emit final state update
-                socketio.emit('state_update', {
-                    'loop_count': conversation_state['loop_count'],
-                    'memory_action': conversation_state.get('memory_action', '')
-                })
-                
-                # Clear processing status
-                socketio.emit('status_update', {
-                    'status': 'idle',
-                    'message': ''
-                })
-                
-            except Exception as e:
-                print(f"Error in run_flow: {e}")
-                import traceback
-                traceback.print_exc()
-                socketio.emit('status_update', {
-                    'status': 'error',
-                    'message': f'Error: {str(e)}'
-                })
-        
-        # Submit to thread pool
-        executor.submit(run_flow)
+        # Hand the turn to the runtime loop, the handler returns straight away
+        runtime.submit(run_turn(session, user_msg))
         
     except Exception as e:
         emit('error', {
             'message': f'Error: {str(e)}'
-        }, broadcast=True)
+        }, to=room)
         emit('status_update', {
             'status': 'error',
             'message': 'An error occurred'
-        }, broadcast=True)
+        }, to=room)
 
 @socketio.on('clear_conversation')
 def handle_clear():
-    """Clear the conversation history"""
-    conversation_state['history'] = []
-    conversation_state['loop_count'] = 0
-    conversation_state['retrieved_memory'] = ''
-    
-    emit('conversation_cleared', {}, broadcast=True)
+    """Clear the conversation history of this session"""
+    session = sessions.get(request.sid)
+    if session is None:
+        return
+    runtime.submit(clear_session(session))
 
 if __name__ == '__main__':
+    configure_logging()
     print("🌊 Starting Anemone UI...")
     print("📍 Open http://localhost:5000 in your browser")
+    runtime.start()
+    runtime.submit(model_warmer.run())
+    # Build memory before serving, so no turn builds it on the runtime loop. Also, atexit
+    # runs the latest registration first: the flush runs before memory's own close
+    memory_client()
+    atexit.register(flush_sessions_at_exit)
     socketio.run(app, debug=True, port=5000, allow_unsafe_werkzeug=True)
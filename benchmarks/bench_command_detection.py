@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: per-chunk cost of deciding whether a streamed response is the
+retrieve_memory command, for a 2k-token plain answer.
+
+Compares the previous approach (re-cleaning the whole accumulated response on
+every chunk) with the incremental CommandDetector used by Agent.exec_async.
+Run from the project root: python benchmarks/bench_command_detection.py
+"""
+import sys
+import time
+sys.path.insert(0, '.')
+
+from nodes import Agent, CommandDetector
+
+TOKENS = 2000
+REPEATS = 5
+
+agent = Agent("bench-model", "bench prompt")
+words = "The quick brown fox jumps over the lazy dog, and then it naps.".split(" ")
+chunks = [(" " if i else "") + words[i % len(words)] for i in range(TOKENS)]
+
+def rescan_full_response():
+    """What Agent.exec_async used to do for every chunk."""
+    full_response = ""
+    for content in chunks:
+        full_response += content
+        if agent._clean_llm_response(full_response).lower().startswith("retrieve_memory"):
+            continue
+
+def incremental_detector():
+    parts = []
+    detector = CommandDetector()
+    for content in chunks:
+        parts.append(content)
+        if detector.feed(content):
+            continue
+    "".join(parts)
+
+def best_of(fn):
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+if __name__ == "__main__":
+    old = best_of(rescan_full_response)
+    new = best_of(incremental_detector)
+    print(f"Command detection over a {TOKENS}-token response (best of {REPEATS}):")
+    print(f"  re-clean full response : {old * 1e3:8.2f} ms total, {old / TOKENS * 1e6:7.2f} us/chunk")
+    print(f"  incremental detector   : {new * 1e3:8.2f} ms total, {new / TOKENS * 1e6:7.2f} us/chunk")
+    print(f"  speedup                : {old / new:8.1f}x")
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Benchmark: end-to-end turns through my_async_flow against a fake Ollama server.
+
+Starts benchmarks/fake_ollama.py in a subprocess (so its CPU is not counted),
+points the real Ollama client at it, and drives the orchestration flow
+through three kinds of turns:
+
+    plain     - one streamed Agent reply
+    retrieve  - Agent asks for memory, RagNode queries Chroma, Agent answers
+    persist   - a long paste crosses the context budget; the reply is timed,
+                the background summary and write-behind persist are timed apart
+
+Memory is a throwaway Chroma store with a deterministic hashing embedding, so
+no model download and no Ollama are needed. Reports p50/p95/p99 turn latency,
+time to first emitted chunk, CPU per streamed token and allocations per turn
+(from a separate tracemalloc pass), and writes everything as JSON for
+run-to-run comparison.
+
+Run from the project root:
+    python benchmarks/bench_flow.py
+    python benchmarks/bench_flow.py --turns 50 --output before.json
+    python benchmarks/bench_flow.py --compare before.json
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import platform
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+from datetime import datetime
+sys.path.insert(0, '.')
+
+RESULTS_DIR = os.path.join("benchmarks", "results")
+# pocketflow warns on every turn that ends without a next node
+warnings.filterwarnings("ignore", message="Flow ends")
+SEED_MEMORIES = [
+    "Bartholomew is the user's rubber ducky. He went missing last week.",
+    "The user's favourite colour is teal and they dislike olives.",
+    "The user is learning to play the cello and practises on Tuesdays.",
+    "The user's cat is called Miso and sleeps on the radiator.",
+]
+
+class HashingEmbedding:
+    """Deterministic bag-of-words embedding: shared words mean nearby vectors."""
+
+    def __init__(self, dimensions=64):
+        self.dimensions = dimensions
+
+    def __call__(self, texts):
+        vectors = []
+        for text in texts:
+            vector = [0.0] * self.dimensions
+            for word in re.findall(r"\w+", text.lower()):
+                vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % self.dimensions] += 1.0
+            norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+            vectors.append([v / norm for v in vector])
+        return vectors
+
+    def name(self):
+        return "bench-hashing"
+
+    def get_config(self):
+        return {"dimensions": self.dimensions}
+
+class Emitter:
+    """Stands in for the session's Socket.IO room, so the Agent takes its streaming path."""
+
+    def emit(self, event, data=None, to=None):
+        pass
+
+def start_fake_ollama(args):
+    process = subprocess.Popen(
+        [sys.executable, os.path.join("benchmarks", "fake_ollama.py"), "--port", "0",
+         "--ttft", str(args.ttft), "--tokens-per-second", str(args.tokens_per_second),
+         "--prompt-tokens-per-second", str(args.prompt_tokens_per_second)],
+        stdout=subprocess.PIPE, text=True)
+    url = process.stdout.readline().strip()
+    if not url:
+        process.kill()
+        raise RuntimeError("fake Ollama server did not start")
+    return process, url
+
+def percentile(values, q):
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)] if ordered else None
+
+def distribution(values):
+    values = [v for v in values if v is not None]
+    if not values:
+        return None
+    return {"p50": percentile(values, 50), "p95": percentile(values, 95), "p99": percentile(values, 99),
+            "mean": sum(values) / len(values), "max": max(values)}
+
+def user_message(kind, n):
+    if kind == "retrieve":
+        # A different query each turn, so the retrieval cache doesn't answer it
+        return f"Who is Bartholomew? Asking for the {n}th time."
+    if kind == "persist":
+        return f"Please remember this, part {n}: " + "I went to the market and bought apples. " * 400
+    return f"Tell me something nice about the number {n}."
+
+async def run_turn(flow, shared, text):
+    """One user turn; returns (wall seconds, cpu seconds)."""
+    shared["history"].append({"role": "user", "content": text, "timestamp": datetime.now().isoformat()})
+    wall, cpu = time.perf_counter(), time.process_time()
+    await flow.run_async(shared)
+    return time.perf_counter() - wall, time.process_time() - cpu
+
+async def settle(shared, memory):
+    """Waits for a turn's background work (summary, persist) and returns how long it took."""
+    start = time.perf_counter()
+    task = shared.get("summary_task")
+    if task is not None:
+        await task
+    await asyncio.to_thread(memory.writer.flush, 30)
+    return time.perf_counter() - start
+
+async def run_scenario(kind, turns, flow, memory, new_state, traced=False):
+    rows = []
+    shared = new_state()
+    for n in range(turns):
+        if kind == "persist" or shared["history_version"]:
+            # Each persist turn starts a new conversation, as does any turn after a compression
+            shared = new_state()
+        shared["socketio"] = Emitter()
+        if traced:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+        wall, cpu = await run_turn(flow, shared, user_message(kind, n))
+        row = {"wall": wall, "cpu": cpu, "metrics": shared["turn_metrics"]}
+        if traced:
+            current, peak = tracemalloc.get_traced_memory()
+            row.update(alloc_net=current - before, alloc_peak=peak - before)
+        row["background"] = await settle(shared, memory)
+        rows.append(row)
+    return rows
+
+def summarize(rows, traced_rows):
+    tokens = sum(row["metrics"]["eval_tokens"] for row in rows)
+    cpu = sum(row["cpu"] for row in rows)
+    summary = {
+        "turns": len(rows),
+        "latency_ms": distribution([row["wall"] * 1000 for row in rows]),
+        "first_chunk_ms": distribution([row["metrics"]["first_chunk_ms"] for row in rows]),
+        "hops": distribution([row["metrics"]["hops"] for row in rows]),
+        "background_ms": distribution([row["background"] * 1000 for row in rows]),
+        "tokens": tokens,
+        "cpu_ms_per_turn": cpu * 1000 / len(rows),
+        "cpu_us_per_token": cpu * 1e6 / tokens if tokens else None,
+    }
+    if traced_rows:
+        summary["alloc_kib_per_turn"] = {
+            "net": sum(row["alloc_net"] for row in traced_rows) / len(traced_rows) / 1024,
+            "peak": max(row["alloc_peak"] for row in traced_rows) / 1024,
+        }
+    return summary
+
+def report(results):
+    print(f"\n{'scenario':>9} {'turns':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'1st chunk':>10} "
+          f"{'cpu us/tok':>11} {'alloc KiB':>10}")
+    for kind, s in results["scenarios"].items():
+        cpu = f"{s['cpu_us_per_token']:.0f}" if s["cpu_us_per_token"] else "-"
+        alloc = f"{s['alloc_kib_per_turn']['peak']:.0f}" if "alloc_kib_per_turn" in s else "-"
+        first = f"{s['first_chunk_ms']['p50']:.0f}" if s["first_chunk_ms"] else "-"
+        print(f"{kind:>9} {s['turns']:6d} {s['latency_ms']['p50']:9.1f} {s['latency_ms']['p95']:9.1f} "
+              f"{s['latency_ms']['p99']:9.1f} {first:>10} {cpu:>11} {alloc:>10}")
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nChange vs {baseline_path} ({baseline['meta']['timestamp']}):")
+    for kind, s in results["scenarios"].items():
+        old = baseline["scenarios"].get(kind)
+        if old is None:
+            continue
+        changes = []
+        for label, new_value, old_value in [
+            ("p50", s["latency_ms"]["p50"], old["latency_ms"]["p50"]),
+            ("p95", s["latency_ms"]["p95"], old["latency_ms"]["p95"]),
+            ("p99", s["latency_ms"]["p99"], old["latency_ms"]["p99"]),
+            ("cpu/tok", s["cpu_us_per_token"], old["cpu_us_per_token"]),
+        ]:
+            if new_value and old_value:
+                changes.append(f"{label} {(new_value - old_value) / old_value * 100:+.1f}%")
+        print(f"  {kind:>9}: {', '.join(changes)}")
+
+async def main(args):
+    process, url = start_fake_ollama(args)
+    # Everything below talks to the fake server instead of a real Ollama
+    os.environ["OLLAMA_HOST"] = url
+    memory_dir = tempfile.mkdtemp(prefix="anemone-bench-")
+    import nodes
+    from memory import ChromaMemory
+    from orchestration import my_async_flow
+    from sessions import new_conversation_state
+    from utils import close_clients
+
+    nodes.memory_path = memory_dir
+    memory = ChromaMemory("persistent", memory_path=memory_dir, embedding_function=HashingEmbedding())
+    memory.save_memories(SEED_MEMORIES)
+    kinds = ["plain", "retrieve", "persist"]
+    results = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "turns": args.turns,
+            "traced_turns": args.traced_turns,
+            "fake_ollama": {"ttft": args.ttft, "tokens_per_second": args.tokens_per_second,
+                            "prompt_tokens_per_second": args.prompt_tokens_per_second},
+        },
+        "scenarios": {},
+    }
+    try:
+        # Warm-up: connections, Chroma collections, imports on first use
+        for kind in kinds:
+            await run_scenario(kind, 2, my_async_flow, memory, new_conversation_state)
+        for kind in kinds:
+            print(f"Running {args.turns} {kind} turns...")
+            rows = await run_scenario(kind, args.turns, my_async_flow, memory, new_conversation_state)
+            traced = []
+            if args.traced_turns:
+                tracemalloc.start()
+                try:
+                    traced = await run_scenario(kind, args.traced_turns, my_async_flow, memory,
+                                                new_conversation_state, traced=True)
+                finally:
+                    tracemalloc.stop()
+            results["scenarios"][kind] = summarize(rows, traced)
+    finally:
+        await close_clients()
+        memory.close()
+        process.terminate()
+        process.wait(10)
+        shutil.rmtree(memory_dir, ignore_errors=True)
+
+    report(results)
+    output = args.output or os.path.join(RESULTS_DIR, f"bench_flow-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nSaved {output}")
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-to-end flow benchmark against a fake Ollama server")
+    parser.add_argument("--turns", type=int, default=30, help="timed turns per scenario")
+    parser.add_argument("--traced-turns", type=int, default=5,
+                        help="extra turns per scenario run under tracemalloc for allocations (0: skip)")
+    parser.add_argument("--ttft", type=float, default=0.05, help="fake Ollama seconds to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=400.0, help="fake Ollama generation rate")
+    parser.add_argument("--prompt-tokens-per-second", type=float, default=20000.0,
+                        help="fake Ollama prompt evaluation rate, added to the time to first token")
+    parser.add_argument("--output", help=f"JSON results path (default: {RESULTS_DIR}/bench_flow-<time>.json)")
+    parser.add_argument("--compare", help="earlier JSON results to report changes against")
+    asyncio.run(main(parser.parse_args()))
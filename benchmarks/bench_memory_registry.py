@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: per-call overhead of getting a ChromaMemory and its collection,
+as RagNode does on every memory operation.
+
+Compares the registry + cached handle with calling get_or_create_collection
+each time. Uses a temporary persistent store, no embedding model required.
+Run from the project root: python benchmarks/bench_memory_registry.py
+"""
+import sys
+import tempfile
+import time
+sys.path.insert(0, '.')
+
+from memory import ChromaMemory
+
+CALLS = 2000
+
+def per_call(fn, calls=CALLS):
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - start) / calls
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp:
+        path = f"{tmp}/memory"
+        start = time.perf_counter()
+        memory = ChromaMemory("persistent", memory_path=path)
+        memory._collection("agent_memory")
+        first = time.perf_counter() - start
+
+        uncached = per_call(lambda: memory.client.get_or_create_collection("agent_memory"))
+        cached = per_call(lambda: ChromaMemory("persistent", memory_path=path)._collection("agent_memory"))
+
+    print(f"ChromaMemory + collection lookup ({CALLS} calls):")
+    print(f"  first access (client + collection)  : {first * 1e3:8.2f} ms")
+    print(f"  get_or_create_collection every call : {uncached * 1e6:8.1f} us/call")
+    print(f"  registry + cached handle            : {cached * 1e6:8.1f} us/call")
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Routing accuracy and latency of MemoryRouter across distance thresholds.
+
+Seeds an ephemeral ChromaDB with the memories from seed_memory.py, then scores
+a labeled set of user messages (needs memory / doesn't). Uses ChromaDB's
+default embedding model, which is downloaded on first use.
+Run from the project root: python benchmarks/bench_memory_router.py
+"""
+import statistics
+import sys
+import time
+sys.path.insert(0, '.')
+
+from memory import ChromaMemory
+from seed_memory import memories
+
+COLLECTION = "router_bench"
+THRESHOLDS = [0.6, 0.8, 1.0, 1.2, 1.4, 1.6]
+
+# (user message, whether the agent should retrieve memory)
+LABELED = [
+    ("Hello!", True),
+    ("hey there", True),
+    ("Who is Bartholomew?", True),
+    ("Have you seen a rubber duck?", True),
+    ("What is your function?", True),
+    ("What's your purpose in life?", True),
+    ("How are you feeling today?", True),
+    ("Why are you called Anemone?", True),
+    ("What can you do?", True),
+    ("Tell me a joke", True),
+    ("What's the secret squirrel password?", True),
+    ("What is 17 times 23?", False),
+    ("Translate 'good morning' into Spanish", False),
+    ("Write a haiku about rain", False),
+    ("What's the capital of Australia?", False),
+    ("Explain how a hash map works", False),
+    ("Convert 30 degrees Celsius to Fahrenheit", False),
+    ("Sort these numbers: 5, 2, 9, 1", False),
+    ("What year did World War II end?", False),
+    ("Give me a synonym for 'happy'", False),
+]
+
+def main():
+    client = ChromaMemory("ephemeral")
+    for memory_text in memories:
+        client.save_memory(memory_text, collection=COLLECTION)
+
+    distances, latencies = [], []
+    for query, _ in LABELED:
+        start = time.perf_counter()
+        _, scores = client.retrieve_memory_scored(query, collection=COLLECTION)
+        latencies.append((time.perf_counter() - start) * 1000)
+        distances.append(scores[0])
+
+    print(f"Routing {len(LABELED)} labeled queries against {len(memories)} memories")
+    print(f"  latency: p50 {statistics.median(latencies):.1f} ms, max {max(latencies):.1f} ms")
+    print(f"  {'threshold':>9}  {'accuracy':>8}  {'precision':>9}  {'recall':>6}")
+    for threshold in THRESHOLDS:
+        tp = fp = fn = tn = 0
+        for (_, wanted), distance in zip(LABELED, distances):
+            routed = distance <= threshold
+            tp += routed and wanted
+            fp += routed and not wanted
+            fn += wanted and not routed
+            tn += not routed and not wanted
+        accuracy = (tp + tn) / len(LABELED)
+        precision = tp / (tp + fp) if tp + fp else 0.0
+        recall = tp / (tp + fn) if tp + fn else 0.0
+        print(f"  {threshold:>9.2f}  {accuracy:>8.0%}  {precision:>9.0%}  {recall:>6.0%}")
+    print("\nPer-query distances:")
+    for (query, wanted), distance in zip(LABELED, distances):
+        print(f"  {distance:6.3f}  {'memory' if wanted else 'plain ':6}  {query}")
+
+if __name__ == "__main__":
+    main()
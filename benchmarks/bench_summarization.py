@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Benchmark: MemoryFilter summarization cost as a conversation grows, rolling
+vs whole-history prompts.
+
+Simulates a conversation that summarizes every SUMMARIZE_EVERY turns, with an
+occasional long paste, and measures the prompt size and latency of each
+summarization. The LLM is faked with a latency proportional to prompt tokens
+(PROMPT_TOKENS_PER_S), so no Ollama is required.
+Run from the project root: python benchmarks/bench_summarization.py
+"""
+import asyncio
+import sys
+import time
+sys.path.insert(0, '.')
+
+from unittest.mock import patch
+from nodes import MemoryFilter
+from utils import estimate_tokens
+
+TURNS = 200
+SUMMARIZE_EVERY = 5
+PROMPT_TOKENS_PER_S = 40000  # scaled down from real prompt eval rates to keep the run short
+SUMMARY_WORDS = 80
+
+calls = []
+
+async def fake_llm(messages, model):
+    tokens = sum(estimate_tokens(m["content"]) for m in messages)
+    calls.append(tokens)
+    await asyncio.sleep(tokens / PROMPT_TOKENS_PER_S)
+    return " ".join(["summary"] * SUMMARY_WORDS)
+
+def message(turn):
+    # Every 25th user message is a long paste
+    size = 6000 if turn % 25 == 0 else 200
+    return [{"role": "user", "content": f"turn {turn} " + "x" * size},
+            {"role": "agent", "content": f"reply {turn} " + "y" * 300}]
+
+async def run(node):
+    shared = {"history": []}
+    rows = []
+    for turn in range(1, TURNS + 1):
+        shared["history"].extend(message(turn))
+        if turn % SUMMARIZE_EVERY == 0:
+            calls.clear()
+            start = time.perf_counter()
+            await node._run_async(shared)
+            rows.append((turn, time.perf_counter() - start, sum(calls), max(calls), len(calls)))
+    return rows
+
+def report(name, rows):
+    print(f"\n{name}")
+    print(f"  {'turn':>5} {'latency ms':>11} {'prompt tok':>11} {'max/call':>9} {'calls':>6}")
+    for turn, latency, total, largest, count in rows:
+        if turn % 25 == 0 or turn == SUMMARIZE_EVERY:
+            print(f"  {turn:5d} {latency * 1e3:11.1f} {total:11d} {largest:9d} {count:6d}")
+    print(f"  max prompt per call: {max(r[3] for r in rows)} tokens")
+
+if __name__ == "__main__":
+    with patch('nodes.call_llm', side_effect=fake_llm):
+        rolling = asyncio.run(run(MemoryFilter("m", "Summarize.", background=False, max_prompt_tokens=2000)))
+        full = asyncio.run(run(MemoryFilter("m", "Summarize.", background=False, rolling=False)))
+    print(f"Summarization every {SUMMARIZE_EVERY} turns over {TURNS} turns "
+          f"(fake LLM at {PROMPT_TOKENS_PER_S} prompt tokens/s)")
+    report("Rolling (previous summary + new turns, 2000-token calls)", rolling)
+    report("Whole history in one call", full)
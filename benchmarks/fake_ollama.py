@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+A local stand-in for the Ollama HTTP API, for hermetic benchmarks.
+
+Speaks enough of the protocol for ollama.AsyncClient: POST /api/chat
+(streamed NDJSON or a single JSON object), POST /api/generate (model
+warm-up), GET /api/ps, GET /api/tags. Replies come from a script of rules
+matched against the last message; they are streamed one word per chunk at
+a configurable token rate after a configurable time to first token, and
+the final chunk carries Ollama's timing fields.
+
+Run standalone to point the app at it:
+    python benchmarks/fake_ollama.py --port 11435 --ttft 0.2 --tokens-per-second 30
+    OLLAMA_HOST=http://127.0.0.1:11435 python app.py
+
+Script file (JSON), first matching rule wins:
+    {"rules": [{"match": "Who is", "reply": "retrieve_memory", "model": "phi4-mini"}],
+     "default": "Sure, happy to help."}
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Replies that let the orchestration flow take each of its paths
+DEFAULT_SCRIPT = {
+    "rules": [
+        # Agent call that already has retrieved memory in its prompt
+        {"match": "<retrieved_memory>", "reply": "Bartholomew is your rubber ducky. He went missing last "
+                                                 "week and you have been looking for him ever since."},
+        {"match": "Who is Bartholomew", "reply": "retrieve_memory"},
+        # MemoryFilter's rolling summarization prompt
+        {"match": "Previous summary:", "reply": "The user shared a long document about their week and the "
+                                                "agent acknowledged it, promising to remember the details."},
+    ],
+    "default": "Sure! Here is a short answer with a handful of words, so the stream has some length to it "
+               "and the client has a few dozen chunks to clean, buffer and emit before the turn is over.",
+}
+
+def estimate_tokens(text):
+    return (len(text) + 3) // 4
+
+class FakeOllamaConfig:
+    def __init__(self, ttft=0.2, tokens_per_second=30.0, prompt_tokens_per_second=0.0, script=None):
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        # When set, prompt evaluation adds prompt_tokens / rate to the time to first token
+        self.prompt_tokens_per_second = prompt_tokens_per_second
+        self.script = script or DEFAULT_SCRIPT
+
+    def reply(self, model, messages):
+        last = messages[-1].get("content", "") if messages else ""
+        for rule in self.script.get("rules", []):
+            if rule.get("model") not in (None, model):
+                continue
+            if rule.get("match", "") in last:
+                return rule["reply"]
+        return self.script.get("default", "")
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like Ollama
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def config(self):
+        return self.server.config
+
+    def _send_json(self, body, status=200):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        if self.path == "/api/ps":
+            self._send_json({"models": [{"name": model, "model": model, "size": 0, "digest": "fake"}
+                                        for model in sorted(self.server.loaded)]})
+        elif self.path == "/api/tags":
+            self._send_json({"models": []})
+        else:
+            self._send_json({"error": f"unknown path {self.path}"}, 404)
+
+    def do_POST(self):
+        body = self._read_json()
+        if self.path == "/api/generate":
+            # Warm-up requests: load the model, generate nothing
+            self.server.loaded.add(body.get("model", ""))
+            self._send_json({"model": body.get("model"), "created_at": _now(), "response": "",
+                             "done": True, "load_duration": 0})
+        elif self.path == "/api/chat":
+            self._chat(body)
+        else:
+            self._send_json({"error": f"unknown path {self.path}"}, 404)
+
+    def _chat(self, body):
+        model, messages = body.get("model", ""), body.get("messages", [])
+        self.server.count_request()
+        self.server.loaded.add(model)
+        started = time.perf_counter()
+        reply = self.config.reply(model, messages)
+        words = [word + " " for word in reply.split(" ")] if reply else []
+        prompt_tokens = sum(estimate_tokens(m.get("content", "")) for m in messages)
+        prompt_seconds = prompt_tokens / self.config.prompt_tokens_per_second if self.config.prompt_tokens_per_second else 0.0
+        interval = 1 / self.config.tokens_per_second if self.config.tokens_per_second else 0.0
+        time.sleep(self.config.ttft + prompt_seconds)
+        generating = time.perf_counter()
+
+        def final():
+            now = time.perf_counter()
+            return {"model": model, "created_at": _now(), "message": {"role": "assistant", "content": ""},
+                    "done": True, "done_reason": "stop",
+                    "total_duration": int((now - started) * 1e9), "load_duration": 0,
+                    "prompt_eval_count": prompt_tokens,
+                    "prompt_eval_duration": int((generating - started) * 1e9),
+                    "eval_count": len(words), "eval_duration": int((now - generating) * 1e9)}
+
+        if body.get("stream", True) is False:
+            time.sleep(interval * len(words))
+            self._send_json(dict(final(), message={"role": "assistant", "content": "".join(words).rstrip()}))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for n, word in enumerate(words):
+                if n:
+                    time.sleep(interval)
+                self._write_chunk({"model": model, "created_at": _now(),
+                                   "message": {"role": "assistant", "content": word}, "done": False})
+            self._write_chunk(final())
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client closed the stream early, as Ollama sees it
+            self.close_connection = True
+
+    def _write_chunk(self, body):
+        line = json.dumps(body).encode("utf-8") + b"\n"
+        self.wfile.write(f"{len(line):x}\r\n".encode("ascii") + line + b"\r\n")
+        self.wfile.flush()
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        super().__init__((host, port), FakeOllamaHandler)
+        self.config = config or FakeOllamaConfig()
+        self.loaded = set()
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def start(self):
+        """Serves on a background thread; returns self."""
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435, help="0 picks a free port")
+    parser.add_argument("--ttft", type=float, default=0.2, help="seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=30.0)
+    parser.add_argument("--prompt-tokens-per-second", type=float, default=0.0,
+                        help="prompt evaluation rate added to the TTFT (0: off)")
+    parser.add_argument("--script", help="JSON file of reply rules")
+    args = parser.parse_args()
+    script = None
+    if args.script:
+        with open(args.script) as f:
+            script = json.load(f)
+    server = FakeOllamaServer(FakeOllamaConfig(args.ttft, args.tokens_per_second,
+                                               args.prompt_tokens_per_second, script), args.host, args.port)
+    # First line is the address, for scripts that start this with --port 0
+    print(server.url, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    sys.exit(main())
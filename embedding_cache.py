@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import numpy as np
+
+# Where ChromaMemory keeps embeddings when it has no memory_path to put them next to
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", "./embedding_cache.sqlite3")
+
+def model_id(embedding_function):
+    """Identifies the model behind an embedding function, so vectors from different models never mix."""
+    try:
+        name = embedding_function.name()
+        config = embedding_function.get_config()
+    except Exception:
+        name, config = NotImplemented, None
+    if not isinstance(name, str):
+        name = type(embedding_function).__name__
+    return f"{name}:{json.dumps(config, sort_keys=True, default=str)}"
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    """
+    On-disk store of embeddings keyed by (embedding model id, sha256 of the text).
+    Backed by SQLite so the app and seed_memory.py can share one file.
+    """
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Used from the memory worker threads, so one connection behind a lock
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            if path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " model TEXT NOT NULL, hash TEXT NOT NULL, vector BLOB NOT NULL,"
+                " PRIMARY KEY (model, hash))"
+            )
+
+    def get_many(self, model, hashes):
+        """Returns {hash: vector} for the hashes that are cached."""
+        found = {}
+        unique = list(dict.fromkeys(hashes))
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(unique), 500):
+                batch = unique[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({','.join('?' * len(batch))})",
+                    [model, *batch],
+                )
+                for digest, blob in rows:
+                    found[digest] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, model, vectors):
+        """Stores {hash: vector}."""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, vector) VALUES (?, ?, ?)",
+                [(model, digest, np.asarray(vector, dtype=np.float32).tobytes()) for digest, vector in vectors.items()],
+            )
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self),
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class CachedEmbedder:
+    """Embeds texts through `embedding_function`, computing only the ones `cache` hasn't seen."""
+
+    def __init__(self, embedding_function, cache):
+        self.embedding_function = embedding_function
+        self.cache = cache
+        self.model = model_id(embedding_function)
+        self._lock = threading.Lock()
+
+    def __call__(self, texts):
+        hashes = [content_hash(text) for text in texts]
+        vectors = self.cache.get_many(self.model, hashes)
+        missing = {}
+        for text, digest in zip(texts, hashes):
+            if digest not in vectors:
+                missing.setdefault(digest, text)  # duplicates in one batch are embedded once
+        with self._lock:
+            self.cache.hits += len(texts) - len(missing)
+            self.cache.misses += len(missing)
+        if missing:
+            computed = dict(zip(missing, self.embedding_function(list(missing.values()))))
+            self.cache.put_many(self.model, computed)
+            vectors.update(computed)
+        return [np.asarray(vectors[digest], dtype=np.float32) for digest in hashes]
+
+    def stats(self):
+        return self.cache.stats()
@@ -0,0 +1,118 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+# e.g. DEBUG to see per-turn and (sampled) per-chunk detail
+LOG_LEVEL = os.environ.get("ANEMONE_LOG_LEVEL", "INFO")
+# "text" for people, "json" for one structured object per line
+LOG_FORMAT = os.environ.get("ANEMONE_LOG_FORMAT", "text")
+
+# Attributes every LogRecord has; anything else on a record came from `extra=`
+_RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message and any `extra=` fields."""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in _RECORD_FIELDS})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class TextFormatter(logging.Formatter):
+    """Plain one-line records, noting how many similar ones RateLimitFilter dropped before this one."""
+
+    def __init__(self, fmt="%(asctime)s %(levelname)-7s %(name)s: %(message)s", datefmt="%H:%M:%S"):
+        super().__init__(fmt, datefmt)
+
+    def formatMessage(self, record):
+        line = super().formatMessage(record)
+        dropped = getattr(record, "dropped", 0)
+        return f"{line} ({dropped} similar dropped)" if dropped else line
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets through at most `burst` DEBUG records per message template every
+    `interval` seconds; the next one let through says how many were dropped.
+    Records above DEBUG always pass.
+    """
+
+    def __init__(self, burst=20, interval=1.0):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self._windows = {}  # (logger, template) -> [window start, passed, dropped]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.setdefault((record.name, record.msg), [now, 0, 0])
+            if now - window[0] >= self.interval:
+                window[0], window[1] = now, 0
+            if window[1] >= self.burst:
+                window[2] += 1
+                return False
+            window[1] += 1
+            dropped, window[2] = window[2], 0
+        if dropped:
+            record.dropped = dropped
+        return True
+
+class Sampler:
+    """
+    Logs every `every`-th call, for per-chunk debug output on the hot path.
+    Callers check `enabled` once per stream so a disabled level costs one
+    boolean test per chunk:
+
+        sample = Sampler(logger)
+        debug = sample.enabled
+        for chunk in stream:
+            if debug:
+                sample.debug("chunk %r", chunk)
+    """
+
+    def __init__(self, logger, every=50):
+        self.logger = logger
+        self.every = every
+        self._count = 0
+
+    @property
+    def enabled(self):
+        return self.logger.isEnabledFor(logging.DEBUG)
+
+    def debug(self, msg, *args):
+        self._count += 1
+        if self._count % self.every == 1 or self.every == 1:
+            self.logger.debug(msg, *args, extra={"sampled": self.every})
+
+_configured = False
+
+def configure_logging(level=LOG_LEVEL, fmt=LOG_FORMAT, stream=None):
+    """Sets up the root logger for the app and CLI. Calling it again has no effect."""
+    global _configured
+    if _configured:
+        return
+    handler = logging.StreamHandler(stream or sys.stderr)
+    if fmt == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(TextFormatter())
+    handler.addFilter(RateLimitFilter())
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+    # httpx logs every Ollama request at INFO
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    _configured = True
@@ -1,18 +1,25 @@
 import asyncio
 from orchestration import my_async_flow
+from logs import configure_logging
+from utils import close_clients
 
 async def main():
     shared = {"history": []}
-    while True:
-        # User input
-        user_msg = input("You: ")
-        shared["history"].append({"role": "user", "content": user_msg})
-    
-        # Agent responds once
-        result = await my_async_flow.run_async(shared)
-    
-        # Agent's response is already in shared["history"]
-        print(f"Agent: {shared['history'][-1]['content']}")
+    try:
+        while True:
+            # User input
+            # Off the loop, so background work (summaries) runs while the user types
+            user_msg = await asyncio.to_thread(input, "You: ")
+            shared["history"].append({"role": "user", "content": user_msg})
+        
+            # Agent responds once
+            result = await my_async_flow.run_async(shared)
+        
+            # Agent's response is already in shared["history"]
+            print(f"Agent: {shared['history'][-1]['content']}")
+    finally:
+        await close_clients()
 
 if __name__ == "__main__":
+    configure_logging()
     asyncio.run(main())
@@ -1,31 +1,530 @@
 import asyncio
+import atexit
+import functools
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from os import wait
 from uuid import uuid4
 import chromadb 
+from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+from embedding_cache import EMBEDDING_CACHE_PATH, CachedEmbedder, EmbeddingCache
+
+logger = logging.getLogger(__name__)
+
+# Write-behind journal for clients without a memory_path ("http")
+MEMORY_JOURNAL_PATH = os.environ.get("MEMORY_JOURNAL_PATH", "./memory_journal.jsonl")
+
+class RetrievalCache:
+    """
+    LRU cache of query results with a TTL. Each collection has a version counter
+    that writes bump; entries stored under an older version are never served.
+    """
+
+    def __init__(self, max_entries=256, ttl=300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (collection version, expiry, result)
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(query):
+        """Case, spacing and trailing punctuation don't change what a user is asking for."""
+        return " ".join(query.lower().split()).rstrip("?!. ")
+
+    def version(self, collection):
+        with self._lock:
+            return self._versions.get(collection, 0)
+
+    def bump(self, collection):
+        """Invalidates every cached result for `collection`. Call after writing to it."""
+        with self._lock:
+            self._versions[collection] = self._versions.get(collection, 0) + 1
+
+    def get(self, collection, query, n_results, kind):
+        key = (collection, self.normalize(query), n_results, kind)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                version, expires, result = entry
+                if version == self._versions.get(collection, 0) and expires > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return result
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, collection, query, n_results, kind, result, version):
+        """Stores `result`, computed while the collection was at `version` (read it before querying)."""
+        key = (collection, self.normalize(query), n_results, kind)
+        with self._lock:
+            self._entries[key] = (version, time.monotonic() + self.ttl, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self._entries),
+            }
+
+class WriteBehindQueue:
+    """
+    Takes memory writes off the caller's path: writes are queued and upserted from
+    a background thread, batched across sessions, when `batch_size` documents are
+    waiting or `flush_interval` seconds after the oldest one. At most `max_pending`
+    writes wait at once; enqueueing beyond that blocks until the writer catches up.
+
+    With a `journal_path`, every write is appended to the journal before it is
+    queued. Stored writes are dropped from it as batches complete: the journal is
+    rewritten with only the unstored ones once it is mostly stale, and cleared
+    when nothing is left. Writes left in it by a crash are replayed on the next
+    start, however many there are (ids make them idempotent).
+    """
+
+    def __init__(self, write, journal_path=None, max_pending=1024, batch_size=64, flush_interval=1.0,
+                 retry_interval=5.0):
+        # write(collection, documents, metadatas, ids) stores one batch, raising on failure
+        self._write = write
+        self.journal_path = journal_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_interval = retry_interval
+        self.written = 0
+        self.batches = 0
+        self.max_pending = max_pending
+        # Unbounded: put() enforces max_pending, so replaying a long journal never blocks
+        self._queue = queue.Queue()
+        # seq -> write, for writes journaled or queued but not yet stored
+        self._unstored = {}
+        self._seq = 0
+        # Records in the journal file, stored or not
+        self._journal_records = 0
+        self._idle = threading.Condition()
+        self._journal = None
+        self._stopping = threading.Event()
+        self._thread = None
+        if journal_path:
+            replay = self._read_journal()
+            self._journal = open(journal_path, "a", encoding="utf-8")
+            if replay:
+                logger.info("Replaying %d journaled writes", len(replay))
+                with self._idle:
+                    for record in replay:
+                        self._track(record)
+                        self._queue.put(record)
+                    self._journal_records = len(replay)
+                self._start()
+
+    @property
+    def _pending(self):
+        return len(self._unstored)
+
+    def _track(self, record):
+        record["seq"] = self._seq
+        self._seq += 1
+        self._unstored[record["seq"]] = record
+
+    def _read_journal(self):
+        records = []
+        try:
+            with open(self.journal_path, encoding="utf-8") as journal:
+                for line in journal:
+                    try:
+                        records.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        # Torn last line from a crash mid-append
+                        continue
+        except FileNotFoundError:
+            pass
+        return records
+
+    def put(self, documents, metadatas=None, ids=None, collection="agent_memory"):
+        """Queues a write of `documents`. Returns once it is journaled, not stored."""
+        if not documents:
+            return
+        if self._stopping.is_set():
+            raise RuntimeError("WriteBehindQueue is closed")
+        record = {
+            "collection": collection,
+            "documents": list(documents),
+            "metadatas": list(metadatas) if metadatas is not None else None,
+            # Fixed now, so a replayed write replaces itself instead of duplicating
+            "ids": list(ids) if ids is not None else [str(uuid4()) for _ in documents],
+        }
+        self._start()
+        with self._idle:
+            # Room is made by the writer taking records off the queue
+            self._idle.wait_for(lambda: self._queue.qsize() < self.max_pending or self._stopping.is_set())
+            if self._stopping.is_set():
+                raise RuntimeError("WriteBehindQueue is closed")
+            self._track(record)
+            if self._journal is not None:
+                self._journal.write(json.dumps(record) + "\n")
+                self._journal.flush()
+                os.fsync(self._journal.fileno())
+                self._journal_records += 1
+            self._queue.put(record)
+
+    async def aput(self, documents, metadatas=None, ids=None, collection="agent_memory"):
+        """put() for event loops: journaling fsyncs and a full queue waits, so it always runs off the loop."""
+        await asyncio.get_running_loop().run_in_executor(None, functools.partial(
+            self.put, documents, metadatas, ids, collection))
+
+    def _start(self):
+        with self._idle:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="memory-write-behind", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch:
+                self._store(batch)
+            elif self._stopping.is_set():
+                return
+
+    def _next_batch(self):
+        """Blocks for the first record, then collects more until the batch is full or due."""
+        try:
+            batch = [self._queue.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        size = len(batch[0]["documents"])
+        while size < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0 or self._stopping.is_set():
+                # Shutting down: take what is there without waiting
+                timeout = 0
+            try:
+                record = self._queue.get(timeout=timeout) if timeout else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(record)
+            size += len(record["documents"])
+        with self._idle:
+            # Wake put()s waiting for room in the queue
+            self._idle.notify_all()
+        return batch
+
+    def _store(self, batch):
+        by_collection = {}
+        for record in batch:
+            # Later writes of the same id win; Chroma rejects repeated ids in one upsert
+            entries = by_collection.setdefault(record["collection"], {})
+            metadatas = record["metadatas"] or [None] * len(record["documents"])
+            for document, metadata, id_ in zip(record["documents"], metadatas, record["ids"]):
+                entries.pop(id_, None)
+                entries[id_] = (document, metadata)
+        for collection, entries in by_collection.items():
+            ids = list(entries)
+            documents = [document for document, _ in entries.values()]
+            metadatas = [metadata for _, metadata in entries.values()]
+            while True:
+                try:
+                    self._write(collection, documents, metadatas if any(metadatas) else None, ids)
+                    break
+                except Exception as e:
+                    if self._stopping.is_set():
+                        # Leave the journal in place, these are replayed on the next start
+                        logger.error("Giving up on %d writes at shutdown: %s", len(ids), e)
+                        return
+                    logger.warning("Write failed, retrying in %ss: %s", self.retry_interval, e)
+                    time.sleep(self.retry_interval)
+        with self._idle:
+            self.written += sum(len(record["documents"]) for record in batch)
+            self.batches += 1
+            for record in batch:
+                self._unstored.pop(record["seq"], None)
+            if self._journal is not None:
+                if not self._unstored:
+                    # Everything journaled is stored
+                    self._journal.truncate(0)
+                    self._journal_records = 0
+                elif self._journal_records > 2 * len(self._unstored) + self.batch_size:
+                    self._compact_journal()
+            self._idle.notify_all()
+
+    def _compact_journal(self):
+        """Rewrites the journal with only the unstored writes. Called holding self._idle."""
+        compacted = f"{self.journal_path}.tmp"
+        with open(compacted, "w", encoding="utf-8") as journal:
+            for record in self._unstored.values():
+                journal.write(json.dumps(record) + "\n")
+            journal.flush()
+            os.fsync(journal.fileno())
+        self._journal.close()
+        os.replace(compacted, self.journal_path)
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+        self._journal_records = len(self._unstored)
+
+    def flush(self, timeout=None):
+        """Waits until every queued write is stored. Returns False on timeout."""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout)
+
+    def __len__(self):
+        return self._pending
+
+    def stats(self):
+        return {"pending": self._pending, "written": self.written, "batches": self.batches}
+
+    def close(self, timeout=30.0):
+        """Drains the queue and stops the writer thread."""
+        self._stopping.set()
+        with self._idle:
+            self._idle.notify_all()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        with self._idle:
+            if self._journal is not None and not self._journal.closed:
+                self._journal.close()
 
 class ChromaMemory:
-    _instance = None
+    """
+    ChromaDB wrapper shared per client configuration: constructing it again with
+    the same client_type and connection arguments returns the existing instance,
+    a different memory_path or host gets its own.
+
+    The other options apply when the instance is first built. Later calls may
+    leave them out; passing a value that differs from the registered instance's
+    raises ValueError rather than being silently ignored.
+    """
+    _instances = {}
+    _instances_lock = threading.Lock()
+    DEFAULT_OPTIONS = {"workers": 4, "cache_size": 256, "cache_ttl": 300.0,
+                       "embedding_function": None, "embedding_cache_path": None}
+
+    def __new__(cls, client_type, workers=None, cache_size=None, cache_ttl=None,
+                embedding_function=None, embedding_cache_path=None, **kwargs):
+        key = cls._registry_key(client_type, **kwargs)
+        given = {name: value for name, value in [
+            ("workers", workers), ("cache_size", cache_size), ("cache_ttl", cache_ttl),
+            ("embedding_function", embedding_function), ("embedding_cache_path", embedding_cache_path),
+        ] if value is not None}
+        with cls._instances_lock:
+            instance = cls._instances.get(key)
+            if instance is None:
+                # Set up under the lock so concurrent first calls can't build two clients
+                instance = super().__new__(cls)
+                instance._options = dict(cls.DEFAULT_OPTIONS, **given)
+                instance._setup(client_type, **instance._options, **kwargs)
+                cls._instances[key] = instance
+        conflicts = [f"{name}={value!r} (registered: {instance._options[name]!r})"
+                     for name, value in given.items() if value != instance._options[name]]
+        if conflicts:
+            raise ValueError(f"ChromaMemory {key} already exists with different options: {', '.join(conflicts)}")
+        return instance
+
+    def __init__(self, client_type, workers=None, cache_size=None, cache_ttl=None,
+                 embedding_function=None, embedding_cache_path=None, **kwargs):
+        # Everything happens once per configuration in __new__
+        pass
 
-    def __new__(cls, *args, **kwargs):
-        if cls._instance is None:
-            cls._instance = super().__new__(cls)
-        return cls._instance
+    @staticmethod
+    def _registry_key(client_type, **kwargs):
+        if "memory_path" in kwargs:
+            kwargs["memory_path"] = os.path.abspath(kwargs["memory_path"])
+        if "port" in kwargs:
+            kwargs["port"] = int(kwargs["port"])
+        return (client_type, tuple(sorted(kwargs.items())))
 
-    def __init__(self, client_type, **kwargs):
-        if not hasattr(self, "_initialized"):
-            self.client = self._client_maker(client_type, **kwargs)
-            self._initialized = True
+    def _setup(self, client_type, workers, cache_size, cache_ttl,
+               embedding_function, embedding_cache_path, **kwargs):
+        self.client_type = client_type
+        self._client_kwargs = kwargs
+        self.client = self._client_maker(client_type, **kwargs)
+        # Local clients embed and search on these threads so event loops never block on them
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="chroma-memory")
+        # Collection handles, fetched once and reused by every call
+        self._collections = {}
+        self._collections_lock = threading.Lock()
+        # Repeated questions skip the embedding pass and vector search
+        self.cache = RetrievalCache(cache_size, cache_ttl)
+        # Texts are embedded here, once per model, and the vectors handed to Chroma
+        if embedding_cache_path is None:
+            embedding_cache_path = self.default_embedding_cache_path(client_type, **kwargs)
+        self.embedder = CachedEmbedder(embedding_function or DefaultEmbeddingFunction(), EmbeddingCache(embedding_cache_path))
+        # event loop -> chromadb.AsyncHttpClient, and (loop, name) -> its collections ("http" only)
+        self._async_clients = {}
+        self._async_collections = {}
+        # Writes that don't need to finish before the caller moves on
+        self.writer = WriteBehindQueue(self._write_batch, self.default_journal_path(client_type, **kwargs))
+        atexit.register(self.close)
+
+    @staticmethod
+    def default_embedding_cache_path(client_type, **kwargs):
+        """Next to a persistent store, in memory for an ephemeral one, EMBEDDING_CACHE_PATH otherwise."""
+        if client_type == "persistent" and "memory_path" in kwargs:
+            return os.path.join(kwargs["memory_path"], "embedding_cache.sqlite3")
+        if client_type == "ephemeral":
+            return ":memory:"
+        return EMBEDDING_CACHE_PATH
+
+    @staticmethod
+    def default_journal_path(client_type, **kwargs):
+        """Next to a persistent store, none for an ephemeral one, MEMORY_JOURNAL_PATH otherwise."""
+        if client_type == "persistent" and "memory_path" in kwargs:
+            os.makedirs(kwargs["memory_path"], exist_ok=True)
+            return os.path.join(kwargs["memory_path"], "write_behind.jsonl")
+        if client_type == "ephemeral":
+            return None
+        return MEMORY_JOURNAL_PATH
+
+    def queue_depths(self):
+        """Work waiting for the worker threads, and writes waiting to be stored."""
+        return {"executor": self._executor._work_queue.qsize(), "write_behind": len(self.writer)}
+
+    def close(self):
+        """Stores every queued write, then releases the worker threads."""
+        self.writer.close()
+        self._executor.shutdown(wait=True)
+
+    def _collection(self, name):
+        collection = self._collections.get(name)
+        if collection is None:
+            with self._collections_lock:
+                collection = self._collections.get(name)
+                if collection is None:
+                    collection = self.client.get_or_create_collection(name)
+                    self._collections[name] = collection
+        return collection
 
     def save_memory(self, memory, collection="agent_memory"):
-        collection = self.client.get_or_create_collection(collection)
-        collection.upsert(documents=[memory], ids=[str(uuid4())])
+        self.save_memories([memory], collection=collection)
+
+    def save_memories(self, memories, metadatas=None, ids=None, collection="agent_memory"):
+        """Upserts several documents in one batch. Without `ids`, each gets a fresh uuid4."""
+        if not memories:
+            return
+        if ids is None:
+            ids = [str(uuid4()) for _ in memories]
+        self._collection(collection).upsert(documents=memories, embeddings=self.embedder(memories),
+                                            metadatas=metadatas, ids=ids)
+        self.cache.bump(collection)
 
     def retrieve_memory(self, query, collection="agent_memory"):
-        collection = self.client.get_or_create_collection(collection)
-        retrieved = collection.query(query_texts=[query], n_results=1)["documents"]
-        print(retrieved)
+        retrieved = self.cache.get(collection, query, 1, "documents")
+        if retrieved is None:
+            retrieved = self._query_documents(query, collection)
         return query, retrieved
 
+    def retrieve_memory_scored(self, query, n_results=1, collection="agent_memory"):
+        """Like retrieve_memory, but also returns each document's distance to the query (smaller is closer)."""
+        scored = self.cache.get(collection, query, n_results, "scored")
+        if scored is None:
+            scored = self._query_scored(query, n_results, collection)
+        return scored
+
+    def _query_documents(self, query, collection):
+        version = self.cache.version(collection)
+        embeddings = self.embedder([query])
+        retrieved = self._collection(collection).query(query_embeddings=embeddings, n_results=1)["documents"]
+        self.cache.put(collection, query, 1, "documents", retrieved, version)
+        return retrieved
+
+    def _query_scored(self, query, n_results, collection):
+        version = self.cache.version(collection)
+        embeddings = self.embedder([query])
+        result = self._collection(collection).query(query_embeddings=embeddings, n_results=n_results, include=["documents", "distances"])
+        scored = (result["documents"][0], result["distances"][0])
+        self.cache.put(collection, query, n_results, "scored", scored, version)
+        return scored
+
+    # Async API: same results as the sync methods, without blocking the running event loop.
+    # Cache hits are answered right here, without a trip to the worker pool.
+
+    def _write_batch(self, collection, documents, metadatas, ids):
+        self.save_memories(documents, metadatas=metadatas, ids=ids, collection=collection)
+
+    async def aenqueue_memories(self, memories, metadatas=None, ids=None, collection="agent_memory"):
+        """
+        Write-behind version of asave_memories: returns once the write is queued (and
+        journaled), and the memories become retrievable when the next batch is stored.
+        """
+        await self.writer.aput(memories, metadatas, ids, collection)
+
+    async def asave_memory(self, memory, collection="agent_memory"):
+        await self.asave_memories([memory], collection=collection)
+
+    async def asave_memories(self, memories, metadatas=None, ids=None, collection="agent_memory"):
+        if not memories:
+            return
+        if self.client_type == "http":
+            if ids is None:
+                ids = [str(uuid4()) for _ in memories]
+            handle = await self._async_collection(collection)
+            embeddings = await self._offload(self.embedder, memories)
+            await handle.upsert(documents=memories, embeddings=embeddings, metadatas=metadatas, ids=ids)
+            self.cache.bump(collection)
+        else:
+            await self._offload(self.save_memories, memories, metadatas, ids, collection)
+
+    async def aretrieve_memory(self, query, collection="agent_memory"):
+        retrieved = self.cache.get(collection, query, 1, "documents")
+        if retrieved is not None:
+            return query, retrieved
+        if self.client_type == "http":
+            version = self.cache.version(collection)
+            handle = await self._async_collection(collection)
+            embeddings = await self._offload(self.embedder, [query])
+            retrieved = (await handle.query(query_embeddings=embeddings, n_results=1))["documents"]
+            self.cache.put(collection, query, 1, "documents", retrieved, version)
+            return query, retrieved
+        return query, await self._offload(self._query_documents, query, collection)
+
+    async def aretrieve_memory_scored(self, query, n_results=1, collection="agent_memory"):
+        cached = self.cache.get(collection, query, n_results, "scored")
+        if cached is not None:
+            return cached
+        if self.client_type == "http":
+            version = self.cache.version(collection)
+            handle = await self._async_collection(collection)
+            embeddings = await self._offload(self.embedder, [query])
+            result = await handle.query(query_embeddings=embeddings, n_results=n_results, include=["documents", "distances"])
+            scored = (result["documents"][0], result["distances"][0])
+            self.cache.put(collection, query, n_results, "scored", scored, version)
+            return scored
+        return await self._offload(self._query_scored, query, n_results, collection)
+
+    async def _offload(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args))
+
+    async def _async_collection(self, name):
+        loop = asyncio.get_running_loop()
+        collection = self._async_collections.get((loop, name))
+        if collection is not None:
+            return collection
+        client = self._async_clients.get(loop)
+        if client is None:
+            # The async HTTP client's connections are bound to the loop that made it
+            for stale in [l for l in self._async_clients if l.is_closed()]:
+                del self._async_clients[stale]
+            for stale in [k for k in self._async_collections if k[0].is_closed()]:
+                del self._async_collections[stale]
+            client = await chromadb.AsyncHttpClient(host=self._client_kwargs["host"], port=int(self._client_kwargs["port"]))
+            client = self._async_clients.setdefault(loop, client)
+        collection = await client.get_or_create_collection(name)
+        return self._async_collections.setdefault((loop, name), collection)
+
     def _client_maker(self, client_type = "persistent", **kwargs):
         match client_type:
             case "persistent":
@@ -0,0 +1,324 @@
+import contextvars
+import functools
+import logging
+import math
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Seconds; LLM calls take far longer than the default Prometheus buckets reach
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+HOP_BUCKETS = (1, 2, 3, 4, 5, 6, 8, 10, 15, 20)
+TOKEN_RATE_BUCKETS = (1, 2, 5, 10, 15, 20, 30, 50, 75, 100, 150, 200, 300)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in (*zip(names, values), *extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in sorted(self._values.items())]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for name, key, value, *extra in self._samples():
+            lines.append(f"{name}{_labels(self.labelnames, key, *extra)} {_number(value)}")
+        return lines
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+class Gauge(_Metric):
+    """A value set directly, or read from `callback` (returning {label values: value}) at scrape time."""
+    kind = "gauge"
+
+    def __init__(self, name, help, labelnames=(), callback=None):
+        super().__init__(name, help, labelnames)
+        self.callback = callback
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def _samples(self):
+        if self.callback is None:
+            return super()._samples()
+        try:
+            values = self.callback()
+        except Exception as e:
+            logger.warning("Gauge %s callback failed: %s", self.name, e)
+            return []
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [(self.name, key if isinstance(key, tuple) else (key,), value)
+                for key, value in sorted(values.items())]
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def snapshot(self, **labels):
+        """{"buckets": {upper bound: cumulative count}, "sum": ..., "count": ...} for one label set."""
+        with self._lock:
+            counts, total = self._values.get(self._key(labels), ([0] * len(self.buckets), 0.0))
+            return {"buckets": dict(zip(self.buckets, counts)), "sum": total, "count": counts[-1]}
+
+    def count(self, **labels):
+        return self.snapshot(**labels)["count"]
+
+    def _samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, counts):
+                    samples.append((f"{self.name}_bucket", key, count, (("le", _number(bound)),)))
+                samples.append((f"{self.name}_sum", key, total))
+                samples.append((f"{self.name}_count", key, counts[-1]))
+        return samples
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _add(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                # Re-registering (e.g. a module imported twice) hands back the original
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=(), callback=None):
+        return self._add(Gauge(name, help, labelnames, callback))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+node_seconds = REGISTRY.histogram(
+    "anemone_node_seconds", "Time spent in each node phase", ("node", "phase"))
+node_errors = REGISTRY.counter(
+    "anemone_node_errors_total", "Node phases that raised", ("node", "phase"))
+turn_seconds = REGISTRY.histogram(
+    "anemone_turn_seconds", "Time from a flow starting until it returns the reply")
+turn_hops = REGISTRY.histogram(
+    "anemone_turn_hops", "Nodes a flow ran per turn", buckets=HOP_BUCKETS)
+turns = REGISTRY.counter(
+    "anemone_turns_total", "Flow runs, by outcome", ("outcome",))
+turn_first_chunk_seconds = REGISTRY.histogram(
+    "anemone_turn_first_chunk_seconds", "Time from a flow starting until the first reply chunk is emitted")
+llm_ttft_seconds = REGISTRY.histogram(
+    "anemone_llm_ttft_seconds", "Time from sending a streaming request to its first chunk", ("model",))
+llm_prompt_eval_seconds = REGISTRY.histogram(
+    "anemone_llm_prompt_eval_seconds", "Ollama prompt evaluation time per request", ("model",))
+llm_load_seconds = REGISTRY.histogram(
+    "anemone_llm_load_seconds", "Ollama model load time per request", ("model",))
+llm_tokens_per_second = REGISTRY.histogram(
+    "anemone_llm_tokens_per_second", "Ollama generation rate per request", ("model",),
+    buckets=TOKEN_RATE_BUCKETS)
+llm_prompt_tokens = REGISTRY.counter(
+    "anemone_llm_prompt_tokens_total", "Prompt tokens Ollama evaluated", ("model",))
+llm_eval_tokens = REGISTRY.counter(
+    "anemone_llm_eval_tokens_total", "Tokens Ollama generated", ("model",))
+llm_calls = REGISTRY.counter(
+    "anemone_llm_calls_total", "LLM requests, by whether Ollama finished them", ("model", "outcome"))
+
+class TurnSpan:
+    """Timing of one flow run; nodes running inside it add their hops and phase times."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.end = None
+        self.hops = 0
+        self.phases = []  # (node, phase, seconds) in the order they finished
+        self.llm_calls = []  # record_llm_call() dicts in the order they finished
+        self.first_chunk = None  # seconds into the turn the first reply chunk was emitted
+        self.closed = False
+
+    @property
+    def elapsed(self):
+        return (self.end or time.perf_counter()) - self.start
+
+    def summary(self):
+        """Per-turn totals, JSON-serializable, times in milliseconds."""
+        nodes = {}
+        for node, phase, seconds in self.phases:
+            phases = nodes.setdefault(node, {})
+            phases[phase] = phases.get(phase, 0.0) + seconds * 1000
+        finished = [call for call in self.llm_calls if call["done"]]
+        eval_tokens = sum(call["eval_count"] for call in finished)
+        eval_ms = sum(call["eval_ms"] for call in finished)
+        return {
+            "turn_ms": self.elapsed * 1000,
+            "hops": self.hops,
+            "first_chunk_ms": self.first_chunk * 1000 if self.first_chunk is not None else None,
+            "ttft_ms": next((call["ttft_ms"] for call in self.llm_calls if call["ttft_ms"] is not None), None),
+            "prompt_tokens": sum(call["prompt_eval_count"] for call in finished),
+            "prompt_eval_ms": sum(call["prompt_eval_ms"] for call in finished),
+            "eval_tokens": eval_tokens,
+            "eval_ms": eval_ms,
+            "tokens_per_second": eval_tokens / eval_ms * 1000 if eval_ms else None,
+            "load_ms": sum(call["load_ms"] for call in finished),
+            "nodes": nodes,
+            "llm_calls": list(self.llm_calls),
+        }
+
+_current_turn = contextvars.ContextVar("anemone_turn", default=None)
+
+def current_turn():
+    """The span of the flow run this code belongs to, or None outside a flow."""
+    span = _current_turn.get()
+    return span if span is not None and not span.closed else None
+
+class turn_span:
+    """
+    Async context manager around one flow run:
+
+        async with turn_span() as span:
+            await flow.run_async(shared)
+    """
+
+    async def __aenter__(self):
+        self.span = TurnSpan()
+        self._token = _current_turn.set(self.span)
+        return self.span
+
+    async def __aexit__(self, exc_type, exc, tb):
+        _current_turn.reset(self._token)
+        # Background work started in the turn (summaries) keeps a copy of the
+        # context; it must not count towards a turn that has already ended
+        self.span.closed = True
+        self.span.end = time.perf_counter()
+        turn_seconds.observe(self.span.elapsed)
+        turn_hops.observe(self.span.hops)
+        turns.inc(outcome="error" if exc_type else "ok")
+        return False
+
+def record_first_chunk():
+    """Call when a reply chunk is emitted to the user; only the turn's first one counts."""
+    span = current_turn()
+    if span is not None and span.first_chunk is None:
+        span.first_chunk = span.elapsed
+        turn_first_chunk_seconds.observe(span.first_chunk)
+
+def record_llm_call(call):
+    """
+    Exports one LLM request's metrics and adds it to the current turn. `call`
+    holds model, done (Ollama finished it), ttft_ms (None when not streamed),
+    prompt_eval_count, prompt_eval_ms, eval_count, eval_ms, load_ms, total_ms.
+    """
+    model = call["model"]
+    llm_calls.inc(model=model, outcome="done" if call["done"] else "aborted")
+    if call["ttft_ms"] is not None:
+        llm_ttft_seconds.observe(call["ttft_ms"] / 1000, model=model)
+    if call["done"]:
+        llm_prompt_eval_seconds.observe(call["prompt_eval_ms"] / 1000, model=model)
+        llm_load_seconds.observe(call["load_ms"] / 1000, model=model)
+        llm_prompt_tokens.inc(call["prompt_eval_count"], model=model)
+        llm_eval_tokens.inc(call["eval_count"], model=model)
+        if call["eval_ms"]:
+            llm_tokens_per_second.observe(call["eval_count"] / call["eval_ms"] * 1000, model=model)
+    span = current_turn()
+    if span is not None:
+        span.llm_calls.append(call)
+
+def _timed_phase(fn, phase):
+    @functools.wraps(fn)
+    async def wrapper(self, *args, **kwargs):
+        node = type(self).__name__
+        start = time.perf_counter()
+        try:
+            return await fn(self, *args, **kwargs)
+        except BaseException:
+            node_errors.inc(node=node, phase=phase)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            node_seconds.observe(elapsed, node=node, phase=phase)
+            span = current_turn()
+            if span is not None:
+                span.phases.append((node, phase, elapsed))
+    return wrapper
+
+def _counted_run(fn):
+    @functools.wraps(fn)
+    async def wrapper(self, shared):
+        span = current_turn()
+        if span is not None:
+            span.hops += 1
+        return await fn(self, shared)
+    return wrapper
+
+def timed(cls):
+    """
+    Class decorator for pocketflow async nodes: times prep/exec/post into
+    anemone_node_seconds and counts each run as a hop of the current turn.
+    Wraps the class, not instances, since flows run a copy of each node.
+    """
+    for phase in ("prep", "exec", "post"):
+        name = f"{phase}_async"
+        setattr(cls, name, _timed_phase(getattr(cls, name), phase))
+    cls._run_async = _counted_run(cls._run_async)
+    return cls
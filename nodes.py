@@ -1,39 +1,293 @@
-from utils import call_llm_stream, call_llm
+from utils import call_llm_stream, call_llm, estimate_tokens, ContextBudget, assemble_messages, prompt_cache
+from persistence import CHUNK_WINDOW, chunk_history, render_message
+from metrics import record_first_chunk, timed
 import pocketflow as pf
+import asyncio
+import time
 from datetime import datetime
 import httpx
+import logging
+from logs import Sampler
+
+logger = logging.getLogger(__name__)
+
+# Memory helpers
+def memory_client():
+    """The ChromaMemory behind the agent's memory. Shared per configuration, so cheap to call every time."""
+    from memory import ChromaMemory
+    return ChromaMemory("persistent", memory_path=memory_path)
+
+# memory_path values whose ChromaMemory is already built
+_built_memory_paths = set()
+
+async def amemory_client():
+    """
+    memory_client() for the event loop. Building the client (Chroma, embedder,
+    caches, journal) blocks, so the first call for a memory_path does it on a thread.
+    """
+    if memory_path in _built_memory_paths:
+        return memory_client()
+    memory = await asyncio.to_thread(memory_client)
+    _built_memory_paths.add(memory_path)
+    return memory
+
+def last_user_message(history):
+    """Content of the most recent user message in history, or "" if there is none."""
+    for msg in reversed(history):
+        if msg.get("role") == "user":
+            return msg.get("content", "")
+    return ""
+
+def pack_memories(documents, distances, max_distance, token_budget):
+    """
+    Picks what goes in the Agent's memory block: memories within `max_distance`
+    of the query, closest first, duplicates dropped, until `token_budget` is spent.
+    The closest memory is truncated rather than dropped if it alone is over budget.
+
+    Returns:
+        List of memory texts, in the order they should be shown.
+    """
+    packed, seen, used = [], set(), 0
+    for distance, document in sorted(zip(distances, documents), key=lambda pair: pair[0]):
+        if distance is None or distance > max_distance or not document:
+            continue
+        key = " ".join(document.lower().split())
+        if key in seen:
+            continue
+        cost = estimate_tokens(document)
+        if used + cost > token_budget:
+            if not packed:
+                packed.append(document[:token_budget * 4])
+                break
+            continue
+        seen.add(key)
+        packed.append(document)
+        used += cost
+    return packed
+
+async def retrieve_memory_text(query):
+    """
+    Looks up the memories relevant to `query` and packs them into the memory
+    context budget. Never raises: failures come back as memory text so the
+    Agent can still answer.
+
+    Returns:
+        {"query": query, "memory_text": packed memories, or NO_RELEVANT_MEMORY}
+    """
+    try:
+        client = await amemory_client()
+    except ImportError as e:
+        logger.warning("ChromaDB not available: %s", e)
+        return {"query": "", "memory_text": "Memory database not available."}
+    except Exception as e:
+        # Building the client failed (bad path, conflicting options, ...)
+        logger.error("Could not open memory: %s", e)
+        return {"query": "", "memory_text": "Memory database not available."}
+    try:
+        documents, distances = await client.aretrieve_memory_scored(query, n_results=memory_top_k)
+        packed = pack_memories(documents, distances, memory_max_distance, memory_context_tokens)
+        logger.debug("Kept %d of %d memories (max distance %s)", len(packed), len(documents), memory_max_distance)
+        # Say so when nothing is relevant, so the Agent answers instead of asking again
+        memory_text = "\n\n".join(packed) if packed else NO_RELEVANT_MEMORY
+        return {"query": query, "memory_text": memory_text}
+    except Exception as e:
+        logger.error("Error during memory operation: %s", e)
+        return {"query": "", "memory_text": f"Error retrieving memory: {str(e)[:50]}"}
+
+async def queue_unpersisted(unpersisted, session_id, persisted_until):
+    """
+    Queues the completed windows of `unpersisted` (summarized messages not yet in
+    memory) for write-behind persistence. A window that isn't full yet waits for
+    the next persist.
+
+    Returns:
+        How many messages were queued; pass it to advance_persisted()
+    """
+    documents, metadatas, ids = chunk_history(unpersisted, session_id, first_turn=persisted_until,
+                                              complete_only=True)
+    await (await amemory_client()).aenqueue_memories(documents, metadatas=metadatas, ids=ids)
+    logger.info("Queued %d new chunks for persistence", len(documents))
+    return len(documents) * CHUNK_WINDOW
+
+async def cancel_summary(shared):
+    """
+    Cancels a background summary still running for this conversation and waits
+    for it to stop, so it can't swap into history after the caller moves on.
+    Nothing is lost: until the swap, its messages are still in history.
+    """
+    task = shared.pop("summary_task", None)
+    if task is None or task.done():
+        return
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+async def flush_unpersisted(shared):
+    """
+    Queues every message of a conversation that is about to go away (cleared,
+    expired, or the server stopping) that isn't in memory yet: the summarized
+    ones waiting in shared["unpersisted"], then the live turns of history after
+    its summary, including a window that isn't full yet. Chunk ids come from the
+    content, so storing the same messages again replaces these chunks. Logs
+    failures instead of raising.
+    """
+    backlog = list(shared.get("unpersisted", []))
+    messages = backlog + list(split_summary(shared.get("history", []))[1])
+    if not messages:
+        return
+    persisted_until = shared.get("persisted_until", 0)
+    documents, metadatas, ids = chunk_history(messages, shared.get("session_id", "default"),
+                                              first_turn=persisted_until)
+    try:
+        await (await amemory_client()).aenqueue_memories(documents, metadatas=metadatas, ids=ids)
+    except Exception as e:
+        logger.error("Failed to persist %d messages of a closing conversation: %s", len(messages), e)
+        return
+    logger.info("Queued %d chunks of a closing conversation for persistence", len(documents))
+    # Live turns stay in history; only the backlog leaves, so the mark keeps matching it
+    advance_persisted(shared, persisted_until, len(backlog))
+
+def advance_persisted(shared, persisted_until, queued):
+    """Moves the session's high-water mark past `queued` messages and drops them from the backlog."""
+    del shared.setdefault("unpersisted", [])[:queued]
+    shared["persisted_until"] = persisted_until + queued
 
 # Memory Filter
+SUMMARY_PREFIX = "Summary of conversation so far: "
+
+def split_summary(history):
+    """(previous summary or "", messages after it)"""
+    if history and history[0].get("role") == "system" and history[0].get("content", "").startswith(SUMMARY_PREFIX):
+        return history[0]["content"][len(SUMMARY_PREFIX):], history[1:]
+    return "", history
+
+@timed
 class MemoryFilter(pf.AsyncNode):
-    def __init__(self, model, system_prompt, max_retries=1, wait=0): 
+    """
+    Compresses the history into a summary. With `background` (the default) it
+    returns immediately, ending the flow so the reply is delivered, and the
+    summary is swapped in when it is ready.
+
+    With `rolling` (the default) the LLM only sees the previous summary and the
+    turns added since, in calls of at most `max_prompt_tokens` estimated tokens;
+    longer stretches are folded in over several calls. Otherwise the whole
+    history goes into one call.
+    """
+    def __init__(self, model, system_prompt, max_retries=1, wait=0, background=True, rolling=True,
+                 max_prompt_tokens=2000):
         super().__init__(max_retries, wait)
         self.model = model
         self.system_prompt = system_prompt
+        self.background = background
+        self.rolling = rolling
+        self.max_prompt_tokens = max_prompt_tokens
 
-    async def prep_async(self, shared):
-        history = shared['history']
-        return history
+    async def _run_async(self, shared):
+        if not self.background:
+            return await super()._run_async(shared)
+        running = shared.get("summary_task")
+        if running is not None and not running.done():
+            # One summary at a time; its successor picks up whatever it leaves out
+            shared["memory_action"] = ""
+            return None
+        prep_res = await self.prep_async(shared)
+        shared["summary_task"] = asyncio.ensure_future(self._summarize(shared, prep_res))
+        return None
 
-    async def exec_async(self, prep_res):
-        messages = [{"role":"system", "content": self.system_prompt}] + prep_res 
+    async def _summarize(self, shared, prep_res):
         try:
-            important_bits = await call_llm(messages, self.model) 
-            return important_bits
-        except ImportError:
-            print("MemoryFilter: Ollama Python client not installed.")
-            return "Conversation history could not be summarized due to missing Ollama client."
-        except httpx.ConnectError:
-            print("MemoryFilter: Cannot connect to Ollama server.")
-            return "Conversation history could not be summarized due to Ollama connection issue."
+            exec_res = await self._exec(prep_res)
+            await self.post_async(shared, prep_res, exec_res)
         except Exception as e:
-            print(f"MemoryFilter: Error during summarization: {e}")
-            return f"Conversation history could not be summarized: {str(e)[:50]}"
+            logger.exception("Background summarization failed: %s", e)
+
+    async def prep_async(self, shared):
+        # Snapshot: messages appended while summarizing stay after the summary
+        history = list(shared['history'])
+        version = shared.get("history_version", 0)
+        persist = shared.get("memory_action") == "persist"
+        if persist:
+            shared["memory_action"] = ""
+        return history, version, persist
+
+    def _turn_batches(self, turns, budget):
+        """Rendered turns grouped so each group fits in `budget` estimated tokens."""
+        batch, used = [], 0
+        for message in turns:
+            line = render_message(message)
+            cost = estimate_tokens(line)
+            if cost > budget:
+                line, cost = line[:budget * 4], budget
+            if batch and used + cost > budget:
+                yield "\n".join(batch)
+                batch, used = [], 0
+            batch.append(line)
+            used += cost
+        if batch:
+            yield "\n".join(batch)
+
+    async def _roll(self, history):
+        summary, turns = split_summary(history)
+        # Half the budget for the summary carried over, the rest for new turns
+        summary_budget = (self.max_prompt_tokens - estimate_tokens(self.system_prompt)) // 2
+        for batch in self._turn_batches(turns, summary_budget):
+            carried = summary[:summary_budget * 4]
+            prompt = (f"Previous summary:\n{carried or '(none yet)'}\n\n"
+                      f"New conversation turns:\n{batch}\n\n"
+                      "Return the previous summary updated with the new turns.")
+            summary = await call_llm([{"role": "system", "content": self.system_prompt},
+                                      {"role": "user", "content": prompt}], self.model)
+        return summary
+
+    async def exec_async(self, prep_res):
+        history, _, _ = prep_res
+        if self.rolling:
+            return await self._roll(history)
+        messages = assemble_messages(self.system_prompt, history)
+        important_bits = await call_llm(messages, self.model) 
+        return important_bits
+
+    async def exec_fallback_async(self, prep_res, exc):
+        # None: history stays as it is, and the next over-budget turn tries again
+        if isinstance(exc, ImportError):
+            logger.error("Ollama Python client not installed")
+        elif isinstance(exc, (httpx.ConnectError, ConnectionError)):
+            logger.error("Cannot connect to Ollama server for summarization: %s", exc)
+        else:
+            logger.error("Error during summarization: %s", exc)
+        return None
 
     async def post_async(self, shared, prep_res, exec_res):
-        print("Memory filter finished")
-        shared["history"] = [{'role': 'system', 'content': f"Summary of conversation so far: {exec_res}"}]
+        history, version, persist = prep_res
+        if exec_res is None:
+            logger.warning("Summarization failed, keeping the full history")
+            return
+        if shared.get("history_version", 0) != version:
+            # History was replaced since the snapshot; this summary describes something else
+            logger.info("History changed while summarizing, discarding summary")
+            return
+        logger.info("Summary swapped into history")
+        # Summarized messages leave history here; keep them until they're persisted. The
+        # previous summary is not a turn: it is neither stored nor counted
+        shared.setdefault("unpersisted", []).extend(split_summary(history)[1])
+        # Swap in one step (no await in between), keeping what arrived after the snapshot
+        shared["history"] = ([{'role': 'system', 'content': f"{SUMMARY_PREFIX}{exec_res}"}]
+                             + shared["history"][len(history):])
+        shared["history_version"] = version + 1
+        if persist:
+            persisted_until = shared.get("persisted_until", 0)
+            try:
+                queued = await queue_unpersisted(list(shared["unpersisted"]), shared.get("session_id", "default"),
+                                                 persisted_until)
+            except Exception as e:
+                logger.error("Failed to persist summarized turns: %s", e)
+                return
+            advance_persisted(shared, persisted_until, queued)
 
 # RagNode
+@timed
 class RagNode(pf.AsyncNode):
     def __init__(self, max_retries=1, wait=0):
         super().__init__(max_retries, wait)
@@ -50,60 +304,37 @@ class RagNode(pf.AsyncNode):
                 'memory_action': memory_action 
             })
 
-        print(f"RagNode.prep_async: memory_action='{memory_action}', history length={len(history)}")
-        return (history, memory_action)
-    async def exec_async(self, prep_res):
-        history, memory_action = prep_res
-        if not history:
-            return False
+        # Retrieval the Agent may have started speculatively for this turn
+        speculative = shared.pop("speculative_retrieval", None)
 
-        try:
-            from memory import ChromaMemory
-            client = ChromaMemory("persistent", memory_path="./memory")
-        except ImportError as e:
-            print(f"RagNode: ChromaDB not available - {e}")
-            if memory_action == "retrieve":
-                return {"query": "", "memory_text": "Memory database not available."}
-            else:
-                return False
-        
-        try:
-            if memory_action == "retrieve":
-                # Extract the last user message to use as the query
-                query = ""
-                for msg in reversed(history):
-                    if msg.get("role") == "user":
-                        query = msg.get("content", "")
-                        break
-                
-                if not query:
-                    # Fallback if no user message found (unlikely)
-                    return False
-                    
-                query, retrieved = client.retrieve_memory(query)
-                # Extract memory text from ChromaDB result structure
-                # retrieved is list of lists: [["memory text"]]
-                memory_text = ""
-                if retrieved and len(retrieved) > 0 and len(retrieved[0]) > 0:
-                    memory_text = retrieved[0][0]
-                return {"query": query, "memory_text": memory_text}
-            elif memory_action == "persist":
-                client.save_memory(str(history))
-                return True
-            else:
-                # Unknown memory_action, shouldn't happen
-                print(f"RagNode: Unknown memory_action '{memory_action}'")
+        logger.debug("RagNode prep: memory_action=%r, history length=%d", memory_action, len(history))
+        return (history, memory_action, speculative)
+    async def exec_async(self, prep_res):
+        history, memory_action, speculative = prep_res
+        # A speculative lookup only helps a retrieve for the same query
+        if speculative and (memory_action != "retrieve" or speculative["query"] != last_user_message(history)):
+            speculative["task"].cancel()
+            speculative = None
+        if memory_action == "retrieve":
+            if not history:
                 return False
-        except Exception as e:
-            print(f"RagNode: Error during memory operation: {e}")
-            if memory_action == "retrieve":
-                return {"query": "", "memory_text": f"Error retrieving memory: {str(e)[:50]}"}
-            else:
-                print(f"RagNode: Failed to persist memory: {e}")
+            # Extract the last user message to use as the query
+            query = last_user_message(history)
+            if not query:
+                # Fallback if no user message found (unlikely)
                 return False
+            if speculative:
+                # Agent already started this lookup while it was generating
+                logger.debug("Using speculative retrieval result")
+                return await speculative["task"]
+            return await retrieve_memory_text(query)
+
+        # Persisting is MemoryFilter's job; retrieval is the only action routed here
+        logger.warning("Unknown memory_action %r", memory_action)
+        return False
     
     async def post_async(self, shared, prep_res, exec_res):
-        _, memory_action = prep_res
+        _, memory_action, _ = prep_res
         if memory_action == "retrieve":
             if exec_res is False:
                 # No history, retrieval failed
@@ -112,35 +343,166 @@ class RagNode(pf.AsyncNode):
             elif isinstance(exec_res, dict) and "query" in exec_res:
                 shared["memory_context"] = exec_res["query"]
                 shared["retrieved_memory"] = exec_res["memory_text"]
-                # Emit memory retrieval notification to UI
+                # Emit memory retrieval notification to UI, unless nothing relevant was found
                 socketio = shared.get("socketio")
-                if socketio and exec_res["memory_text"]:
+                if socketio and exec_res["memory_text"] and exec_res["memory_text"] != NO_RELEVANT_MEMORY:
                     socketio.emit('memory_retrieved', {
                         'content': exec_res["memory_text"]
                     })
-                    print(f"RagNode: Emitted memory_retrieved event with memory text: {exec_res['memory_text'][:80]}...")
+                    logger.debug("Emitted memory_retrieved: %.80s", exec_res['memory_text'])
             else:
                 # Fallback for old format
                 shared["memory_context"], shared["retrieved_memory"] = exec_res
-                # Emit memory retrieval notification to UI
+                # Emit memory retrieval notification to UI, unless nothing relevant was found
                 socketio = shared.get("socketio")
-                if socketio and shared["retrieved_memory"]:
+                if socketio and shared["retrieved_memory"] and shared["retrieved_memory"] != NO_RELEVANT_MEMORY:
                     socketio.emit('memory_retrieved', {
                         'content': shared["retrieved_memory"]
                     })
-                    print(f"RagNode: Emitted memory_retrieved event with memory text: {shared['retrieved_memory'][:80]}...")
+                    logger.debug("Emitted memory_retrieved: %.80s", shared['retrieved_memory'])
             # Clear memory_action to prevent re-retrieval in same turn
             shared["memory_action"] = ""
-            print(f"RagNode: Memory retrieved and memory_action cleared. Memory text: {shared['retrieved_memory'][:80]}...")
+            logger.info("Memory retrieved: %.80s", shared['retrieved_memory'])
 
         
 
+# Memory Router
+@timed
+class MemoryRouter(pf.AsyncNode):
+    """
+    Optional stage in front of the Agent that decides from embedding similarity
+    whether the user's message needs memory. When it does, the memory is handed
+    to the Agent up front, so the turn takes one LLM generation instead of two.
+    """
+    def __init__(self, threshold, max_retries=1, wait=0):
+        super().__init__(max_retries, wait)
+        # Largest distance (Chroma's default squared L2) still treated as relevant
+        self.threshold = threshold
+
+    async def prep_async(self, shared):
+        history = shared.setdefault("history", [])
+        if shared.get("retrieved_memory"):
+            # Memory already present, nothing to decide
+            return ""
+        return last_user_message(history)
+
+    async def exec_async(self, prep_res):
+        query = prep_res
+        if not query:
+            return None
+        start = time.perf_counter()
+        try:
+            client = await amemory_client()
+            documents, distances = await client.aretrieve_memory_scored(query, n_results=memory_top_k)
+        except Exception as e:
+            logger.warning("Could not score query, leaving it to the Agent: %s", e)
+            return None
+        # Same packing as RagNode, with the router's own relevance cut
+        packed = pack_memories(documents, distances, self.threshold, memory_context_tokens)
+        return {
+            "query": query,
+            "memory_text": "\n\n".join(packed),
+            "distance": min(distances) if distances else None,
+            "latency_ms": (time.perf_counter() - start) * 1000,
+        }
+
+    async def post_async(self, shared, prep_res, exec_res):
+        if not exec_res:
+            return
+        distance = exec_res["distance"]
+        retrieve = distance is not None and distance <= self.threshold
+        shared["routing"] = {
+            "retrieve": retrieve,
+            "distance": distance,
+            "latency_ms": exec_res["latency_ms"],
+        }
+        logger.debug("MemoryRouter: distance=%s, threshold=%s, retrieve=%s, took %.1f ms",
+                     distance, self.threshold, retrieve, exec_res["latency_ms"])
+        if retrieve:
+            shared["memory_context"] = exec_res["query"]
+            shared["retrieved_memory"] = exec_res["memory_text"]
+            socketio = shared.get("socketio")
+            if socketio:
+                socketio.emit('memory_retrieved', {
+                    'content': exec_res["memory_text"]
+                })
+
+# Command detection
+class CommandDetector:
+    """
+    Decides from the first few streamed characters whether a response is the
+    retrieve_memory command. Only a bounded prefix is ever inspected, so once a
+    decision is made every further chunk costs O(1).
+    """
+    COMMAND = "retrieve_memory"
+    # Wrappers the model sometimes puts in front of the command (compared lowercased)
+    LEADING_TOKENS = (
+        '<|assistant|>', '<|user|>', '<|system|>',
+        'assistant:', 'user:', 'system:',
+        'retrieved memories:', '<retrieved_memory>',
+    )
+    QUOTES = '`"\''
+    # Past this many characters without a decision the response is plain text
+    MAX_PREFIX = 64
+
+    def __init__(self):
+        self.prefix = ""
+        self.decision = None  # None while undecided, then True (command) or False (text)
+
+    def feed(self, content):
+        """Feeds the next streamed chunk and returns the current decision."""
+        if self.decision is None:
+            self.prefix += content
+            self.decision = self.classify(self.prefix, final=False)
+        return self.decision
+
+    def finish(self):
+        """Called when the stream ends, settles an undecided prefix."""
+        if self.decision is None:
+            self.decision = self.classify(self.prefix)
+        return self.decision
+
+    @classmethod
+    def classify(cls, text, final=True):
+        """
+        Args:
+            text : The response so far
+            final : Whether text is the complete response
+
+        Returns:
+            True if text starts with the command, False if it can't,
+            None if more text is needed to tell (only when not final)
+        """
+        head = text[:cls.MAX_PREFIX].lower()
+        while True:
+            stripped = head.lstrip().lstrip(cls.QUOTES).lstrip()
+            for token in cls.LEADING_TOKENS:
+                if stripped.startswith(token):
+                    stripped = stripped[len(token):]
+                    break
+            if stripped == head:
+                break
+            head = stripped
+        if head.startswith(cls.COMMAND):
+            return True
+        if final or len(text) >= cls.MAX_PREFIX:
+            return False
+        if cls.COMMAND.startswith(head) or any(token.startswith(head) for token in cls.LEADING_TOKENS):
+            return None
+        return False
+
 # Agent (Self-loop Node)
+@timed
 class Agent(pf.AsyncNode):
-    def __init__(self, model, system_prompt, max_retries=1, wait=0): 
+    def __init__(self, model, system_prompt, max_retries=1, wait=0, speculative_retrieval=False, budget=None): 
         super().__init__(max_retries, wait)
         self.model = model 
         self.system_prompt = system_prompt
+        # Start the memory lookup for the user's message alongside the LLM call,
+        # so a retrieve_memory answer finds the result already waiting
+        self.speculative_retrieval = speculative_retrieval
+        # Decides when history gets compressed, from the prompt's estimated size
+        self.budget = budget or ContextBudget()
     
     def _clean_chunk(self, text):
         """Clean a streaming chunk - removes role tokens but preserves whitespace."""
@@ -198,44 +560,75 @@ class Agent(pf.AsyncNode):
     
     def _is_retrieve_command(self, text):
         """Check if the text is a retrieve_memory command."""
-        cleaned = self._clean_llm_response(text).lower()
-        # Check if it starts with "retrieve_memory" (model might add extra text)
-        # Also check for exact match
-        return cleaned.startswith("retrieve_memory") or cleaned == "retrieve_memory"
+        # Same rule as the streaming detector, so streaming and routing always agree
+        return CommandDetector.classify(text)
 
     async def prep_async(self, shared):
         history = shared.setdefault("history", [])
         query_text = shared.get("memory_context", None)
         memory = shared.get("retrieved_memory", None) 
         socketio = shared.get("socketio")  # Get socketio from shared state
+        if self.speculative_retrieval and not memory:
+            query = last_user_message(history)
+            pending = shared.get("speculative_retrieval")
+            if query and (pending is None or pending["query"] != query):
+                if pending:
+                    pending["task"].cancel()
+                # Runs next to the LLM stream, ChromaMemory's async API keeps the loop free
+                shared["speculative_retrieval"] = {
+                    "query": query,
+                    "task": asyncio.ensure_future(retrieve_memory_text(query)),
+                }
         return history, query_text,memory, socketio
 
+    def _build_messages(self, history, query_text, memory):
+        # Retrieved memory changes every turn, so it goes after the cacheable prefix, never into it
+        tail = []
+        if memory:
+            tail.append({"role": "system", "content": f"You just retrieved your memories. Use this information to answer the user's question. DO NOT output 'retrieve_memory' again. DO NOT copy the XML tags in your response. Just answer naturally using the memory below.\n\n<retrieved_memory>\nMemory about '{query_text}':\n{memory}\n</retrieved_memory>"})
+        return assemble_messages(self.system_prompt, history, tail)
+
+    def _calibrate(self, messages, chunk):
+        """
+        The final chunk of a stream carries Ollama's prompt token count. That
+        counts only the tokens Ollama evaluated, so pass just the uncached messages.
+        """
+        if isinstance(chunk, dict):
+            done, count = chunk.get("done"), chunk.get("prompt_eval_count")
+        else:
+            done, count = getattr(chunk, "done", None), getattr(chunk, "prompt_eval_count", None)
+        if done is True:
+            self.budget.calibrate(messages, count)
+
     async def exec_async(self, prep_res):
         history, query_text, memory, socketio = prep_res
-        messages = [{"role": "system", "content": self.system_prompt}] + history
-        if memory:
-            messages.append({"role": "system", "content": f"You just retrieved your memories. Use this information to answer the user's question. DO NOT output 'retrieve_memory' again. DO NOT copy the XML tags in your response. Just answer naturally using the memory below.\n\n<retrieved_memory>\nMemory about '{query_text}':\n{memory}\n</retrieved_memory>"})
-        print(f"Agent.exec_async: Preparing LLM call with {len(messages)} messages")
-        print(f"Agent.exec_async: Memory present: {bool(memory)}")
-        print(f"Agent.exec_async: SocketIO available: {socketio is not None}")
-        print(f"Agent.exec_async: First message preview: {messages[0]['content'][:100]}...")
-        if memory:
-            print(f"Agent.exec_async: Memory preview: {memory[:100]}...")
+        messages = self._build_messages(history, query_text, memory)
+        logger.debug("Agent calling %s with %d messages (memory: %.100r, socket: %s)",
+                     self.model, len(messages), memory, socketio is not None)
         # Stream the response
-        full_response = ""
+        response_parts = []
         chunk_count = 0
-        self._stream_buffer = ""  # Clear buffer at start of each call
-        self._is_command_response = False  # Track if response is a command
+        # Per-call streaming state lives in locals, never on self, so concurrent
+        # runs sharing this node can't interleave each other's output
+        stream_buffer = ""
+        detector = CommandDetector()  # Tracks if response is a command
+        uncached = messages[prompt_cache.shared_prefix(self.model, messages):]
+        stream = call_llm_stream(messages, self.model)
+        # Checked once per stream: with debug off the loop pays one boolean test per chunk
+        chunk_log = Sampler(logger)
+        debug = chunk_log.enabled
         try:
-            async for chunk in call_llm_stream(messages, self.model):
-                print(f"Agent.exec_async: Received chunk: {chunk}")
+            async for chunk in stream:
+                if debug:
+                    chunk_log.debug("Received chunk: %r", chunk)
+                self._calibrate(uncached, chunk)
                 # Handle both dict and object access
                 if hasattr(chunk, 'message'):
                     message = chunk.message
                 elif isinstance(chunk, dict) and 'message' in chunk:
                     message = chunk['message']
                 else:
-                    print(f"Agent.exec_async: Unknown chunk structure: {chunk}")
+                    logger.warning("Unknown chunk structure: %r", chunk)
                     continue
                 
                 if hasattr(message, 'content'):
@@ -243,76 +636,80 @@ class Agent(pf.AsyncNode):
                 elif isinstance(message, dict) and 'content' in message:
                     content = message['content']
                 else:
-                    print(f"Agent.exec_async: No content in message: {message}")
+                    logger.warning("No content in message: %r", message)
                     continue
                 
                 if content is None:
                     continue
                     
-                full_response += content if content is not None else ''
+                response_parts.append(content)
                 
-                # Check if the accumulating response is a retrieve_memory command
-                # We need to check both raw and cleaned versions
-                cleaned_so_far = self._clean_llm_response(full_response).lower()
-                if cleaned_so_far.startswith("retrieve_memory"):
-                    self._is_command_response = True
-                    # Don't stream commands to the user
-                    continue
+                # Check if the response is a retrieve_memory command; decided
+                # within the first few tokens, free afterwards
+                is_command = detector.feed(content)
+                if is_command:
+                    # Don't stream commands to the user, and stop the model
+                    # generating the rest of a response nobody will read
+                    logger.debug("retrieve_memory detected, closing stream")
+                    break
                 
                 # Only stream if not a command response
-                if not self._is_command_response and socketio:
+                if socketio:
                     # Clean the chunk before emitting - preserve whitespace for token streaming
                     cleaned_content = self._clean_chunk(content)
                     if cleaned_content:
-                        # Initialize buffer if needed
-                        if not hasattr(self, '_stream_buffer'):
-                            self._stream_buffer = ""
-                        self._stream_buffer += cleaned_content
+                        stream_buffer += cleaned_content
                         
-                        # Emit buffer if it's large enough or contains punctuation
+                        # Emit buffer if it's large enough or contains punctuation,
+                        # holding it back while it might still turn into a command
                         punctuation = '.!?,;:'
-                        if len(self._stream_buffer) >= 30 or any(p in cleaned_content for p in punctuation):
+                        if is_command is False and (len(stream_buffer) >= 30 or any(p in cleaned_content for p in punctuation)):
                             chunk_count += 1
+                            record_first_chunk()
                             socketio.emit('stream_chunk', {
-                                'content': self._stream_buffer,
+                                'content': stream_buffer,
                             })
-                            print(f"Agent.exec_async: Emitted buffered chunk {chunk_count}: '{self._stream_buffer[:50]}...'")
-                            self._stream_buffer = ""
+                            if debug:
+                                chunk_log.debug("Emitted buffered chunk %d: %.50r", chunk_count, stream_buffer)
+                            stream_buffer = ""
                         # else: buffer accumulates for next emit
         except ImportError:
             error_msg = "Ollama Python client not installed. Please run 'pip install ollama'."
-            print(f"Agent.exec_async: {error_msg}")
-            full_response = error_msg
+            logger.error(error_msg)
+            response_parts = [error_msg]
             if socketio:
                 socketio.emit('stream_chunk', {'content': error_msg})
         except httpx.ConnectError as e:
             error_msg = "Cannot connect to Ollama server. Please make sure Ollama is running (run 'ollama serve' in another terminal)."
-            print(f"Agent.exec_async: {error_msg} - {str(e)}")
-            full_response = error_msg
+            logger.error("%s (%s)", error_msg, e)
+            response_parts = [error_msg]
             if socketio:
                 socketio.emit('stream_chunk', {'content': error_msg})
         except Exception as e:
             error_msg = f"I'm having trouble connecting to my AI model. Error: {str(e)[:100]}"
-            print(f"Agent.exec_async: {error_msg}")
-            full_response = error_msg
+            logger.error(error_msg)
+            response_parts = [error_msg]
             if socketio:
                 socketio.emit('stream_chunk', {'content': error_msg})
         finally:
+            # Release the Ollama connection now rather than when the generator is collected
+            await stream.aclose()
             # Flush any remaining buffer (only if not a command response)
-            if (hasattr(self, '_stream_buffer') and self._stream_buffer and socketio and 
-                not getattr(self, '_is_command_response', False)):
+            if stream_buffer and socketio and not detector.finish():
                 chunk_count += 1
+                record_first_chunk()
                 socketio.emit('stream_chunk', {
-                    'content': self._stream_buffer,
+                    'content': stream_buffer,
                 })
-                print(f"Agent.exec_async: Flushed buffer chunk {chunk_count}: '{self._stream_buffer[:50]}...'")
-                self._stream_buffer = ""
+                if debug:
+                    chunk_log.debug("Flushed buffer chunk %d: %.50r", chunk_count, stream_buffer)
+                stream_buffer = ""
         
         # Clean the full response before returning
+        full_response = "".join(response_parts)
         cleaned_full_response = self._clean_llm_response(full_response)
-        print(f"Agent.exec_async: Total chunks: {chunk_count}")
-        print(f"Agent.exec_async: Raw response ({len(full_response)} chars): {full_response[:100]}...")
-        print(f"Agent.exec_async: Cleaned response ({len(cleaned_full_response)} chars): {cleaned_full_response[:100]}...")
+        logger.debug("Agent response: %d chunks emitted, %d raw chars, %d cleaned",
+                     chunk_count, len(full_response), len(cleaned_full_response))
         return cleaned_full_response
 
     async def post_async(self, shared, prep_res, exec_res):
@@ -322,18 +719,18 @@ class Agent(pf.AsyncNode):
         # Check if agent output is a retrieve_memory command
         # Use the cleaner to handle backticks, quotes, role tokens, etc.
         is_retrieve_command = self._is_retrieve_command(exec_res)
-        print(f"Agent.post_async: Checking if '{exec_res[:50]}...' is retrieve command: {is_retrieve_command}")
+        logger.debug("Response %.50r is retrieve command: %s", exec_res, is_retrieve_command)
         
         if is_retrieve_command:
             # Guard: if memory already exists (just retrieved), ignore the command
             # This prevents infinite loops when model disobeys instructions
             if memory:
-                print(f"Memory guard: Ignoring retrieve_memory command since memory already retrieved. Memory: {memory[:50]}...")
-                print(f"Memory guard: Checking if ': ' in memory: {': ' in memory}")
-                print(f"Memory guard: memory repr: {repr(memory[:100])}")
+                logger.info("Memory guard: ignoring retrieve_memory, memory already retrieved: %.50r", memory)
                 # Don't trigger another retrieval, respond with memory-based answer
                 # Use the retrieved memory to craft a response
-                if memory:
+                if memory == NO_RELEVANT_MEMORY:
+                    exec_res = "I looked through my memories, but I don't have anything about that."
+                elif memory:
                     # Try to make a natural response from the memory
                     # If memory starts with label like "Origin Story:", remove it
                     # Try multiple ways to extract content
@@ -342,46 +739,74 @@ class Agent(pf.AsyncNode):
                         # Take the part after the first ": "
                         memory_content = memory.split(": ", 1)[1]
                         exec_res = f"According to my memory, {memory_content}"
-                        print(f"Memory guard: Using 'According to my memory' format (split on ': ')")
+                        logger.debug("Memory guard: using 'According to my memory' format (split on ': ')")
                     elif ":" in memory:
                         # Fallback for colon without space
                         memory_content = memory.split(":", 1)[1].lstrip()
                         exec_res = f"According to my memory, {memory_content}"
-                        print(f"Memory guard: Using 'According to my memory' format (split on ':')")
+                        logger.debug("Memory guard: using 'According to my memory' format (split on ':')")
                     else:
                         exec_res = f"I recall that {memory}"
-                        print(f"Memory guard: Using 'I recall that' format")
+                        logger.debug("Memory guard: using 'I recall that' format")
                 else:
                     exec_res = "I've accessed the relevant memory. Now I can answer your question."
                 
                 # Emit the natural response since streaming was suppressed for the command
                 if socketio:
+                    record_first_chunk()
                     socketio.emit('stream_chunk', {'content': exec_res})
-                    print(f"Agent.post_async: Emitted guard response: '{exec_res[:50]}...'")
+                    logger.debug("Emitted guard response: %.50r", exec_res)
             else:
                 # No memory yet, trigger retrieval
                 shared["memory_action"] = "retrieve"
-                print("Agent.post_async: Triggering memory retrieval")
+                logger.debug("Triggering memory retrieval")
                 return "retrieve_memory"
         
+        # No retrieval this turn, drop any speculative lookup
+        speculative = shared.pop("speculative_retrieval", None)
+        if speculative:
+            speculative["task"].cancel()
+
+        # Prompt size of this turn, for the UI and metrics
+        shared["prompt_tokens"] = self.budget.estimate(self._build_messages(history, query_text, memory))
+
         # Update the history with agent's response
         shared["history"].append({"role": "agent", "content": exec_res})
         shared["loop_count"] = shared.get("loop_count", 0) + 1
-        loop_count = shared["loop_count"]
 
         # Clear memory context after use
         shared["memory_context"] = shared["retrieved_memory"] = None
 
-        # Schedule memory operations based on loop count
-        if loop_count % 10 == 0:
+        # Compress (and persist what gets compressed) once the next prompt would cross the high-water mark
+        if self.budget.over(self._build_messages(shared["history"], None, None)):
+            logger.info("History over %d tokens, compressing", self.budget.limit)
             shared["memory_action"] = "persist"
             return "persist"
-        elif loop_count % 5 == 0:
-            return "memory_filter"
 
 # Configuration
+memory_path = "./memory"
 memory_model = "phi4-mini"
 agent_model = "phi4-mini"
+# Query memory in parallel with every first Agent call (costs one Chroma query per turn)
+speculative_retrieval = False
+# Decide retrieval from embedding distance before calling the Agent (one Chroma query per turn)
+pre_routing = False
+# Largest distance to the closest memory that still counts as relevant
+memory_router_threshold = 1.0
+# Model context window (Ollama's num_ctx) and the share of it history may fill before it is compressed
+context_tokens = 4096
+context_high_water = 0.75
+# Summarize after the reply is delivered instead of before the turn completes
+background_summarization = True
+# Rolling summaries: previous summary + new turns, at most this many tokens per call
+rolling_summarization = True
+summary_prompt_tokens = 2000
+# Retrieval fetches this many candidates and keeps those within memory_max_distance
+memory_top_k = 4
+memory_max_distance = 1.2
+# Token budget for the memory block in the Agent's system message
+memory_context_tokens = 300
+NO_RELEVANT_MEMORY = "No relevant memories found."
 
 
 agent_prompt = """You are Anemone, a helpful AI assistant with persistent memory.
@@ -407,6 +832,9 @@ Do NOT give any preamble. Simply return a compacted version of the main beats of
 
 
 # Creating an instance for loading in orchestration
-memory_filter = MemoryFilter(memory_model, memory_filter_prompt)
-agent = Agent(agent_model, agent_prompt)
+memory_filter = MemoryFilter(memory_model, memory_filter_prompt, background=background_summarization,
+                             rolling=rolling_summarization, max_prompt_tokens=summary_prompt_tokens)
+agent = Agent(agent_model, agent_prompt, speculative_retrieval=speculative_retrieval,
+              budget=ContextBudget(context_tokens, context_high_water))
 rag_node = RagNode()
+memory_router = MemoryRouter(memory_router_threshold)
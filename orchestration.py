@@ -1,11 +1,56 @@
 import pocketflow as pf 
 import asyncio
-from nodes import agent, memory_filter, rag_node
+from nodes import Agent, MemoryFilter, MemoryRouter, RagNode
+from nodes import agent_model, agent_prompt, memory_model, memory_filter_prompt, speculative_retrieval
+from nodes import pre_routing, memory_router_threshold, background_summarization
+from nodes import rolling_summarization, summary_prompt_tokens, context_tokens, context_high_water
+from utils import ContextBudget
+from metrics import turn_span
+from nodes import agent, memory_filter, memory_router, rag_node
 
-my_async_flow = pf.AsyncFlow(start=agent)
+class TimedFlow(pf.AsyncFlow):
+    """
+    AsyncFlow that records each run as a turn span (latency, node hops, LLM
+    calls). The turn's summary is left in shared["turn_metrics"] and emitted
+    as a turn_metrics event.
+    """
 
-# Actual orchestration logic
-agent - "retrieve_memory" >> rag_node >> agent
-agent - "persist" >> memory_filter >> rag_node
-agent - "memory_filter" >> memory_filter 
+    async def _run_async(self, shared):
+        async with turn_span() as span:
+            result = await super()._run_async(shared)
+        shared["turn_metrics"] = span.summary()
+        socketio = shared.get("socketio")
+        if socketio:
+            socketio.emit('turn_metrics', shared["turn_metrics"])
+        return result
+
+def wire_flow(agent, memory_filter, rag_node, memory_router=None):
+    """
+    Connects the nodes into the orchestration graph and returns the flow.
+    With a memory_router the flow starts there and hands over to `agent`.
+    """
+    agent - "retrieve_memory" >> rag_node >> agent
+    # MemoryFilter persists what it summarizes itself, in the background by default
+    agent - "persist" >> memory_filter
+    if memory_router is not None:
+        memory_router >> agent
+        return TimedFlow(start=memory_router)
+    return TimedFlow(start=agent)
 
+def build_flow():
+    """
+    Builds a fresh flow with its own node instances. Nodes keep no per-run state,
+    so one flow can already serve concurrent sessions; use this when a caller
+    needs an independent graph (e.g. different models or prompts per flow).
+    """
+    return wire_flow(
+        Agent(agent_model, agent_prompt, speculative_retrieval=speculative_retrieval,
+              budget=ContextBudget(context_tokens, context_high_water)),
+        MemoryFilter(memory_model, memory_filter_prompt, background=background_summarization,
+                     rolling=rolling_summarization, max_prompt_tokens=summary_prompt_tokens),
+        RagNode(),
+        MemoryRouter(memory_router_threshold) if pre_routing else None,
+    )
+
+# Actual orchestration logic
+my_async_flow = wire_flow(agent, memory_filter, rag_node, memory_router if pre_routing else None)
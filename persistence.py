@@ -0,0 +1,41 @@
+import hashlib
+from datetime import datetime
+
+# Messages per stored chunk; bounds how much text one persisted document holds
+CHUNK_WINDOW = 4
+
+def render_message(message):
+    """One history message as a line of plain text, e.g. "user: Who is Bartholomew?"."""
+    return f"{message.get('role', 'unknown')}: {message.get('content', '')}"
+
+def chunk_id(session_id, document):
+    """Derived from the content, so upserting the same chunk again replaces it instead of duplicating it."""
+    return hashlib.sha256(f"{session_id}\n{document}".encode("utf-8")).hexdigest()
+
+def chunk_history(history, session_id, first_turn=0, window=CHUNK_WINDOW, complete_only=False):
+    """
+    Splits history into windows of `window` messages, ready to upsert.
+    `first_turn` is the conversation-wide index of history[0], used for the
+    turn range metadata. With `complete_only` a trailing window that is not
+    full yet is left out, for a later call to persist once it fills up.
+
+    Returns:
+        (documents, metadatas, ids) lists, one entry per chunk
+    """
+    documents, metadatas, ids = [], [], []
+    end = len(history) - len(history) % window if complete_only else len(history)
+    for offset in range(0, end, window):
+        messages = history[offset:offset + window]
+        turn_start = first_turn + offset
+        turn_end = turn_start + len(messages) - 1
+        documents.append("\n".join(render_message(message) for message in messages))
+        metadatas.append({
+            "session": session_id,
+            "turn_start": turn_start,
+            "turn_end": turn_end,
+            # Agent replies carry no timestamp, so use the latest one in the window
+            "timestamp": next((m["timestamp"] for m in reversed(messages) if m.get("timestamp")),
+                              datetime.now().isoformat()),
+        })
+        ids.append(chunk_id(session_id, documents[-1]))
+    return documents, metadatas, ids
@@ -0,0 +1,77 @@
+import asyncio
+import logging
+import threading
+
+from utils import close_clients
+
+logger = logging.getLogger(__name__)
+
+class AsyncRuntime:
+    """
+    One long-lived asyncio loop on a background thread that every flow runs on.
+
+    Sync code (Flask-SocketIO handlers) hands coroutines over with submit() and
+    gets a concurrent.futures.Future back. Because the loop outlives each turn,
+    anything bound to it - pooled Ollama connections, background tasks - is
+    shared across turns and sessions.
+    """
+
+    def __init__(self, name="anemone-runtime"):
+        self.name = name
+        self.loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Starts the loop thread, once. Returns self so it can be chained."""
+        with self._lock:
+            if self._thread is None:
+                self.loop = asyncio.new_event_loop()
+                ready = threading.Event()
+                self._thread = threading.Thread(target=self._run, args=(ready,), name=self.name, daemon=True)
+                self._thread.start()
+                ready.wait()
+        return self
+
+    def _run(self, ready):
+        asyncio.set_event_loop(self.loop)
+        self.loop.call_soon(ready.set)
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.close()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def submit(self, coro):
+        """Schedules `coro` on the runtime loop from any thread, starting the loop if needed."""
+        if not self.running:
+            self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        """Runs `coro` on the runtime loop and blocks the calling thread until it finishes."""
+        return self.submit(coro).result(timeout)
+
+    async def _shutdown(self):
+        current = asyncio.current_task()
+        tasks = [task for task in asyncio.all_tasks() if task is not current]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await close_clients()
+
+    def stop(self, timeout=10.0):
+        """Cancels outstanding work, closes the loop's Ollama clients, and stops the thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None or not thread.is_alive():
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop).result(timeout)
+        except Exception as e:
+            logger.error("Error during shutdown: %s", e)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        thread.join(timeout)
@@ -1,5 +1,10 @@
 import chromadb
 from uuid import uuid4
+from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+from embedding_cache import CachedEmbedder, EmbeddingCache
+from memory import ChromaMemory
+
+MEMORY_PATH = "./memory"
 
 # --- Fake Memories to Inject ---
 # Each item in this list is a string that will be stored as a "memory".
@@ -30,19 +35,26 @@ memories = [
 def seed_database():
     """Connects to the ChromaDB and adds the predefined memories."""
     print("Connecting to ChromaDB...")
-    client = chromadb.PersistentClient(path="./memory")
+    client = chromadb.PersistentClient(path=MEMORY_PATH)
     
     # Get or create the collection
     collection = client.get_or_create_collection("agent_memory")
     
+    # Embed through the same on-disk cache the app uses, so re-seeding doesn't re-embed
+    cache_path = ChromaMemory.default_embedding_cache_path("persistent", memory_path=MEMORY_PATH)
+    embedder = CachedEmbedder(DefaultEmbeddingFunction(), EmbeddingCache(cache_path))
+
     # Add the documents. Using UUIDs for unique IDs.
     ids = [str(uuid4()) for _ in memories]
     collection.add(
         documents=memories,
+        embeddings=embedder(memories),
         ids=ids
     )
     
+    stats = embedder.stats()
     print(f"Successfully added {len(memories)} memories to the 'agent_memory' collection.")
+    print(f"Embedding cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%} hit rate)")
     print("Database is seeded and ready!")
 
 if __name__ == "__main__":
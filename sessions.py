@@ -0,0 +1,116 @@
+import asyncio
+import secrets
+import threading
+import time
+from uuid import uuid4
+
+def new_conversation_state():
+    """Fresh shared state for one conversation, as expected by the orchestration flow."""
+    return {
+        # Names the conversation in persisted memories; not the (secret) session token
+        "session_id": uuid4().hex,
+        "history": [],
+        # Bumped whenever history is replaced rather than appended to
+        "history_version": 0,
+        # Summarized messages not yet persisted, and how many messages already are
+        "unpersisted": [],
+        "persisted_until": 0,
+        "loop_count": 0,
+        "retrieved_memory": "",
+        "memory_action": ""
+    }
+
+class RoomEmitter:
+    """
+    Stands in for the SocketIO server in a conversation's shared state, so every
+    emit a node makes only reaches the clients of that conversation.
+    """
+
+    def __init__(self, socketio, room):
+        self.socketio = socketio
+        self.room = room
+
+    def emit(self, event, data=None):
+        self.socketio.emit(event, data, to=self.room)
+
+class Session:
+    """
+    One conversation: its flow state, the Socket.IO room it talks to, and a lock
+    serializing its turns on the runtime loop.
+    """
+
+    def __init__(self, token, socketio=None):
+        self.token = token
+        self.state = new_conversation_state()
+        if socketio is not None:
+            self.state["socketio"] = RoomEmitter(socketio, token)
+        self.lock = asyncio.Lock()
+        self.sids = set()
+        self.last_seen = time.monotonic()
+
+    def clear(self):
+        socketio = self.state.get("socketio")
+        self.state = new_conversation_state()
+        if socketio is not None:
+            self.state["socketio"] = socketio
+
+class SessionStore:
+    """
+    Conversations keyed by a session token. A client that reconnects (or opens
+    another tab) with the same token gets the same conversation back; sessions
+    without any connected client are dropped after `ttl` seconds, and handed to
+    `on_expire` (called outside the store's lock) if given.
+    """
+
+    def __init__(self, socketio=None, ttl=3600.0, on_expire=None):
+        self.socketio = socketio
+        self.ttl = ttl
+        self.on_expire = on_expire
+        self._sessions = {}
+        self._by_sid = {}
+        self._lock = threading.Lock()
+
+    def connect(self, sid, token=None):
+        """Attaches a Socket.IO connection to the session for `token`, creating a new session for unknown tokens."""
+        with self._lock:
+            expired = self._expire()
+            session = self._sessions.get(token) if token else None
+            if session is None:
+                # Never trust a client-chosen token, only ones we handed out
+                session = Session(secrets.token_urlsafe(16), self.socketio)
+                self._sessions[session.token] = session
+            session.sids.add(sid)
+            session.last_seen = time.monotonic()
+            self._by_sid[sid] = session
+        if self.on_expire is not None:
+            for old in expired:
+                self.on_expire(old)
+        return session
+
+    def disconnect(self, sid):
+        with self._lock:
+            session = self._by_sid.pop(sid, None)
+            if session is not None:
+                session.sids.discard(sid)
+                session.last_seen = time.monotonic()
+
+    def get(self, sid):
+        with self._lock:
+            return self._by_sid.get(sid)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._sessions.values()))
+
+    def _expire(self):
+        """Drops idle sessions past their ttl and returns them."""
+        now = time.monotonic()
+        expired = []
+        for token, session in list(self._sessions.items()):
+            if not session.sids and now - session.last_seen > self.ttl:
+                expired.append(self._sessions.pop(token))
+        return expired
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Test that ChromaMemory's async API, and building it on first use, keep the
+event loop responsive.
+Uses an ephemeral client with blocking lookups patched in, no embedding model required.
+"""
+import asyncio
+import sys
+import threading
+import time
+sys.path.insert(0, '.')
+
+from unittest.mock import patch
+from memory import ChromaMemory
+import nodes
+
+LOOKUP_TIME = 0.2
+LOOKUPS = 8
+
+def blocking_query(query, collection="agent_memory"):
+    time.sleep(LOOKUP_TIME)  # embedding + vector search holding the thread
+    return [[f"memory for {query}"]]
+
+async def heartbeat(stop, gaps):
+    """Ticks every 10 ms and records how late each tick was."""
+    last = time.perf_counter()
+    while not stop.is_set():
+        await asyncio.sleep(0.01)
+        now = time.perf_counter()
+        gaps.append(now - last - 0.01)
+        last = now
+
+async def test_async_api():
+    print("=== Testing ChromaMemory async API ===")
+    client = ChromaMemory("ephemeral", workers=LOOKUPS)
+    client._query_documents = blocking_query
+
+    stop, gaps = asyncio.Event(), []
+    beat = asyncio.create_task(heartbeat(stop, gaps))
+    start = time.perf_counter()
+    results = await asyncio.gather(*(client.aretrieve_memory(f"q{i}") for i in range(LOOKUPS)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await beat
+
+    assert [r[1][0][0] for r in results] == [f"memory for q{i}" for i in range(LOOKUPS)], results
+    print("  ✓ Async lookups return the same results as the sync API")
+    worst = max(gaps) * 1000
+    print(f"  {LOOKUPS} x {LOOKUP_TIME * 1e3:.0f} ms lookups took {elapsed * 1e3:.0f} ms, worst loop stall {worst:.1f} ms")
+    assert worst < 50, f"Event loop stalled for {worst:.0f} ms"
+    print("  ✓ Event loop stays responsive during lookups")
+    assert elapsed < LOOKUP_TIME * LOOKUPS / 2, "Lookups did not run in parallel on the worker pool"
+    print("  ✓ Lookups run in parallel on the worker pool")
+
+async def test_first_use():
+    print("\n=== Testing first memory_client() use on the loop ===")
+    built_on = []
+
+    def slow_build():
+        built_on.append(threading.current_thread())
+        if len(built_on) == 1:
+            time.sleep(LOOKUP_TIME)  # Chroma client, embedder, caches, journal
+        return "memory"
+
+    stop, gaps = asyncio.Event(), []
+    beat = asyncio.create_task(heartbeat(stop, gaps))
+    with patch('nodes.memory_path', "./first-use"), patch('nodes.memory_client', side_effect=slow_build):
+        assert await nodes.amemory_client() == "memory"
+        assert await nodes.amemory_client() == "memory"
+    stop.set()
+    await beat
+    assert built_on[0] is not threading.current_thread(), "First build ran on the event loop thread"
+    assert max(gaps) * 1000 < 50, f"Event loop stalled for {max(gaps) * 1000:.0f} ms"
+    print("  ✓ The first call builds memory on a worker thread, the loop keeps ticking")
+    assert built_on[1] is threading.current_thread()
+    print("  ✓ Later calls get the built instance directly")
+
+async def main():
+    try:
+        await test_async_api()
+        await test_first_use()
+    except AssertionError as e:
+        print(f"  ✗ Assertion failed: {e}")
+        print(f"\n{'='*60}")
+        print("❌ Async memory tests failed.")
+        sys.exit(1)
+    print(f"\n{'='*60}")
+    print("✅ All async memory tests passed!")
+    sys.exit(0)
+
+if __name__ == "__main__":
+    asyncio.run(main())
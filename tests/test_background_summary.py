@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Test that summarization runs after the reply is delivered and that the
+summary is swapped in without losing messages that arrived meanwhile.
+Mocks the LLM, no Ollama required.
+"""
+import asyncio
+import sys
+import time
+sys.path.insert(0, '.')
+
+from unittest.mock import AsyncMock, MagicMock, patch
+from nodes import Agent, MemoryFilter, RagNode
+from orchestration import wire_flow
+from utils import ContextBudget
+from sessions import new_conversation_state
+
+SUMMARY_TIME = 0.3
+
+def small_budget():
+    # "message N" / "Reply to message N." turns cross 70 estimated tokens on the 5th turn
+    return ContextBudget(context_tokens=70, high_water=1.0)
+
+async def mock_stream(messages, model):
+    chunk = MagicMock()
+    chunk.message.content = f"Reply to {messages[-1]['content']}."
+    yield chunk
+
+async def slow_summary(messages, model):
+    await asyncio.sleep(SUMMARY_TIME)
+    return "Lots of messages about nothing much"
+
+async def run_turns(flow, shared, count):
+    """Runs `count` turns, returning how long the last one took."""
+    for _ in range(count):
+        shared["history"].append({"role": "user", "content": f"message {shared['loop_count']}"})
+        start = time.perf_counter()
+        await flow.run_async(shared)
+    return time.perf_counter() - start
+
+async def test_background():
+    print("=== Testing background summarization ===")
+    memory = MagicMock()
+    memory.aenqueue_memories = AsyncMock()
+    with patch('nodes.call_llm_stream', side_effect=mock_stream), \
+         patch('nodes.call_llm', side_effect=slow_summary), \
+         patch('nodes.memory_client', return_value=memory):
+        inline = wire_flow(Agent("m", "p", budget=small_budget()), MemoryFilter("m", "p", background=False), RagNode())
+        inline_time = await run_turns(inline, new_conversation_state(), 5)
+
+        flow = wire_flow(Agent("m", "p", budget=small_budget()), MemoryFilter("m", "p"), RagNode())
+        shared = new_conversation_state()
+        background_time = await run_turns(flow, shared, 5)
+        task = shared["summary_task"]
+        assert not task.done(), "Summary finished before the turn returned"
+        assert background_time < SUMMARY_TIME / 3, f"Turn took {background_time * 1e3:.0f} ms"
+        print(f"  ✓ Summarizing turn took {background_time * 1e3:.1f} ms instead of {inline_time * 1e3:.0f} ms inline")
+
+        # The user keeps talking while the summary is being written
+        await run_turns(flow, shared, 1)
+        await task
+        history = shared["history"]
+        assert history[0]["role"] == "system" and history[0]["content"].startswith("Summary of conversation so far: Lots")
+        assert [m["content"] for m in history[1:]] == ["message 5", "Reply to message 5"], history
+        assert shared["persisted_until"] + len(shared["unpersisted"]) == 10 and shared["history_version"] == 1
+        assert memory.aenqueue_memories.called
+        print("  ✓ Summary replaced only the snapshot; the mid-summary turn was kept after it")
+        print("  ✓ Summarized turns were queued for persistence")
+
+        # A history replaced mid-summary (e.g. by another summary) is left alone
+        await run_turns(flow, shared, 4)
+        task = shared["summary_task"]
+        replaced = [{"role": "system", "content": "Summary of conversation so far: elsewhere"}]
+        shared["history"], shared["history_version"] = replaced, shared["history_version"] + 1
+        await task
+        assert shared["history"] is replaced, shared["history"]
+        print("  ✓ A stale summary is discarded when the history version moved on")
+
+async def main():
+    try:
+        await test_background()
+    except AssertionError as e:
+        print(f"  ✗ Assertion failed: {e}")
+        print(f"\n{'='*60}")
+        print("❌ Background summarization tests failed.")
+        sys.exit(1)
+    print(f"\n{'='*60}")
+    print("✅ All background summarization tests passed!")
+    sys.exit(0)
+
+if __name__ == "__main__":
+    asyncio.run(main())
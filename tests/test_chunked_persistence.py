@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Test that persistence stores windowed turn chunks with metadata, in batches.
+Uses an ephemeral Chroma client and a fake embedding function, no Ollama required.
+"""
+import asyncio
+import sys
+sys.path.insert(0, '.')
+
+from unittest.mock import patch
+from memory import ChromaMemory
+from nodes import advance_persisted, queue_unpersisted
+from persistence import CHUNK_WINDOW, chunk_history
+
+class CountingEmbedding:
+    """Fake model: one dimension per keyword, records every text it embeds."""
+    KEYWORDS = ["bartholomew", "grilled", "weather", "joke"]
+
+    def __init__(self):
+        self.embedded = []
+
+    def __call__(self, texts):
+        self.embedded.extend(texts)
+        return [[float(k in text.lower()) for k in self.KEYWORDS] + [0.1] for text in texts]
+
+def conversation(exchanges):
+    topics = ["the weather", "a joke", "Bartholomew the ducky", "grilled cheese"]
+    history = []
+    for i in range(exchanges):
+        topic = topics[i % len(topics)]
+        history.append({"role": "user", "content": f"Tell me about {topic} ({i})", "timestamp": f"2025-01-01T00:{i:02d}:00"})
+        history.append({"role": "agent", "content": f"Here is something about {topic}."})
+    return history
+
+async def persist(memory, messages):
+    shared = {"unpersisted": list(messages)}
+    advance_persisted(shared, 0, await queue_unpersisted(list(messages), "session-a", 0))
+    memory.writer.flush()
+    return shared
+
+async def test_chunks():
+    print("=== Testing chunked persistence ===")
+    history = conversation(5)
+    documents, metadatas, ids = chunk_history(history, "session-a")
+    assert len(documents) == 3 and len(set(ids)) == 3, documents
+    assert len(chunk_history(history, "session-a", complete_only=True)[0]) == 2
+    assert documents[0].splitlines()[0] == "user: Tell me about the weather (0)", documents[0]
+    assert metadatas[1] == {"session": "session-a", "turn_start": 4, "turn_end": 7,
+                            "timestamp": "2025-01-01T00:03:00"}, metadatas[1]
+    assert metadatas[2]["turn_end"] == 9
+    assert all(len(d.splitlines()) <= CHUNK_WINDOW for d in documents)
+    print(f"  ✓ History is split into {CHUNK_WINDOW}-message chunks with session/turn/timestamp metadata")
+
+    fake = CountingEmbedding()
+    memory = ChromaMemory("ephemeral", embedding_function=fake)
+    with patch('nodes.memory_client', return_value=memory):
+        history = conversation(4)
+        await persist(memory, history)
+        stored = memory._collection("agent_memory").get(include=["metadatas"])
+        assert len(stored["ids"]) == 2, stored
+        assert not any(text.startswith("[{") for text in fake.embedded), "Python repr was persisted"
+        print("  ✓ Persist upserts plain-text chunks in one batch, not str(history)")
+
+        history = conversation(20)
+        await persist(memory, history)
+        assert max(len(t.splitlines()) for t in fake.embedded) <= CHUNK_WINDOW
+        print(f"  ✓ Each embedded chunk holds at most {CHUNK_WINDOW} messages")
+
+        documents, distances = memory.retrieve_memory_scored("bartholomew", n_results=1)
+        assert "Bartholomew" in documents[0] and len(documents[0].splitlines()) <= CHUNK_WINDOW, documents
+        print("  ✓ Retrieval returns the relevant slice of the conversation")
+
+async def main():
+    try:
+        await test_chunks()
+    except AssertionError as e:
+        print(f"  ✗ Assertion failed: {e}")
+        print(f"\n{'='*60}")
+        print("❌ Chunked persistence tests failed.")
+        sys.exit(1)
+    print(f"\n{'='*60}")
+    print("✅ All chunked persistence tests passed!")
+    sys.exit(0)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Test the shared Ollama client registry in utils.
+No Ollama server required - clients are created but never used for requests.
+"""
+import asyncio
+import sys
+sys.path.insert(0, '.')
+
+import utils
+
+async def check_same_loop():
+    """Clients for the same host on the same loop are reused."""
+    first = utils.get_client()
+    second = utils.get_client()
+    other_host = utils.get_client("http://127.0.0.1:11435")
+    assert first is second, "Expected the same client on the same loop"
+    assert first is not other_host, "Expected a separate client per host"
+    print("  ✓ Same loop and host reuses client")
+    print("  ✓ Different host gets its own client")
+    return first
+
+async def check_close():
+    """close_clients releases every client owned by the running loop."""
+    client = utils.get_client()
+    loop = asyncio.get_running_loop()
+    assert any(key[1] is loop for key in utils._clients)
+    await utils.close_clients()
+    assert not any(key[1] is loop for key in utils._clients), "Clients left in registry after close"
+    assert client._client.is_closed, "Underlying httpx client not closed"
+    print("  ✓ close_clients empties the registry for this loop")
+
+def main():
+    print("=== Testing shared Ollama client registry ===")
+    try:
+        loop_a = asyncio.new_event_loop()
+        client_a = loop_a.run_until_complete(check_same_loop())
+        loop_a.close()
+
+        loop_b = asyncio.new_event_loop()
+        client_b = loop_b.run_until_complete(check_same_loop())
+        assert client_a is not client_b, "Clients must not be shared across event loops"
+        print("  ✓ Each event loop gets its own client")
+        assert not any(key[1] is loop_a for key in utils._clients), "Closed loop's clients were not pruned"
+        print("  ✓ Clients of closed loops are pruned")
+        loop_b.run_until_complete(check_close())
+        loop_b.close()
+    except AssertionError as e:
+        print(f"  ✗ Assertion failed: {e}")
+        print(f"\n{'='*60}")
+        print("❌ Client registry tests failed.")
+        sys.exit(1)
+
+    print(f"\n{'='*60}")
+    print("✅ All client registry tests passed!")
+    sys.exit(0)
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,7 @@ Test command detection logic.
 import sys
 sys.path.insert(0, '.')
 
-from nodes import Agent
+from nodes import Agent, CommandDetector
 
 # Create agent instance (model doesn't matter for this test)
 agent = Agent("test-model", "test prompt")
@@ -38,6 +38,32 @@ for i, (input_text, expected) in enumerate(test_cases):
     status = "✓" if passed else "✗"
     print(f"{status} Test {i+1}: '{input_text[:30]}...' -> {result} (expected {expected})")
     
+# Streaming: (chunks, expected decision, max chunks before deciding)
+stream_cases = [
+    (["retrieve", "_memory"], True, 2),
+    (["retr", "ieve", "_mem", "ory", " and more"], True, 4),
+    (["`", "retrieve_memory", "`"], True, 2),
+    (["assistant", ":", " retrieve_memory"], True, 3),
+    (["Hello", " there", ", friend"], False, 1),
+    (["re", "member", " that?"], False, 2),
+    (["retrieved", " memories: none"], False, 2),
+    (["   ", "\n", "Sure"], False, 3),
+    ([" " * 100, "retrieve_memory"], False, 1),  # gives up on a long blank prefix
+]
+
+print("\nTesting streaming command detection...")
+for i, (chunks, expected, max_chunks) in enumerate(stream_cases):
+    detector = CommandDetector()
+    decided_at = None
+    for n, chunk in enumerate(chunks, 1):
+        if detector.feed(chunk) is not None and decided_at is None:
+            decided_at = n
+    result = detector.finish()
+    passed = result == expected and decided_at is not None and decided_at <= max_chunks
+    all_passed = all_passed and passed
+    status = "✓" if passed else "✗"
+    print(f"{status} Stream {i+1}: {chunks!r:.40} -> {result} after {decided_at} chunks (expected {expected} within {max_chunks})")
+
 print(f"\n{'='*60}")
 if all_passed:
     print("✅ All command detection tests passed!")
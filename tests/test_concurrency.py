@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Concurrency stress test: many sessions run through one shared flow at once.
+Mocks the LLM and ChromaDB so chunks of different sessions interleave without Ollama.
+"""
+import asyncio
+import random
+import sys
+sys.path.insert(0, '.')
+
+from unittest.mock import AsyncMock, MagicMock, patch
+
+SESSIONS = 50
+
+class MockSocketIO:
+    def __init__(self):
+        self.chunks = []
+
+    def emit(self, event, data=None):
+        if event == 'stream_chunk':
+            self.chunks.append(data['content'])
+
+def make_chunk(content):
+    chunk = MagicMock()
+    chunk.message.content = content
+    return chunk
+
+async def mock_stream(messages, model):
+    """Streams an answer naming the session, asking for memory first when the user says 'remember'."""
+    user = [m for m in messages if m['role'] == 'user'][-1]['content']
+    has_memory = any("Memory about '" in m['content'] for m in messages if m['role'] == 'system')
+    if 'remember' in user and not has_memory:
+        pieces = ["retrieve", "_memory"]
+    else:
+        pieces = ["Answer ", "for ", f"{user.split()[0]}, ", "with ", "plenty ", "of ", "tokens."]
+    for piece in pieces:
+        # Random yields force the sessions' streams to interleave
+        await asyncio.sleep(random.random() / 1000)
+        yield make_chunk(piece)
+
+async def run_session(flow, index):
+    name = f"session{index}"
+    wants_memory = index % 2 == 0
+    socketio = MockSocketIO()
+    shared = {
+        "history": [{"role": "user", "content": f"{name} {'remember' if wants_memory else 'hello'}"}],
+        "loop_count": 0,
+        "socketio": socketio,
+    }
+    await flow.run_async(shared)
+    return name, wants_memory, shared, socketio
+
+async def test_concurrent_flows():
+    print(f"=== Stress test: {SESSIONS} concurrent sessions on one flow ===")
+    memory = MagicMock()
+    memory.aretrieve_memory_scored = AsyncMock(side_effect=lambda query, n_results=1: ([f"memory for {query.split()[0]}"], [0.4]))
+
+    with patch('nodes.call_llm_stream', side_effect=mock_stream), \
+         patch('memory.ChromaMemory', return_value=memory):
+        from orchestration import my_async_flow
+        results = await asyncio.wait_for(
+            asyncio.gather(*(run_session(my_async_flow, i) for i in range(SESSIONS))),
+            timeout=30.0,
+        )
+
+    for name, wants_memory, shared, socketio in results:
+        expected = f"Answer for {name}, with plenty of tokens"
+        agent_msgs = [m['content'] for m in shared['history'] if m['role'] == 'agent']
+        assert agent_msgs == [expected], f"{name}: wrong history {agent_msgs}"
+        streamed = ''.join(socketio.chunks)
+        assert streamed == expected + ".", f"{name}: wrong stream {streamed!r}"
+        assert shared['loop_count'] == 1, f"{name}: loop_count {shared['loop_count']}"
+    print("  ✓ Every session got exactly its own answer in history")
+    print("  ✓ Every session's stream only contains its own tokens")
+
+    retrieved = sum(1 for _, wants, _, _ in results if wants)
+    assert memory.aretrieve_memory_scored.call_count == retrieved, memory.aretrieve_memory_scored.call_count
+    print(f"  ✓ {retrieved} retrieval turns ran without suppressing other sessions' output")
+
+async def test_build_flow():
+    print("\n=== build_flow gives independent graphs ===")
+    from orchestration import build_flow
+    first, second = build_flow(), build_flow()
+    assert first.start_node is not second.start_node
+    assert first.start_node.successors['retrieve_memory'] is not second.start_node.successors['retrieve_memory']
+    print("  ✓ Each built flow has its own node instances")
+
+async def main():
+    try:
+        await test_concurrent_flows()
+        await test_build_flow()
+    except (AssertionError, asyncio.TimeoutError) as e:
+        print(f"  ✗ Failed: {e!r}")
+        print(f"\n{'='*60}")
+        print("❌ Concurrency tests failed.")
+        sys.exit(1)
+    print(f"\n{'='*60}")
+    print("✅ All concurrency tests passed!")
+    sys.exit(0)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Test token-budget-driven history management: compression is triggered by the
+estimated prompt size, not by loop counts, and the prompt size is exposed per turn.
+Mocks the LLM, no Ollama required.
+"""
+import asyncio
+import sys
+sys.path.insert(0, '.')
+
+from unittest.mock import MagicMock, patch
+from nodes import Agent
+from utils import ContextBudget
+
+def make_stream(reply, prompt_eval_count=None):
+    async def stream(messages, model):
+        chunk = MagicMock()
+        chunk.message.content = reply
+        chunk.done = False
+        yield chunk
+        final = MagicMock()
+        final.message.content = ""
+        final.done = True
+        final.prompt_eval_count = prompt_eval_count
+        yield final
+    return stream
+
+async def turn(agent, shared, text):
+    shared["history"].append({"role": "user", "content": text})
+    return await agent._run_async(shared)
+
+def test_budget():
+    print("=== Testing ContextBudget ===")
+    budget = ContextBudget(context_tokens=1000, high_water=0.5)
+    assert budget.limit == 500
+    short = [{"role": "user", "content": "hi"}]
+    long = [{"role": "user", "content": "x" * 4000}]
+    assert budget.estimate(long) > budget.estimate(short) and not budget.over(short) and budget.over(long)
+    print("  ✓ Estimates grow with content and the high-water mark splits short from long")
+
+    budget.calibrate(long, 2000)  # a tokenizer that packs 2 chars per token
+    assert 3.0 < budget.chars_per_token < 4.0, budget.chars_per_token
+    ratio = budget.chars_per_token
+    budget.calibrate(long, 10)  # e.g. only the uncached tail of the prompt was evaluated
+    budget.calibrate(long, None)
+    assert budget.chars_per_token == ratio
+    print("  ✓ Calibrates chars/token from Ollama counts, ignoring implausible ones")
+
+async def test_agent():
+    print("\n=== Testing Agent compression trigger ===")
+    agent = Agent("m", "You are Anemone.", budget=ContextBudget(context_tokens=400, high_water=0.75))
+    shared = {"history": [], "loop_count": 0}
+    with patch('nodes.call_llm_stream', side_effect=make_stream("Hello there!")):
+        actions = [await turn(agent, shared, "hey") for _ in range(10)]
+    assert actions == [None] * 10, actions
+    assert 0 < shared["prompt_tokens"] < 300, shared["prompt_tokens"]
+    print(f"  ✓ Ten short greetings: no summarization (prompt ~{shared['prompt_tokens']} tokens)")
+
+    with patch('nodes.call_llm_stream', side_effect=make_stream("That's a lot of text.")):
+        action = await turn(agent, shared, "Please read this: " + "lorem ipsum " * 100)
+    assert action == "persist" and shared["memory_action"] == "persist", action
+    print(f"  ✓ One long paste crosses the {agent.budget.limit}-token high-water mark and triggers compression")
+
+    messages = agent._build_messages(shared["history"], None, None)
+    calibrated = Agent("m", "You are Anemone.")
+    with patch('nodes.call_llm_stream', side_effect=make_stream("ok", prompt_eval_count=calibrated.budget.estimate(messages) * 2)):
+        await calibrated.exec_async((shared["history"], None, None, None))
+    assert calibrated.budget.chars_per_token < 4.0
+    print("  ✓ The Agent calibrates its budget from the final chunk's prompt_eval_count")
+
+async def main():
+    try:
+        test_budget()
+        await test_agent()
+    except AssertionError as e:
+        print(f"  ✗ Assertion failed: {e}")
+        print(f"\n{'='*60}")
+        print("❌ Context budget tests failed.")
+        sys.exit(1)
+    print(f"\n{'='*60}")
+    print("✅ All context budget tests passed!")
+    sys.exit(0)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Test the persistent content-hash embedding cache used by ChromaMemory and seed_memory.py.
+Uses a counting fake embedding function and an ephemeral Chroma client, no model download required.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+sys.path.insert(0, '.')
+
+from embedding_cache import CachedEmbedder, EmbeddingCache, model_id
+from memory import ChromaMemory
+
+class CountingEmbedding:
+    """Deterministic fake model that records every text it embeds."""
+
+    def __init__(self, model="fake-model"):
+        self.model = model
+        self.embedded = []
+
+    def __call__(self, texts):
+        self.embedded.extend(texts)
+        return [[float(len(text)), float(sum(map(ord, text)) % 97), 1.0] for text in texts]
+
+    def name(self):
+        return "counting"
+
+    def get_config(self):
+        return {"model": self.model}
+
+async def test_embedding_cache(tmp):
+    print("=== Testing embedding cache ===")
+    path = os.path.join(tmp, "embeddings.sqlite3")
+    fake = CountingEmbedding()
+    memory = ChromaMemory("ephemeral", embedding_function=fake, embedding_cache_path=path)
+
+    memory.save_memory("Bartholomew is a missing rubber ducky.")
+    memory.save_memory("Bartholomew is a missing rubber ducky.")
+    assert fake.embedded == ["Bartholomew is a missing rubber ducky."], fake.embedded
+    print("  ✓ Saving the same text twice embeds it once")
+
+    query, retrieved = memory.retrieve_memory("Bartholomew is a missing rubber ducky.")
+    assert retrieved == [["Bartholomew is a missing rubber ducky."]], retrieved
+    memory.cache.bump("agent_memory")  # force a real vector search
+    await memory.aretrieve_memory_scored("Bartholomew is a missing rubber ducky.")
+    assert len(fake.embedded) == 1, fake.embedded
+    print("  ✓ Queries reuse the vectors computed for persisted text")
+
+    embedder = CachedEmbedder(fake, EmbeddingCache(path))
+    vectors = embedder(["new text", "new text", "Bartholomew is a missing rubber ducky."])
+    assert fake.embedded[1:] == ["new text"] and len(vectors) == 3
+    assert list(vectors[0]) == list(vectors[1])
+    print("  ✓ Duplicates within a batch are embedded once")
+
+    reopened = CachedEmbedder(CountingEmbedding(), EmbeddingCache(path))
+    reopened(["new text", "Bartholomew is a missing rubber ducky."])
+    assert reopened.embedding_function.embedded == [], reopened.embedding_function.embedded
+    assert reopened.stats()["hit_rate"] == 1.0
+    print("  ✓ Cache survives reopening the file (e.g. re-running seed_memory.py)")
+
+    other_model = CachedEmbedder(CountingEmbedding("other-model"), EmbeddingCache(path))
+    other_model(["new text"])
+    assert other_model.embedding_function.embedded == ["new text"]
+    assert model_id(fake) != model_id(other_model.embedding_function)
+    print("  ✓ Vectors are keyed by embedding model id")
+
+    stats = memory.embedder.stats()
+    print(f"  Embedding cache: {stats['hits']} hits, {stats['misses']} misses, hit rate {stats['hit_rate']:.0%}")
+    assert stats["misses"] == 1 and stats["hits"] == 3, stats
+
+async def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            await test_embedding_cache(tmp)
+        except AssertionError as e:
+            print(f"  ✗ Assertion failed: {e}")
+            print(f"\n{'='*60}")
+            print("❌ Embedding cache tests failed.")
+            sys.exit(1)
+    print(f"\n{'='*60}")
+    print("✅ All embedding cache tests passed!")
+    sys.exit(0)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -25,6 +25,11 @@ async def test_memory_retrieval_flow():
             [["Origin Story: My name, Anemone, was chosen because I am beautiful, mysterious, and have a surprisingly potent sting if you try to debug my code without proper authorization."]]
         )
         mock_memory_instance.save_memory = MagicMock()
+        # Nodes use ChromaMemory's async API, route it to the sync mocks above
+        mock_memory_instance.aretrieve_memory = AsyncMock(side_effect=mock_memory_instance.retrieve_memory)
+        mock_memory_instance.aretrieve_memory_scored = AsyncMock(
+            side_effect=lambda query, n_results=1: (mock_memory_instance.retrieve_memory.return_value[1][0], [0.3]))
+        mock_memory_instance.asave_memory = AsyncMock(side_effect=mock_memory_instance.save_memory)
         
         # Track calls to see flow
         calls = []
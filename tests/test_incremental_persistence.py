@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Test incremental persistence: a long conversation through the flow only ever
+embeds and stores new turns, with content-derived ids and a per-session high-water mark.
+Mocks the LLM, uses an ephemeral Chroma client with a fake embedding function.
+"""
+import asyncio
+import sys
+import time
+sys.path.insert(0, '.')
+
+from unittest.mock import MagicMock, patch
+from memory import ChromaMemory
+from nodes import Agent, MemoryFilter, RagNode, flush_unpersisted
+from orchestration import wire_flow
+from persistence import CHUNK_WINDOW, chunk_history
+from sessions import new_conversation_state
+from utils import ContextBudget
+
+TURNS = 200
+
+class CountingEmbedding:
+    def __init__(self):
+        self.embedded = []
+
+    def __call__(self, texts):
+        self.embedded.extend(texts)
+        return [[float(len(text) % 13), float(text.count("e")), 1.0] for text in texts]
+
+async def mock_stream(messages, model):
+    chunk = MagicMock()
+    chunk.message.content = f"Reply to {messages[-1]['content']}."
+    yield chunk
+
+async def mock_summary(messages, model):
+    return f"Summary of {len(messages) - 1} messages"
+
+async def test_incremental():
+    print(f"=== Incremental persistence over {TURNS} turns ===")
+    fake = CountingEmbedding()
+    memory = ChromaMemory("ephemeral", embedding_function=fake)
+    persists = []
+    save = memory.save_memories
+
+    def timed_save(documents, **kwargs):
+        start = time.perf_counter()
+        save(documents, **kwargs)
+        persists.append((len(documents), time.perf_counter() - start))
+
+    memory.save_memories = timed_save
+    # Store each persist as its own batch, to measure them one by one
+    memory.writer.flush_interval = 0
+    agent = Agent("test-model", "test prompt", budget=ContextBudget(context_tokens=300, high_water=1.0))
+    flow = wire_flow(agent, MemoryFilter("test-model", "test prompt", background=False), RagNode())
+    shared = new_conversation_state()
+    with patch('nodes.call_llm_stream', side_effect=mock_stream), \
+         patch('nodes.call_llm', side_effect=mock_summary), \
+         patch('nodes.memory_client', return_value=memory):
+        for turn in range(TURNS):
+            shared["history"].append({"role": "user", "content": f"message {turn}"})
+            await flow.run_async(shared)
+            memory.writer.flush()
+
+    collection = memory._collection("agent_memory")
+    stored = collection.count()
+    assert persists, "Nothing was persisted"
+    assert stored * CHUNK_WINDOW == shared["persisted_until"], (stored, shared["persisted_until"])
+    assert len(fake.embedded) == stored, f"{len(fake.embedded)} embeddings for {stored} chunks"
+    print(f"  ✓ {stored} chunks stored for {shared['persisted_until']} messages, each embedded exactly once")
+
+    turn_starts = sorted(m["turn_start"] for m in collection.get(include=["metadatas"])["metadatas"])
+    assert turn_starts == list(range(0, shared["persisted_until"], CHUNK_WINDOW)), turn_starts[:10]
+    assert len(shared["unpersisted"]) < 2 * CHUNK_WINDOW + 2, len(shared["unpersisted"])
+    print("  ✓ High-water mark advances without gaps or overlaps; backlog stays small")
+
+    sizes = [size for size, _ in persists]
+    half = len(sizes) // 2
+    assert max(sizes[half:]) <= max(sizes[:half]), sizes
+    first, last = persists[1:4], persists[-3:]
+    mean = lambda xs: sum(latency for _, latency in xs) / len(xs)
+    print(f"  ✓ Chunks per persist stay flat ({min(sizes)}-{max(sizes)}); "
+          f"latency {mean(first) * 1e3:.1f} ms early vs {mean(last) * 1e3:.1f} ms late")
+
+    documents, metadatas, ids = chunk_history(shared["unpersisted"] + shared["history"], shared["session_id"])
+    save(documents, metadatas=metadatas, ids=ids)
+    save(documents, metadatas=metadatas, ids=ids)
+    assert collection.count() == stored + len(documents)
+    print("  ✓ Upserting the same chunks again does not duplicate them")
+    return memory
+
+async def test_closing(memory):
+    print("\n=== A closing conversation keeps its partial window ===")
+    collection = memory._collection("agent_memory")
+    before = collection.count()
+    messages = [{"role": "user" if i % 2 == 0 else "agent", "content": f"closing message {i}"}
+                for i in range(CHUNK_WINDOW + 2)]
+    with patch('nodes.memory_client', return_value=memory):
+        for _ in range(2):
+            shared = new_conversation_state()
+            shared["session_id"], shared["unpersisted"] = "closing", list(messages)
+            await flush_unpersisted(shared)
+            memory.writer.flush()
+            assert shared["unpersisted"] == [] and shared["persisted_until"] == len(messages), shared
+    assert collection.count() == before + 2, collection.count() - before
+    print("  ✓ The full window and the trailing partial one are both stored, once, however often flushed")
+
+async def main():
+    try:
+        memory = await test_incremental()
+        await test_closing(memory)
+    except AssertionError as e:
+        print(f"  ✗ Assertion failed: {e}")
+        print(f"\n{'='*60}")
+        print("❌ Incremental persistence tests failed.")
+        sys.exit(1)
+    print(f"\n{'='*60}")
+    print("✅ All incremental persistence tests passed!")
+    sys.exit(0)
+
+if __name__ == "__main__":
+    asyncio.run(main())
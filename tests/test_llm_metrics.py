@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Test per-call Ollama inference metrics (TTFT, prompt eval, tokens/s, load time)
+and the per-turn summary emitted as turn_metrics. Uses a fake Ollama client
+whose final chunk carries Ollama's timing fields, no Ollama required.
+"""
+import asyncio
+import sys
+sys.path.insert(0, '.')
+
+from unittest.mock import AsyncMock, patch
+from metrics import REGISTRY, llm_calls
+from nodes import Agent, MemoryFilter, RagNode
+from orchestration import wire_flow
+from utils import call_llm
+
+MS = 1_000_000  # Ollama durations are in nanoseconds
+
+class FakeOllama:
+    def __init__(self, replies, ttft=0.05):
+        self.replies = list(replies)
+        self.ttft = ttft
+
+    async def chat(self, model, messages, stream=False, keep_alive=None):
+        reply = self.replies.pop(0)
+        final = {"message": {"role": "assistant", "content": ""}, "done": True,
+                 "prompt_eval_count": 120, "prompt_eval_duration": 60 * MS,
+                 "eval_count": 40, "eval_duration": 800 * MS, "load_duration": 5 * MS}
+        if not stream:
+            return dict(final, message={"role": "assistant", "content": reply})
+        ttft = self.ttft
+
+        async def chunks():
+            await asyncio.sleep(ttft)
+            for word in reply.split(" "):
+                yield {"message": {"role": "assistant", "content": word + " "}, "done": False}
+            yield final
+
+        class Stream:
+            def __aiter__(self):
+                return chunks()
+
+            async def aclose(self):
+                pass
+        return Stream()
+
+class MockSocketIO:
+    def __init__(self):
+        self.emits = []
+
+    def emit(self, event, data=None, to=None):
+        self.emits.append((event, data))
+
+def new_flow():
+    return wire_flow(Agent("m", "You are Anemone."), MemoryFilter("m", "Summarize.", background=False), RagNode())
+
+async def test_turn_metrics():
+    print("=== Testing turn_metrics for a plain turn ===")
+    socketio = MockSocketIO()
+    shared = {"history": [{"role": "user", "content": "hello"}], "loop_count": 0, "socketio": socketio}
+    with patch('utils.get_client', return_value=FakeOllama(["Hi there, nice to meet you."])):
+        await new_flow().run_async(shared)
+    summaries = [data for event, data in socketio.emits if event == 'turn_metrics']
+    assert len(summaries) == 1 and summaries[0] is shared["turn_metrics"], socketio.emits
+    summary = summaries[0]
+    call, = summary["llm_calls"]
+    assert call["done"] and call["model"] == "m"
+    assert call["prompt_eval_count"] == 120 and call["prompt_eval_ms"] == 60 and call["load_ms"] == 5
+    assert summary["eval_tokens"] == 40 and summary["tokens_per_second"] == 50.0, summary
+    assert 50 <= summary["ttft_ms"] < 500, summary["ttft_ms"]
+    assert summary["ttft_ms"] <= summary["first_chunk_ms"] <= summary["turn_ms"], summary
+    assert set(summary["nodes"]["Agent"]) == {"prep", "exec", "post"} and summary["hops"] == 1
+    print(f"  ✓ TTFT {summary['ttft_ms']:.0f} ms, first chunk emitted at {summary['first_chunk_ms']:.0f} ms, "
+          f"{summary['tokens_per_second']:.0f} tok/s, 120 prompt tokens in 60 ms")
+
+async def test_retrieve_turn():
+    print("\n=== Testing a retrieve turn ===")
+    socketio = MockSocketIO()
+    shared = {"history": [{"role": "user", "content": "Who is Bartholomew?"}], "loop_count": 0, "socketio": socketio}
+    aborted = llm_calls.value(model="m", outcome="aborted")
+    fake = FakeOllama(["retrieve_memory please", "Bartholomew is your cat."])
+    with patch('utils.get_client', return_value=fake), \
+         patch('nodes.retrieve_memory_text', AsyncMock(return_value={"query": "Who is Bartholomew?",
+                                                                     "memory_text": "Bartholomew is a cat."})):
+        await new_flow().run_async(shared)
+    summary = shared["turn_metrics"]
+    assert [call["done"] for call in summary["llm_calls"]] == [False, True], summary["llm_calls"]
+    assert llm_calls.value(model="m", outcome="aborted") == aborted + 1
+    assert summary["eval_tokens"] == 40 and summary["hops"] == 3, summary
+    assert summary["first_chunk_ms"] > summary["llm_calls"][0]["total_ms"]
+    print("  ✓ The command stream is recorded as aborted; only the answering call counts towards tokens/s")
+
+async def test_call_llm():
+    print("\n=== Testing non-streaming calls ===")
+    done = llm_calls.value(model="summarizer", outcome="done")
+    with patch('utils.get_client', return_value=FakeOllama(["A summary."])):
+        assert await call_llm([{"role": "user", "content": "Summarize."}], "summarizer") == "A summary."
+    assert llm_calls.value(model="summarizer", outcome="done") == done + 1
+    text = REGISTRY.render()
+    for name in ('anemone_llm_tokens_per_second_count{model="summarizer"}',
+                 'anemone_llm_prompt_tokens_total{model="summarizer"}',
+                 'anemone_llm_ttft_seconds_count{model="m"}', "anemone_turn_first_chunk_seconds_count"):
+        assert name in text, f"{name} missing from /metrics"
+    print("  ✓ call_llm is recorded too, and everything is exported on the metrics surface")
+
+async def main():
+    try:
+        await test_turn_metrics()
+        await test_retrieve_turn()
+        await test_call_llm()
+    except AssertionError as e:
+        print(f"  ✗ Assertion failed: {e}")
+        print(f"\n{'='*60}")
+        print("❌ LLM metrics tests failed.")
+        sys.exit(1)
+    print(f"\n{'='*60}")
+    print("✅ All LLM metrics tests passed!")
+    sys.exit(0)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Test the structured logging layer: per-chunk debug output costs nothing when
+disabled and is sampled when enabled, repeated debug lines are rate limited,
+and the JSON format carries extra fields. Mocks the LLM, no Ollama required.
+"""
+import asyncio
+import io
+import json
+import logging
+import sys
+sys.path.insert(0, '.')
+
+from unittest.mock import patch
+from logs import JsonFormatter, RateLimitFilter, TextFormatter
+from nodes import Agent
+
+class Chunk:
+    """A stream chunk that counts how often it is formatted for a log line."""
+    formatted = 0
+
+    def __init__(self, content):
+        self.message = type("Message", (), {"content": content})()
+        self.done = False
+
+    def __repr__(self):
+        Chunk.formatted += 1
+        return f"Chunk({self.message.content!r})"
+
+async def stream(messages, model):
+    for n in range(500):
+        yield Chunk(f"word{n} ")
+
+class Capture(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.DEBUG)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+async def run_agent(level):
+    capture = Capture()
+    root = logging.getLogger()
+    root.addHandler(capture)
+    previous = root.level
+    root.setLevel(level)
+    Chunk.formatted = 0
+    try:
+        with patch('nodes.call_llm_stream', side_effect=stream):
+            await Agent("m", "You are Anemone.").exec_async(([{"role": "user", "content": "hi"}], None, None, None))
+    finally:
+        root.removeHandler(capture)
+        root.setLevel(previous)
+    return [r for r in capture.records if r.name == "nodes" and r.msg.startswith("Received chunk")]
+
+async def test_sampling():
+    print("=== Testing per-chunk debug output ===")
+    records = await run_agent(logging.INFO)
+    assert records == [] and Chunk.formatted == 0, (len(records), Chunk.formatted)
+    print("  ✓ With debug off, 500 chunks produce no records and no chunk is ever formatted")
+
+    records = await run_agent(logging.DEBUG)
+    assert len(records) == 10 and all(r.sampled == 50 for r in records), len(records)
+    print(f"  ✓ With debug on, per-chunk lines are sampled: {len(records)} records for 500 chunks")
+
+def test_rate_limit():
+    print("\n=== Testing rate-limited debug ===")
+    limit = RateLimitFilter(burst=5, interval=60.0)
+    logger = logging.getLogger("test_logging")
+    make = lambda level, n: logger.makeRecord(logger.name, level, __file__, 0, "retrying %d", (n,), None)
+    passed = [limit.filter(make(logging.DEBUG, n)) for n in range(100)]
+    assert sum(passed) == 5, sum(passed)
+    assert limit.filter(make(logging.WARNING, 0)), "Warnings are never dropped"
+    limit._windows[(logger.name, "retrying %d")][0] -= 60.0  # next window
+    record = make(logging.DEBUG, 100)
+    assert limit.filter(record) and record.dropped == 95
+    print("  ✓ 5 of 100 identical debug lines pass per window; the next one reports 95 dropped")
+
+    line = TextFormatter().format(record)
+    assert line.endswith("retrying 100 (95 similar dropped)"), line
+    assert not TextFormatter().format(make(logging.DEBUG, 101)).endswith("dropped)")
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "retrying 100" and entry["dropped"] == 95, entry
+    print("  ✓ The drop count shows in both the text and JSON formats")
+
+def test_json():
+    print("\n=== Testing JSON format ===")
+    out = io.StringIO()
+    handler = logging.StreamHandler(out)
+    handler.setFormatter(JsonFormatter())
+    logger = logging.getLogger("test_logging.json")
+    logger.addHandler(handler)
+    logger.propagate = False
+    logger.warning("Queued %d new chunks", 3, extra={"session": "abc"})
+    entry = json.loads(out.getvalue())
+    assert entry["message"] == "Queued 3 new chunks" and entry["level"] == "WARNING", entry
+    assert entry["logger"] == "test_logging.json" and entry["session"] == "abc", entry
+    print("  ✓ One JSON object per line with level, logger, message and extra fields")
+
+async def main():
+    try:
+        await test_sampling()
+        test_rate_limit()
+        test_json()
+    except AssertionError as e:
+        print(f"  ✗ Assertion failed: {e}")
+        print(f"\n{'='*60}")
+        print("❌ Logging tests failed.")
+        sys.exit(1)
+    print(f"\n{'='*60}")
+    print("✅ All logging tests passed!")
+    sys.exit(0)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Test top-k retrieval with a distance cutoff and token-budget packing of memories.
+Mocks ChromaDB, no Ollama required.
+"""
+import asyncio
+import sys
+sys.path.insert(0, '.')
+
+from unittest.mock import AsyncMock, MagicMock, patch
+import nodes
+from nodes import NO_RELEVANT_MEMORY, RagNode, pack_memories, retrieve_memory_text
+from utils import estimate_tokens
+
+DUCKY = "Bartholomew is my missing rubber ducky."
+GRILLED = "My secondary function is finding the ultimate grilled cheese recipe."
+JOKE = "Why don't scientists trust atoms? Because they make up everything!"
+
+def test_pack():
+    print("=== Testing pack_memories ===")
+    packed = pack_memories([JOKE, DUCKY, "  bartholomew is my MISSING rubber ducky. ", GRILLED],
+                           [1.9, 0.3, 0.35, 0.8], max_distance=1.2, token_budget=300)
+    assert packed == [DUCKY, GRILLED], packed
+    print("  ✓ Closest first, far memories dropped, duplicates removed")
+
+    budget = estimate_tokens(DUCKY) + 2
+    assert pack_memories([DUCKY, GRILLED], [0.3, 0.8], 1.2, budget) == [DUCKY]
+    print("  ✓ Memories that would overflow the token budget are left out")
+
+    long_memory = "x" * 4000
+    packed = pack_memories([long_memory], [0.1], 1.2, 50)
+    assert packed == ["x" * 200], len(packed[0])
+    print("  ✓ An oversized best match is truncated to the budget, not dropped")
+
+    assert pack_memories([JOKE], [1.9], 1.2, 300) == []
+    assert pack_memories([], [], 1.2, 300) == []
+    print("  ✓ Nothing relevant packs to nothing")
+
+async def test_retrieve():
+    print("\n=== Testing retrieve_memory_text ===")
+    memory = MagicMock()
+    with patch('memory.ChromaMemory', return_value=memory):
+        memory.aretrieve_memory_scored = AsyncMock(return_value=([DUCKY, GRILLED, JOKE], [0.3, 0.8, 1.9]))
+        result = await retrieve_memory_text("Who is Bartholomew?")
+        assert result == {"query": "Who is Bartholomew?", "memory_text": f"{DUCKY}\n\n{GRILLED}"}, result
+        assert memory.aretrieve_memory_scored.call_args.kwargs["n_results"] == nodes.memory_top_k
+        print(f"  ✓ Fetches top-{nodes.memory_top_k} and keeps relevant hits beyond the first")
+
+        memory.aretrieve_memory_scored = AsyncMock(return_value=([JOKE, GRILLED], [1.9, 1.6]))
+        result = await retrieve_memory_text("What's 2 + 2?")
+        assert result["memory_text"] == NO_RELEVANT_MEMORY, result
+        before = estimate_tokens(JOKE)
+        after = estimate_tokens(result["memory_text"])
+        print(f"  ✓ Irrelevant memories are not injected ({before} -> {after} memory tokens)")
+
+    with patch('nodes.memory_client', side_effect=ValueError("ChromaMemory already exists with different options")):
+        result = await retrieve_memory_text("Who is Bartholomew?")
+    assert result == {"query": "", "memory_text": "Memory database not available."}, result
+    print("  ✓ A memory client that can't be built is reported as memory text, not raised")
+
+async def test_notification():
+    print("\n=== Testing the memory_retrieved notification ===")
+    for memory_text, expected in ((NO_RELEVANT_MEMORY, 0), (DUCKY, 1)):
+        socketio = MagicMock()
+        shared = {"socketio": socketio, "memory_action": "retrieve"}
+        await RagNode().post_async(shared, ([], "retrieve", None), {"query": "q", "memory_text": memory_text})
+        emitted = [c for c in socketio.emit.call_args_list if c.args[0] == "memory_retrieved"]
+        assert len(emitted) == expected and shared["retrieved_memory"] == memory_text, emitted
+    print("  ✓ No retrieved-memory card when nothing relevant was found, one when something was")
+
+async def main():
+    try:
+        test_pack()
+        await test_retrieve()
+        await test_notification()
+    except AssertionError as e:
+        print(f"  ✗ Assertion failed: {e}")
+        print(f"\n{'='*60}")
+        print("❌ Memory packing tests failed.")
+        sys.exit(1)
+    print(f"\n{'='*60}")
+    print("✅ All memory packing tests passed!")
+    sys.exit(0)
+
+if __name__ == "__main__":
+    asyncio.run(main())
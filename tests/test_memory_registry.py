@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Test the ChromaMemory registry and cached collection handles.
+Uses temporary persistent stores, no embedding model required.
+"""
+import sys
+import tempfile
+import threading
+sys.path.insert(0, '.')
+
+from memory import ChromaMemory
+
+def main():
+    print("=== Testing ChromaMemory registry ===")
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            first = ChromaMemory("persistent", memory_path=f"{tmp}/a")
+            again = ChromaMemory("persistent", memory_path=f"{tmp}/../{tmp.rsplit('/', 1)[1]}/a")
+            other = ChromaMemory("persistent", memory_path=f"{tmp}/b")
+            assert first is again, "Same store should give the same instance"
+            print("  ✓ Same configuration returns the same instance")
+            assert first is not other and first.client is not other.client
+            print("  ✓ A different memory_path gets its own client (no longer silently ignored)")
+
+            assert ChromaMemory("persistent", memory_path=f"{tmp}/a", cache_size=256) is first
+            try:
+                ChromaMemory("persistent", memory_path=f"{tmp}/a", cache_size=8)
+            except ValueError as e:
+                assert "cache_size=8" in str(e), e
+            else:
+                raise AssertionError("A conflicting cache_size returned the registered instance")
+            print("  ✓ Options matching the registered instance are accepted, conflicting ones raise")
+
+            # Concurrent first construction must build exactly one instance
+            seen, barrier = [], threading.Barrier(8)
+            def construct():
+                barrier.wait()
+                seen.append(ChromaMemory("persistent", memory_path=f"{tmp}/c"))
+            threads = [threading.Thread(target=construct) for _ in range(8)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            assert len({id(m) for m in seen}) == 1, "Concurrent construction built several instances"
+            print("  ✓ Concurrent construction is thread-safe")
+
+            calls = []
+            original = first.client.get_or_create_collection
+            first.client.get_or_create_collection = lambda name: calls.append(name) or original(name)
+            handles = {id(first._collection("agent_memory")) for _ in range(100)}
+            assert len(handles) == 1 and calls == ["agent_memory"], calls
+            print("  ✓ Collection handle fetched once and reused")
+    except AssertionError as e:
+        print(f"  ✗ Assertion failed: {e}")
+        print(f"\n{'='*60}")
+        print("❌ Registry tests failed.")
+        sys.exit(1)
+
+    print(f"\n{'='*60}")
+    print("✅ All registry tests passed!")
+    sys.exit(0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Test the embedding-based pre-router in front of the Agent.
+Mocks ChromaDB distances and the LLM, no Ollama required.
+"""
+import asyncio
+import sys
+sys.path.insert(0, '.')
+
+from unittest.mock import AsyncMock, MagicMock, patch
+from nodes import Agent, MemoryFilter, MemoryRouter, RagNode
+from orchestration import wire_flow
+
+llm_calls = []
+
+async def mock_stream(messages, model):
+    llm_calls.append(messages)
+    has_memory = any("Memory about '" in m['content'] for m in messages if m['role'] == 'system')
+    chunk = MagicMock()
+    chunk.message.content = "Bartholomew is my rubber ducky." if has_memory else "retrieve_memory"
+    yield chunk
+
+def scored(query, n_results=1):
+    distance = 0.4 if "Bartholomew" in query else 1.6
+    return ["Bartholomew is a missing rubber ducky."], [distance]
+
+async def run(query):
+    llm_calls.clear()
+    flow = wire_flow(Agent("test-model", "test prompt"), MemoryFilter("test-model", "test prompt"),
+                     RagNode(), MemoryRouter(threshold=1.0))
+    shared = {"history": [{"role": "user", "content": query}], "loop_count": 0}
+    await flow.run_async(shared)
+    return shared
+
+async def test_router():
+    print("=== Testing MemoryRouter ===")
+    memory = MagicMock()
+    memory.aretrieve_memory_scored = AsyncMock(side_effect=scored)
+    with patch('nodes.call_llm_stream', side_effect=mock_stream), \
+         patch('memory.ChromaMemory', return_value=memory):
+        shared = await run("Who is Bartholomew?")
+        assert shared['routing']['retrieve'] and shared['routing']['distance'] == 0.4, shared['routing']
+        assert len(llm_calls) == 1, f"Memory turn took {len(llm_calls)} generations"
+        assert shared['history'][-1]['content'] == "Bartholomew is my rubber ducky"
+        assert memory.aretrieve_memory_scored.call_count == 1, "RagNode queried again after routing"
+        print("  ✓ Close match routes to memory, answered in one LLM generation")
+        print(f"  Routing decision took {shared['routing']['latency_ms']:.2f} ms")
+
+        shared = await run("What's 2 + 2?")
+        assert not shared['routing']['retrieve'], shared['routing']
+        assert len(llm_calls) == 2 and memory.aretrieve_memory_scored.call_count == 3
+        print("  ✓ Far match leaves the decision to the Agent (retrieve_memory still works)")
+
+    with patch('nodes.call_llm_stream', side_effect=mock_stream), \
+         patch('memory.ChromaMemory', side_effect=RuntimeError("chroma down")):
+        router = MemoryRouter(threshold=1.0)
+        shared = {"history": [{"role": "user", "content": "Who is Bartholomew?"}]}
+        await router._run_async(shared)
+        assert "routing" not in shared and not shared.get("retrieved_memory")
+        print("  ✓ Router failures fall back to the normal flow")
+
+async def main():
+    try:
+        await test_router()
+    except AssertionError as e:
+        print(f"  ✗ Assertion failed: {e}")
+        print(f"\n{'='*60}")
+        print("❌ Memory router tests failed.")
+        sys.exit(1)
+    print(f"\n{'='*60}")
+    print("✅ All memory router tests passed!")
+    sys.exit(0)
+
+if __name__ == "__main__":
+    asyncio.run(main())
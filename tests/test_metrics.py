@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Test per-node timing spans, turn spans and the Prometheus /metrics endpoint.
+Mocks the LLM and memory, no Ollama required.
+"""
+import asyncio
+import sys
+sys.path.insert(0, '.')
+
+from unittest.mock import AsyncMock, MagicMock, patch
+from memory import ChromaMemory
+from metrics import Registry, node_seconds, turn_hops, turn_seconds
+from nodes import Agent, MemoryFilter, RagNode
+from orchestration import wire_flow
+
+def make_stream(*replies):
+    replies = list(replies)
+
+    async def stream(messages, model):
+        await asyncio.sleep(0.01)
+        chunk = MagicMock()
+        chunk.message.content = replies.pop(0)
+        yield chunk
+    return stream
+
+def test_registry():
+    print("=== Testing Prometheus text format ===")
+    registry = Registry()
+    requests = registry.counter("demo_requests_total", "Requests", ("path",))
+    requests.inc(path="/")
+    requests.inc(2, path='/a"b')
+    registry.gauge("demo_depth", "Depth", ("queue",), callback=lambda: {"a": 3, "b": 0})
+    latency = registry.histogram("demo_seconds", "Latency", buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        latency.observe(value)
+    text = registry.render()
+    for line in ['# TYPE demo_requests_total counter', 'demo_requests_total{path="/"} 1',
+                 'demo_requests_total{path="/a\\"b"} 2', '# TYPE demo_depth gauge', 'demo_depth{queue="a"} 3',
+                 'demo_seconds_bucket{le="0.1"} 1', 'demo_seconds_bucket{le="1.0"} 2',
+                 'demo_seconds_bucket{le="+Inf"} 3', 'demo_seconds_sum 5.55', 'demo_seconds_count 3']:
+        assert line in text.splitlines(), f"{line!r} not in\n{text}"
+    assert registry.counter("demo_requests_total", "Requests", ("path",)) is requests
+    print("  ✓ Counters, callback gauges and cumulative histogram buckets render as Prometheus text")
+
+async def test_spans():
+    print("\n=== Testing node and turn spans ===")
+    flow = wire_flow(Agent("m", "You are Anemone."), MemoryFilter("m", "Summarize.", background=False), RagNode())
+    shared = {"history": [{"role": "user", "content": "hello"}], "loop_count": 0}
+    turns_before, agent_execs = turn_seconds.count(), node_seconds.count(node="Agent", phase="exec")
+    with patch('nodes.call_llm_stream', side_effect=make_stream("Hi there!")):
+        await flow.run_async(shared)
+    assert turn_seconds.count() == turns_before + 1
+    assert node_seconds.count(node="Agent", phase="exec") == agent_execs + 1
+    assert turn_hops.count() == turns_before + 1
+    print("  ✓ A plain turn records one turn span and the Agent's prep/exec/post times")
+
+    shared["history"].append({"role": "user", "content": "Who is Bartholomew?"})
+    single_hop = turn_hops.snapshot()["buckets"][1]
+    with patch('nodes.call_llm_stream', side_effect=make_stream("retrieve_memory", "A cat.")), \
+         patch('nodes.retrieve_memory_text', AsyncMock(return_value={"query": "Who is Bartholomew?", "memory_text": "Bartholomew is a cat."})):
+        await flow.run_async(shared)
+    assert node_seconds.count(node="RagNode", phase="exec") >= 1
+    buckets = turn_hops.snapshot()["buckets"]
+    assert buckets[1] == single_hop and buckets[3] > buckets[2], "Agent -> RagNode -> Agent is three hops"
+    print("  ✓ A retrieve turn counts its Agent -> RagNode -> Agent hops")
+
+def test_endpoint():
+    print("\n=== Testing /metrics endpoint ===")
+    with patch('nodes.memory_client'):
+        from app import app
+    memory = ChromaMemory("ephemeral", embedding_function=lambda texts: [[1.0, 0.0] for _ in texts])
+    memory.save_memories(["Bartholomew is a rubber ducky."])
+    for _ in range(2):
+        memory.retrieve_memory("Who is Bartholomew?")
+    response = app.test_client().get('/metrics')
+    text = response.get_data(as_text=True)
+    assert response.status_code == 200 and response.content_type.startswith("text/plain; version=0.0.4")
+    for name in ("anemone_node_seconds_bucket", "anemone_turn_seconds_count", "anemone_turn_hops_bucket",
+                 'anemone_memory_queue_depth{queue="executor"}', "anemone_runtime_tasks"):
+        assert name in text, f"{name} missing from /metrics"
+    print("  ✓ /metrics exports latencies, hop counts and queue depths")
+    for line in ("anemone_retrieval_cache_hits 1", "anemone_retrieval_cache_misses 1",
+                 "anemone_embedding_cache_hits 0", "anemone_embedding_cache_misses 2"):
+        assert line in text.splitlines(), f"{line} missing from /metrics"
+    print("  ✓ /metrics exports retrieval and embedding cache hits and misses")
+
+async def main():
+    try:
+        test_registry()
+        await test_spans()
+        test_endpoint()
+    except AssertionError as e:
+        print(f"  ✗ Assertion failed: {e}")
+        print(f"\n{'='*60}")
+        print("❌ Metrics tests failed.")
+        sys.exit(1)
+    print(f"\n{'='*60}")
+    print("✅ All metrics tests passed!")
+    sys.exit(0)
+
+if __name__ == "__main__":
+    asyncio.run(main())
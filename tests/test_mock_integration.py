@@ -26,6 +26,11 @@ async def test_memory_retrieval_guard():
             [["Origin Story: I am named Anemone after the sea anemone, a creature that forms symbiotic relationships with others. My function is to be a helpful AI assistant with persistent memory."]]
         )
         mock_memory_instance.save_memory = MagicMock()
+        # Nodes use ChromaMemory's async API, route it to the sync mocks above
+        mock_memory_instance.aretrieve_memory = AsyncMock(side_effect=mock_memory_instance.retrieve_memory)
+        mock_memory_instance.aretrieve_memory_scored = AsyncMock(
+            side_effect=lambda query, n_results=1: (mock_memory_instance.retrieve_memory.return_value[1][0], [0.3]))
+        mock_memory_instance.asave_memory = AsyncMock(side_effect=mock_memory_instance.save_memory)
         
         # Mock streaming response that returns "retrieve_memory"
         async def mock_stream_generator_retrieve(messages, model):
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Test the cache-friendly prompt layout: across turns the Agent's prompts share a
+stable prefix, per-turn memory only costs its own tokens, and the prefix hit rate
+is reported from Ollama's prompt_eval_count. Uses a fake Ollama client that, like
+Ollama, only evaluates the part of a prompt after the prefix it still has cached.
+"""
+import asyncio
+import sys
+sys.path.insert(0, '.')
+
+from unittest.mock import patch
+from nodes import Agent
+from utils import PromptCacheStats, assemble_messages, estimate_tokens
+
+def tokens(message):
+    return estimate_tokens(message["content"]) + 4
+
+class FakeOllama:
+    """One cache slot per model: the previous prompt's messages."""
+
+    def __init__(self):
+        self.slots = {}
+        self.prompts = []
+
+    async def chat(self, model, messages, stream=False, keep_alive=None):
+        self.prompts.append(messages)
+        previous = self.slots.get(model, [])
+        shared = 0
+        while shared < min(len(previous), len(messages)) and previous[shared] == messages[shared]:
+            shared += 1
+        self.slots[model] = messages
+        final = {"message": {"role": "assistant", "content": ""}, "done": True,
+                 "prompt_eval_count": max(1, sum(tokens(m) for m in messages[shared:])),
+                 "prompt_eval_duration": 1_000_000}
+        if not stream:
+            return dict(final, message={"role": "assistant", "content": "summary"})
+
+        async def chunks():
+            yield {"message": {"role": "assistant", "content": "Sure, here you go."}, "done": False}
+            yield final
+
+        class Stream:
+            def __aiter__(self):
+                return chunks()
+
+            async def aclose(self):
+                pass
+        return Stream()
+
+async def turn(agent, shared, text, memory=None):
+    shared["history"].append({"role": "user", "content": text, "timestamp": f"t{len(shared['history'])}"})
+    shared["retrieved_memory"] = memory
+    return await agent._run_async(shared)
+
+def test_layout():
+    print("=== Testing prompt assembly ===")
+    history = [{"role": "user", "content": "hi", "timestamp": "2024-01-01T00:00:00"},
+               {"role": "agent", "content": "hello"}]
+    messages = assemble_messages("You are Anemone.", history, [{"role": "system", "content": "memory"}])
+    assert messages == [{"role": "system", "content": "You are Anemone."},
+                        {"role": "user", "content": "hi"},
+                        {"role": "assistant", "content": "hello"},
+                        {"role": "system", "content": "memory"}], messages
+    print("  ✓ System prompt, then history, then the per-call tail; agent turns sent as assistant, no extra keys")
+
+    agent = Agent("m", "You are Anemone.")
+    plain = agent._build_messages(history, None, None)
+    with_memory = agent._build_messages(history, "hi", "Bartholomew is a cat.")
+    assert with_memory[:len(plain)] == plain and len(with_memory) == len(plain) + 1
+    print("  ✓ Retrieved memory is appended after the prompt of a turn without it")
+
+async def test_reuse():
+    print("\n=== Testing prefix reuse across turns ===")
+    fake, stats = FakeOllama(), PromptCacheStats(slots=1)
+    agent = Agent("m", "You are Anemone. " * 50)
+    shared = {"history": [], "loop_count": 0}
+    with patch('utils.get_client', return_value=fake), patch('utils.prompt_cache', stats), \
+         patch('nodes.prompt_cache', stats):
+        for n in range(6):
+            await turn(agent, shared, f"Tell me about topic {n}, please.")
+        await turn(agent, shared, "Who is Bartholomew?", memory="Bartholomew is a cat. " * 20)
+        await turn(agent, shared, "And topic 7?")
+    report = stats.report()
+    assert report["calls"] == report["measured_calls"] == 8, report
+    assert report["observed_prefix_hit_rate"] > 0.7, report  # only the first turn is a cold start
+    assert abs(report["observed_prefix_hit_rate"] - report["expected_prefix_hit_rate"]) < 0.05, report
+    assert report["prompt_eval_ms"] == 8.0, report
+    print(f"  ✓ Eight turns: {report['observed_prefix_hit_rate']:.0%} of prompt tokens served from cache "
+          f"(expected {report['expected_prefix_hit_rate']:.0%})")
+
+    memory_turn, after = fake.prompts[6], fake.prompts[7]
+    assert memory_turn[:len(fake.prompts[5])] == fake.prompts[5]
+    assert memory_turn[-2]["content"] == "Who is Bartholomew?" and "Bartholomew is a cat." in memory_turn[-1]["content"]
+    assert after[:len(memory_turn) - 1] == memory_turn[:-1]
+    print("  ✓ The memory block only extends the prompt, and the next turn reuses everything before it")
+
+    # A summarization on the same model takes the only cache slot
+    with patch('utils.get_client', return_value=fake), patch('utils.prompt_cache', stats):
+        from utils import call_llm
+        await call_llm([{"role": "system", "content": "Summarize."}, {"role": "user", "content": "..."}], "m")
+        before = stats.report()["evaluated_tokens"]
+        await turn(agent, shared, "Still there?")
+    evicted = stats.report()["evaluated_tokens"] - before
+    assert evicted > sum(tokens(m) for m in fake.prompts[-1]) - 10, evicted
+    print(f"  ✓ A same-model call in between evicts the prefix ({evicted} tokens re-evaluated), and the report shows it")
+
+async def main():
+    try:
+        test_layout()
+        await test_reuse()
+    except AssertionError as e:
+        print(f"  ✗ Assertion failed: {e}")
+        print(f"\n{'='*60}")
+        print("❌ Prompt cache tests failed.")
+        sys.exit(1)
+    print(f"\n{'='*60}")
+    print("✅ All prompt cache tests passed!")
+    sys.exit(0)
+
+if __name__ == "__main__":
+    asyncio.run(main())
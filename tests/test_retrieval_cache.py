@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Test the retrieval cache in front of ChromaMemory lookups.
+Uses an ephemeral client with a counting fake collection, no embedding model required.
+"""
+import asyncio
+import sys
+import time
+sys.path.insert(0, '.')
+
+from memory import ChromaMemory, RetrievalCache
+
+class CountingCollection:
+    """Stands in for a Chroma collection, counting vector searches."""
+
+    def __init__(self):
+        self.queries = 0
+        self.documents = ["Bartholomew is a missing rubber ducky."]
+
+    def query(self, query_embeddings, n_results, include=None):
+        self.queries += 1
+        return {"documents": [list(self.documents)], "distances": [[0.5]]}
+
+    def upsert(self, documents, embeddings, metadatas, ids):
+        self.documents = list(documents)
+
+async def test_cache():
+    print("=== Testing retrieval cache ===")
+    memory = ChromaMemory("ephemeral", cache_size=2, cache_ttl=0.3, embedding_function=lambda texts: [[0.0, 1.0] for _ in texts])
+    fake = CountingCollection()
+    memory._collections["agent_memory"] = fake
+    memory.cache = RetrievalCache(max_entries=2, ttl=0.3)
+
+    memory.retrieve_memory("Who is Bartholomew?")
+    _, again = memory.retrieve_memory("  who is   bartholomew ")
+    _, via_async = await memory.aretrieve_memory("WHO IS BARTHOLOMEW")
+    assert fake.queries == 1, f"{fake.queries} searches for one normalized query"
+    assert again == via_async == [["Bartholomew is a missing rubber ducky."]]
+    print("  ✓ Normalized repeats are served from cache (sync and async)")
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        memory.retrieve_memory("who is bartholomew?")
+    per_hit = (time.perf_counter() - start) / 1000
+    print(f"  Cache hit costs {per_hit * 1e6:.1f} us")
+    assert per_hit < 1e-4
+
+    memory.retrieve_memory_scored("who is bartholomew?")
+    memory.retrieve_memory_scored("who is bartholomew?", n_results=3)
+    assert fake.queries == 3, "n_results and scored lookups have their own entries"
+    print("  ✓ Entries are keyed by n_results and result kind")
+
+    memory.save_memory("Bartholomew was found in the bathtub.")
+    _, fresh = memory.retrieve_memory("who is bartholomew?")
+    assert fresh == [["Bartholomew was found in the bathtub."]] and fake.queries == 4
+    print("  ✓ save_memory invalidates cached results for its collection")
+
+    memory.retrieve_memory("tell me a joke")
+    memory.retrieve_memory("what is your function")
+    memory.retrieve_memory("who is bartholomew?")
+    assert fake.queries == 7, "Least recently used entry should have been evicted"
+    print("  ✓ LRU eviction keeps at most cache_size entries")
+
+    await asyncio.sleep(0.35)
+    memory.retrieve_memory("who is bartholomew?")
+    assert fake.queries == 8, "Expired entry was served"
+    print("  ✓ Entries expire after the TTL")
+
+    stats = memory.cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1002, 8) and stats["entries"] <= 2, stats
+    print(f"  ✓ Stats exposed: {stats['hits']} hits, {stats['misses']} misses, hit rate {stats['hit_rate']:.1%}")
+
+    # A search that started before a write must not be cached as current
+    version = memory.cache.version("agent_memory")
+    memory.cache.bump("agent_memory")
+    memory.cache.put("agent_memory", "late query", 1, "documents", [["stale"]], version)
+    assert memory.cache.get("agent_memory", "late query", 1, "documents") is None
+    print("  ✓ Results computed before a write are never served after it")
+
+async def main():
+    try:
+        await test_cache()
+    except AssertionError as e:
+        print(f"  ✗ Assertion failed: {e}")
+        print(f"\n{'='*60}")
+        print("❌ Retrieval cache tests failed.")
+        sys.exit(1)
+    print(f"\n{'='*60}")
+    print("✅ All retrieval cache tests passed!")
+    sys.exit(0)
+
+if __name__ == "__main__":
+    asyncio.run(main())
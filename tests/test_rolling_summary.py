@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Test rolling summarization: MemoryFilter only sends the previous summary plus
+new turns, in prompts bounded by max_prompt_tokens.
+Mocks the LLM, no Ollama required.
+"""
+import asyncio
+import sys
+sys.path.insert(0, '.')
+
+from unittest.mock import AsyncMock, MagicMock, patch
+from nodes import SUMMARY_PREFIX, MemoryFilter
+from utils import estimate_tokens
+
+prompts = []
+
+async def mock_summary(messages, model):
+    prompts.append(messages)
+    return f"summary #{len(prompts)}"
+
+def turns(count, size=40):
+    return [{"role": "user" if i % 2 == 0 else "agent", "content": f"turn {i} " + "x" * size} for i in range(count)]
+
+async def summarize(node, history):
+    shared = {"history": history}
+    await node._run_async(shared)
+    return shared
+
+async def test_rolling():
+    print("=== Testing rolling summarization ===")
+    node = MemoryFilter("m", "Summarize.", background=False, max_prompt_tokens=400)
+    with patch('nodes.call_llm', side_effect=mock_summary):
+        prompts.clear()
+        history = [{"role": "system", "content": f"{SUMMARY_PREFIX}Bartholomew is missing."}] + turns(4)
+        shared = await summarize(node, history)
+        assert len(prompts) == 1
+        prompt = prompts[0][1]["content"]
+        assert "Previous summary:\nBartholomew is missing." in prompt and "user: turn 0" in prompt, prompt
+        assert SUMMARY_PREFIX not in prompt
+        assert shared["history"] == [{"role": "system", "content": f"{SUMMARY_PREFIX}summary #1"}]
+        print("  ✓ Prompt holds the previous summary and only the new turns")
+
+        prompts.clear()
+        await summarize(node, turns(60, size=200))
+        sizes = [sum(estimate_tokens(m["content"]) for m in p) for p in prompts]
+        assert len(prompts) > 1 and max(sizes) <= 400, sizes
+        assert prompts[1][1]["content"].startswith("Previous summary:\nsummary #1")
+        print(f"  ✓ A long stretch is folded in over {len(prompts)} calls of at most {max(sizes)} tokens")
+
+        prompts.clear()
+        await summarize(node, [{"role": "user", "content": "y" * 20000}])
+        assert estimate_tokens(prompts[0][1]["content"]) <= 400
+        print("  ✓ A single huge message is truncated to the budget")
+
+    async def failing_summary(messages, model):
+        prompts.append(messages)
+        if len(prompts) > 1:
+            raise ConnectionError("Ollama went away")
+        return "summary #1"
+
+    with patch('nodes.call_llm', side_effect=failing_summary):
+        prompts.clear()
+        history = turns(60, size=200)
+        shared = await summarize(node, list(history))
+        assert len(prompts) == 2, len(prompts)
+        assert shared["history"] == history and not shared.get("unpersisted"), shared["history"][:1]
+        assert not shared.get("history_version")
+        print("  ✓ A failed call mid-roll leaves history untouched for the next attempt")
+
+    memory = MagicMock()
+    memory.aenqueue_memories = AsyncMock()
+    with patch('nodes.call_llm', side_effect=mock_summary), patch('nodes.memory_client', return_value=memory):
+        shared = {"history": turns(4), "session_id": "s"}
+        for compression in range(2):
+            shared["memory_action"] = "persist"
+            await node._run_async(shared)
+            shared["history"] += turns(8)[4:] if compression == 0 else []
+        stored = [(document, metadata) for call in memory.aenqueue_memories.call_args_list
+                  for document, metadata in zip(call.args[0], call.kwargs["metadatas"])]
+        assert not any(SUMMARY_PREFIX in message["content"] for message in shared["unpersisted"]), shared["unpersisted"]
+        assert not any("summary #" in document for document, _ in stored), stored
+        assert [(m["turn_start"], m["turn_end"]) for _, m in stored] == [(0, 3), (4, 7)], stored
+        assert shared["persisted_until"] == 8
+        print("  ✓ Over two compressions only real turns are persisted, with their real turn numbers")
+
+    full = MemoryFilter("m", "Summarize.", background=False, rolling=False)
+    with patch('nodes.call_llm', side_effect=mock_summary):
+        prompts.clear()
+        await summarize(full, turns(60, size=200))
+        assert len(prompts) == 1 and len(prompts[0]) == 61
+        print("  ✓ rolling=False still sends the whole history in one call")
+
+async def main():
+    try:
+        await test_rolling()
+    except AssertionError as e:
+        print(f"  ✗ Assertion failed: {e}")
+        print(f"\n{'='*60}")
+        print("❌ Rolling summarization tests failed.")
+        sys.exit(1)
+    print(f"\n{'='*60}")
+    print("✅ All rolling summarization tests passed!")
+    sys.exit(0)
+
+if __name__ == "__main__":
+    asyncio.run(main())
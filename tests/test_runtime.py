@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Test the long-lived runtime loop that app.py submits flows to.
+No Ollama server required.
+"""
+import asyncio
+import sys
+import threading
+import time
+sys.path.insert(0, '.')
+
+import utils
+from runtime import AsyncRuntime
+
+async def sleepy(seconds):
+    await asyncio.sleep(seconds)
+    return asyncio.get_running_loop(), threading.current_thread().name
+
+async def _client():
+    return utils.get_client()
+
+def main():
+    print("=== Testing AsyncRuntime ===")
+    runtime = AsyncRuntime()
+    try:
+        # Many turns at once are limited by await points, not by worker threads
+        start = time.perf_counter()
+        futures = [runtime.submit(sleepy(0.2)) for _ in range(20)]
+        results = [f.result(timeout=5) for f in futures]
+        elapsed = time.perf_counter() - start
+        loops = {loop for loop, _ in results}
+        threads = {name for _, name in results}
+        assert len(loops) == 1 and threads == {runtime.name}, (loops, threads)
+        print("  ✓ All submissions share one loop on the runtime thread")
+        assert elapsed < 1.0, f"20 concurrent 0.2s sleeps took {elapsed:.2f}s"
+        print(f"  ✓ 20 concurrent turns finished in {elapsed:.2f}s")
+
+        # The loop survives between turns, so its pooled clients do too
+        first = runtime.run(_client())
+        second = runtime.run(_client())
+        assert first is second, "Ollama client not reused across turns"
+        print("  ✓ Pooled Ollama client is reused across turns")
+
+        # Shutdown cancels background work and closes the loop's clients
+        background = runtime.submit(asyncio.sleep(3600))
+        runtime.stop()
+        assert background.cancelled(), "Background task was not cancelled"
+        assert not any(key[1] is runtime.loop for key in utils._clients)
+        assert runtime.loop.is_closed() and not runtime.running
+        print("  ✓ stop() cancels tasks, closes clients and the loop")
+    except AssertionError as e:
+        print(f"  ✗ Assertion failed: {e}")
+        print(f"\n{'='*60}")
+        print("❌ Runtime tests failed.")
+        sys.exit(1)
+    finally:
+        runtime.stop()
+
+    print(f"\n{'='*60}")
+    print("✅ All runtime tests passed!")
+    sys.exit(0)
+
+if __name__ == "__main__":
+    main()
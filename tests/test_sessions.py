@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Test per-session conversation state and room-scoped emits.
+Mocks the LLM so two conversations can run concurrently without Ollama.
+"""
+import asyncio
+import sys
+sys.path.insert(0, '.')
+
+from unittest.mock import AsyncMock, MagicMock, patch
+from sessions import SessionStore
+
+class MockSocketIO:
+    def __init__(self):
+        self.emits = []
+
+    def emit(self, event, data=None, to=None):
+        self.emits.append((event, data, to))
+
+async def mock_stream(messages, model):
+    """Echoes the last user message back, slowly, so two turns interleave."""
+    last_user = [m for m in messages if m['role'] == 'user'][-1]['content']
+    for word in f"You said {last_user}.".split(" "):
+        await asyncio.sleep(0.01)
+        chunk = MagicMock()
+        chunk.message.content = word + " "
+        yield chunk
+
+def test_store():
+    print("Test 1: Session store")
+    store = SessionStore(MockSocketIO())
+    alice = store.connect("sid-a")
+    bob = store.connect("sid-b")
+    assert alice is not bob and alice.token != bob.token
+    assert alice.state is not bob.state
+    print("  ✓ Each connection without a token gets its own session")
+
+    again = store.connect("sid-a2", alice.token)
+    assert again is alice, "Known token should resume its session"
+    forged = store.connect("sid-c", "made-up-token")
+    assert forged.token != "made-up-token", "Unknown tokens must not be adopted"
+    print("  ✓ Known tokens resume, unknown tokens get a fresh session")
+
+    store.disconnect("sid-a")
+    assert store.get("sid-a") is None and store.get("sid-a2") is alice
+    print("  ✓ Disconnect only detaches that connection")
+
+    expired = []
+    store = SessionStore(MockSocketIO(), ttl=0.0, on_expire=expired.append)
+    idle = store.connect("sid-x")
+    store.disconnect("sid-x")
+    store.connect("sid-y")
+    assert expired == [idle] and len(store) == 1, expired
+    print("  ✓ Expired sessions are handed to on_expire")
+
+async def test_concurrent_sessions():
+    print("\nTest 2: Concurrent conversations")
+    socketio = MockSocketIO()
+    store = SessionStore(socketio)
+    alice = store.connect("sid-a")
+    bob = store.connect("sid-b")
+    alice.state['history'].append({'role': 'user', 'content': 'apples'})
+    bob.state['history'].append({'role': 'user', 'content': 'bananas'})
+
+    with patch('nodes.call_llm_stream', side_effect=mock_stream):
+        from orchestration import my_async_flow
+        await asyncio.wait_for(asyncio.gather(
+            my_async_flow.run_async(alice.state),
+            my_async_flow.run_async(bob.state),
+        ), timeout=5.0)
+
+    assert alice.state['history'][-1]['content'] == "You said apples", alice.state['history']
+    assert bob.state['history'][-1]['content'] == "You said bananas", bob.state['history']
+    assert alice.state['loop_count'] == 1 and bob.state['loop_count'] == 1
+    print("  ✓ Histories and loop counts stay separate")
+
+    for session, word in ((alice, 'apples'), (bob, 'bananas')):
+        streamed = ''.join(data['content'] for event, data, to in socketio.emits
+                           if event == 'stream_chunk' and to == session.token)
+        assert word in streamed and streamed.count('You said') == 1, streamed
+    assert all(to in (alice.token, bob.token) for _, _, to in socketio.emits), "Found an unscoped emit"
+    print("  ✓ Stream chunks only reach their own session's room")
+
+async def test_clear_persists():
+    print("\nTest 3: Clearing a short conversation")
+    from app import clear_session
+    socketio = MockSocketIO()
+    session = SessionStore(socketio).connect("sid-a")
+    for turn in range(3):
+        session.state['history'].append({'role': 'user', 'content': f'question {turn}'})
+        session.state['history'].append({'role': 'agent', 'content': f'answer {turn}'})
+    memory = MagicMock()
+    memory.aenqueue_memories = AsyncMock()
+    with patch('nodes.memory_client', return_value=memory), patch('app.socketio', socketio):
+        await clear_session(session)
+    documents = memory.aenqueue_memories.call_args.args[0]
+    stored = "\n".join(documents)
+    assert len(documents) == 2 and all(f"question {t}" in stored and f"answer {t}" in stored for t in range(3)), documents
+    assert session.state['history'] == [] and ('conversation_cleared', {}, session.token) in socketio.emits
+    print("  ✓ A 3-turn conversation that was never summarized is stored when cleared")
+
+async def test_clear_during_summary():
+    print("\nTest 4: Clearing while a background summary runs")
+    from app import clear_session
+    from nodes import MemoryFilter
+    socketio = MockSocketIO()
+    session = SessionStore(socketio).connect("sid-a")
+    for turn in range(3):
+        session.state['history'].append({'role': 'user', 'content': f'question {turn}'})
+        session.state['history'].append({'role': 'agent', 'content': f'answer {turn}'})
+    old_state = session.state
+    finished = asyncio.Event()
+
+    async def slow_summary(messages, model):
+        await asyncio.sleep(0.2)
+        finished.set()
+        return "summary"
+
+    memory = MagicMock()
+    memory.aenqueue_memories = AsyncMock()
+    with patch('nodes.call_llm', side_effect=slow_summary), \
+         patch('nodes.memory_client', return_value=memory), patch('app.socketio', socketio):
+        await MemoryFilter("m", "Summarize.")._run_async(old_state)
+        task = old_state["summary_task"]
+        await clear_session(session)
+        await asyncio.sleep(0.3)
+    assert task.cancelled() and not finished.is_set(), task
+    assert old_state['history'][0]['content'] == 'question 0' and not old_state['unpersisted'], old_state['history'][:1]
+    assert session.state['history'] == [] and not session.state['unpersisted']
+    stored = "\n".join(memory.aenqueue_memories.call_args.args[0])
+    assert all(f"answer {t}" in stored for t in range(3)), stored
+    print("  ✓ The summary is cancelled before the flush; its turns are stored, nothing lands afterwards")
+
+async def main():
+    try:
+        test_store()
+        await test_concurrent_sessions()
+        await test_clear_persists()
+        await test_clear_during_summary()
+    except (AssertionError, asyncio.TimeoutError) as e:
+        print(f"  ✗ Failed: {e!r}")
+        print(f"\n{'='*60}")
+        print("❌ Session tests failed.")
+        sys.exit(1)
+    print(f"\n{'='*60}")
+    print("✅ All session tests passed!")
+    sys.exit(0)
+
+if __name__ == "__main__":
+    asyncio.run(main())
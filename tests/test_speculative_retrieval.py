@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Test speculative memory retrieval: the Chroma query starts alongside the first
+Agent call. Mocks the LLM and ChromaDB with fixed delays, no Ollama required.
+"""
+import asyncio
+import sys
+import time
+sys.path.insert(0, '.')
+
+from unittest.mock import AsyncMock, MagicMock, patch
+from nodes import Agent, MemoryFilter, RagNode
+from orchestration import wire_flow
+
+LLM_DELAY = 0.2     # time to first token of each Agent call
+CHROMA_DELAY = 0.2  # one embedding + vector search
+
+def make_chunk(content):
+    chunk = MagicMock()
+    chunk.message.content = content
+    return chunk
+
+async def mock_stream(messages, model):
+    await asyncio.sleep(LLM_DELAY)
+    has_memory = any("Memory about '" in m['content'] for m in messages if m['role'] == 'system')
+    if 'Bartholomew' in messages[-1]['content'] and not has_memory:
+        yield make_chunk("retrieve_memory")
+    else:
+        yield make_chunk("Bartholomew is my rubber ducky.")
+
+async def slow_retrieve(query, n_results=1):
+    await asyncio.sleep(CHROMA_DELAY)
+    return ["Bartholomew is a missing rubber ducky."], [0.4]
+
+async def run_turn(speculative, user_msg):
+    flow = wire_flow(Agent("test-model", "test prompt", speculative_retrieval=speculative),
+                     MemoryFilter("test-model", "test prompt"), RagNode())
+    shared = {"history": [{"role": "user", "content": user_msg}], "loop_count": 0}
+    start = time.perf_counter()
+    await flow.run_async(shared)
+    return time.perf_counter() - start, shared
+
+async def test_speculative():
+    print("=== Testing speculative memory retrieval ===")
+    memory = MagicMock()
+    memory.aretrieve_memory_scored = AsyncMock(side_effect=slow_retrieve)
+    with patch('nodes.call_llm_stream', side_effect=mock_stream), \
+         patch('memory.ChromaMemory', return_value=memory):
+        serial, serial_shared = await run_turn(False, "Who is Bartholomew?")
+        speculative, spec_shared = await run_turn(True, "Who is Bartholomew?")
+        calls_before = memory.aretrieve_memory_scored.call_count
+        _, plain_shared = await run_turn(True, "Hello")
+        plain_calls = memory.aretrieve_memory_scored.call_count - calls_before
+
+    for shared in (serial_shared, spec_shared):
+        assert shared['history'][-1]['content'] == "Bartholomew is my rubber ducky", shared['history']
+        assert "speculative_retrieval" not in shared
+    print("  ✓ Retrieval turns answer with the retrieved memory in both modes")
+    assert memory.aretrieve_memory_scored.call_count - plain_calls == 2, "Expected one Chroma query per retrieval turn"
+    print("  ✓ Speculative result is reused, not queried twice")
+    assert "speculative_retrieval" not in plain_shared
+    print("  ✓ Unused speculative lookup is discarded on plain turns")
+
+    saved = serial - speculative
+    print(f"  Retrieval turn: {serial * 1e3:.0f} ms serial, {speculative * 1e3:.0f} ms speculative "
+          f"({saved * 1e3:.0f} ms saved, Chroma round trip {CHROMA_DELAY * 1e3:.0f} ms)")
+    assert saved > CHROMA_DELAY * 0.75, "Speculation did not hide the Chroma round trip"
+    print("  ✓ Speculation hides the Chroma round trip")
+
+async def main():
+    try:
+        await test_speculative()
+    except AssertionError as e:
+        print(f"  ✗ Assertion failed: {e}")
+        print(f"\n{'='*60}")
+        print("❌ Speculative retrieval tests failed.")
+        sys.exit(1)
+    print(f"\n{'='*60}")
+    print("✅ All speculative retrieval tests passed!")
+    sys.exit(0)
+
+if __name__ == "__main__":
+    asyncio.run(main())
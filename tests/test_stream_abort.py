@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Test that the LLM stream is closed as soon as retrieve_memory is detected.
+Mocks the Ollama client, no Ollama server required.
+"""
+import asyncio
+import sys
+import time
+sys.path.insert(0, '.')
+
+from unittest.mock import MagicMock, patch
+from nodes import Agent
+
+class FakeOllamaStream:
+    """Streams 'retrieve_memory' followed by a long tail, recording how far it got."""
+
+    def __init__(self, tail_tokens=500, token_interval=0.002):
+        self.tail_tokens = tail_tokens
+        self.token_interval = token_interval
+        self.produced = 0
+        self.closed = False
+
+    async def generate(self):
+        try:
+            for content in ["retrieve", "_memory"] + [" blah"] * self.tail_tokens:
+                await asyncio.sleep(self.token_interval)
+                self.produced += 1
+                chunk = MagicMock()
+                chunk.message.content = content
+                yield chunk
+        finally:
+            self.closed = True
+
+async def test_abort():
+    print("=== Testing stream abort on retrieve_memory ===")
+    fake = FakeOllamaStream()
+    client = MagicMock()
+
+    async def chat(**kwargs):
+        return fake.generate()
+    client.chat = chat
+
+    agent = Agent("test-model", "test prompt")
+    history = [{"role": "user", "content": "Who is Bartholomew?"}]
+    with patch('utils.get_client', return_value=client):
+        start = time.perf_counter()
+        result = await agent.exec_async((history, None, None, None))
+        elapsed = time.perf_counter() - start
+
+    assert result == "retrieve_memory", f"Unexpected response {result!r}"
+    print("  ✓ Response is the retrieve_memory command")
+    assert fake.produced == 2, f"Stream kept going for {fake.produced} chunks"
+    print("  ✓ No chunks were pulled after the command was recognized")
+    assert fake.closed, "Ollama stream was not closed"
+    print("  ✓ Underlying Ollama stream was closed immediately")
+    full = (fake.tail_tokens + 2) * fake.token_interval
+    print(f"  Turn took {elapsed * 1e3:.0f} ms instead of ~{full * 1e3:.0f} ms for the full stream")
+    assert elapsed < full / 2
+
+async def main():
+    try:
+        await test_abort()
+    except AssertionError as e:
+        print(f"  ✗ Assertion failed: {e}")
+        print(f"\n{'='*60}")
+        print("❌ Stream abort tests failed.")
+        sys.exit(1)
+    print(f"\n{'='*60}")
+    print("✅ All stream abort tests passed!")
+    sys.exit(0)
+
+if __name__ == "__main__":
+    asyncio.run(main())
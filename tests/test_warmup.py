@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Test model warm-up and residency tracking with a mocked Ollama client.
+No Ollama server required.
+"""
+import asyncio
+import sys
+sys.path.insert(0, '.')
+
+from unittest.mock import AsyncMock, MagicMock, patch
+from warmup import ModelWarmer
+
+async def test_warmer():
+    print("=== Testing ModelWarmer ===")
+    client = MagicMock()
+    client.chat = AsyncMock(return_value={"load_duration": 2_500_000_000})
+    client.ps = AsyncMock(return_value=MagicMock(models=[]))
+
+    with patch('warmup.get_client', return_value=client):
+        warmer = ModelWarmer(["phi4-mini", "phi4-mini", "other"], keep_alive="1h")
+        assert warmer.models == ["phi4-mini", "other"], f"Models not deduped: {warmer.models}"
+        print("  ✓ Duplicate model names are warmed once")
+
+        await warmer.warm("phi4-mini")
+        status = warmer.status()["models"]["phi4-mini"]
+        assert status["state"] == "loaded", status
+        assert status["load_duration_ms"] == 2500, status
+        _, kwargs = client.chat.call_args
+        assert kwargs["keep_alive"] == "1h" and kwargs["messages"] == []
+        print("  ✓ Warm-up pins the model with keep_alive and records load time")
+
+        # Ollama reports nothing loaded -> both models are re-warmed
+        client.chat.reset_mock()
+        await warmer.check()
+        warmed = sorted(call.kwargs["model"] for call in client.chat.call_args_list)
+        assert warmed == ["other", "phi4-mini"], warmed
+        print("  ✓ Unloaded models are re-warmed")
+
+        # Ollama reports the model as loaded under its tagged name -> nothing to do
+        client.chat.reset_mock()
+        loaded = MagicMock(model="phi4-mini:latest", expires_at=None)
+        loaded.name = "phi4-mini:latest"
+        client.ps.return_value = MagicMock(models=[loaded])
+        warmer.models = ["phi4-mini"]
+        await warmer.check()
+        assert not client.chat.called, "Loaded model should not be re-warmed"
+        print("  ✓ Resident models are left alone")
+
+        client.chat.side_effect = ConnectionError("Failed to connect to Ollama")
+        await warmer.warm("other")
+        status = warmer.status()["models"]["other"]
+        assert status["state"] == "error" and "connect" in status["error"], status
+        print("  ✓ Unreachable Ollama is reported as an error state")
+    return True
+
+async def main():
+    try:
+        await test_warmer()
+    except AssertionError as e:
+        print(f"  ✗ Assertion failed: {e}")
+        print(f"\n{'='*60}")
+        print("❌ Warm-up tests failed.")
+        sys.exit(1)
+    print(f"\n{'='*60}")
+    print("✅ All warm-up tests passed!")
+    sys.exit(0)
+
+if __name__ == "__main__":
+    asyncio.run(main())
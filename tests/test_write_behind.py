@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Test the write-behind persistence queue: batching, flush triggers, bounded
+queue, draining on shutdown, journal replay after a crash and journal compaction.
+No Ollama required; uses fake writers and an ephemeral Chroma client.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+sys.path.insert(0, '.')
+
+from unittest.mock import patch
+from memory import ChromaMemory, WriteBehindQueue
+from nodes import advance_persisted, queue_unpersisted
+
+class RecordingWriter:
+    def __init__(self, fail=False, delay=0.0):
+        self.batches = []
+        self.fail = fail
+        self.delay = delay
+
+    def __call__(self, collection, documents, metadatas, ids):
+        time.sleep(self.delay)
+        if self.fail:
+            raise ConnectionError("chroma down")
+        self.batches.append((collection, list(documents), ids))
+
+    @property
+    def documents(self):
+        return [doc for _, docs, _ in self.batches for doc in docs]
+
+def test_batching():
+    print("=== Batching and flush triggers ===")
+    writer = RecordingWriter()
+    wbq = WriteBehindQueue(writer, batch_size=10, flush_interval=0.2)
+    for session in range(5):
+        wbq.put([f"s{session} a", f"s{session} b"])
+    assert wbq.flush(timeout=2)
+    assert len(writer.batches) == 1 and len(writer.documents) == 10, writer.batches
+    print("  ✓ Writes from five sessions are stored in one batch once batch_size is reached")
+
+    start = time.perf_counter()
+    wbq.put(["lonely write"])
+    assert wbq.flush(timeout=2)
+    waited = time.perf_counter() - start
+    assert writer.documents[-1] == "lonely write" and 0.15 < waited < 1.0, waited
+    print(f"  ✓ A partial batch is flushed after flush_interval ({waited * 1e3:.0f} ms)")
+
+    wbq.put(["same chunk"], ids=["chunk-1"])
+    wbq.put(["same chunk, updated"], ids=["chunk-1"])
+    wbq.flush(timeout=2)
+    assert writer.batches[-1][2] == ["chunk-1"] and writer.documents[-1] == "same chunk, updated"
+    print("  ✓ Repeated ids in one batch collapse to the latest write")
+    wbq.close()
+
+def test_bounded():
+    print("\n=== Bounded queue ===")
+    gate = threading.Event()
+    wbq = WriteBehindQueue(lambda *args: gate.wait(), max_pending=2, batch_size=1, flush_interval=0)
+    for i in range(3):
+        wbq.put([f"doc {i}"])  # one taken by the (stuck) writer, two queued
+    blocked = threading.Thread(target=wbq.put, args=(["one too many"],), daemon=True)
+    blocked.start()
+    blocked.join(0.3)
+    assert blocked.is_alive(), "put() did not wait for room in the queue"
+    gate.set()
+    blocked.join(2)
+    assert not blocked.is_alive() and wbq.flush(timeout=2)
+    print("  ✓ put() blocks while max_pending writes are waiting, and resumes as they drain")
+    wbq.close()
+
+def test_drain_and_journal(tmp):
+    print("\n=== Shutdown drain and journal replay ===")
+    writer = RecordingWriter()
+    wbq = WriteBehindQueue(writer, batch_size=1000, flush_interval=60)
+    for i in range(50):
+        wbq.put([f"doc {i}"])
+    wbq.close()
+    assert len(writer.documents) == 50, len(writer.documents)
+    print("  ✓ close() stores everything still queued")
+
+    journal = os.path.join(tmp, "journal.jsonl")
+    broken = WriteBehindQueue(RecordingWriter(fail=True), journal_path=journal, flush_interval=0, retry_interval=0.05)
+    broken.put(["survives the crash"], metadatas=[{"session": "a"}], ids=["chunk-a"])
+    broken.put(["so does this"])
+    time.sleep(0.2)
+    broken.close()  # the process "crashes" with nothing stored
+    assert os.path.getsize(journal) > 0
+    with open(journal, "a") as f:
+        f.write('{"collection": "agent_memory", "docum')  # torn last line
+    print("  ✓ Unstored writes stay in the journal")
+
+    writer = RecordingWriter()
+    recovered = WriteBehindQueue(writer, journal_path=journal, flush_interval=0)
+    assert recovered.flush(timeout=2)
+    assert sorted(writer.documents) == ["so does this", "survives the crash"], writer.documents
+    assert "chunk-a" in [id_ for _, _, ids in writer.batches for id_ in ids]
+    assert os.path.getsize(journal) == 0, "Journal not cleared after replay"
+    print("  ✓ Journaled writes are replayed on the next start, then the journal is cleared")
+    recovered.close()
+
+def test_long_journal(tmp):
+    print("\n=== Replaying a journal longer than max_pending ===")
+    journal = os.path.join(tmp, "long.jsonl")
+    broken = WriteBehindQueue(RecordingWriter(fail=True), journal_path=journal, retry_interval=0.05)
+    for i in range(50):
+        broken.put([f"doc {i}"], ids=[f"id-{i}"])
+    broken.close()
+
+    gate = threading.Event()
+    writer = RecordingWriter()
+
+    def write(*args):
+        if len(writer.documents) >= 40:
+            gate.wait()
+        writer(*args)
+
+    start = time.perf_counter()
+    recovered = WriteBehindQueue(write, journal_path=journal, max_pending=4, batch_size=5, flush_interval=0)
+    elapsed = time.perf_counter() - start
+    assert elapsed < 1.0, f"Constructor took {elapsed:.1f}s"
+    print(f"  ✓ 50 journaled writes with max_pending=4 replay without blocking the constructor ({elapsed * 1e3:.0f} ms)")
+
+    deadline = time.monotonic() + 2
+    while len(writer.documents) < 40 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    with open(journal) as f:
+        lines = sum(1 for _ in f)
+    assert len(recovered) == 10 and 10 <= lines < 50, (len(recovered), lines)
+    print(f"  ✓ Stored writes leave the journal while others are pending ({lines} lines for 10 unstored)")
+
+    gate.set()
+    assert recovered.flush(timeout=2)
+    assert sorted(writer.documents) == sorted(f"doc {i}" for i in range(50))
+    assert os.path.getsize(journal) == 0
+    print("  ✓ Every journaled write is stored, then the journal is cleared")
+    recovered.close()
+
+class SlowEmbedding:
+    def __call__(self, texts):
+        time.sleep(0.3)
+        return [[float(len(text)), 1.0] for text in texts]
+
+async def test_turn_latency():
+    print("\n=== Persistence is off the turn's path ===")
+    memory = ChromaMemory("ephemeral", embedding_function=SlowEmbedding())
+    messages = [{"role": "user" if i % 2 == 0 else "agent", "content": f"message {i}"} for i in range(8)]
+    shared = {"unpersisted": messages}
+    with patch('nodes.memory_client', return_value=memory):
+        start = time.perf_counter()
+        advance_persisted(shared, 0, await queue_unpersisted(list(messages), "s", 0))
+        elapsed = time.perf_counter() - start
+    assert elapsed < 0.1, f"Persist step took {elapsed * 1e3:.0f} ms"
+    assert shared["persisted_until"] == 8
+    print(f"  ✓ Persist step returned in {elapsed * 1e3:.1f} ms with a 300 ms embedding model")
+    await asyncio.get_running_loop().run_in_executor(None, memory.writer.flush)
+    assert memory._collection("agent_memory").count() == 2
+    print("  ✓ Chunks are stored in the background")
+
+async def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            test_batching()
+            test_bounded()
+            test_drain_and_journal(tmp)
+            test_long_journal(tmp)
+            await test_turn_latency()
+        except AssertionError as e:
+            print(f"  ✗ Assertion failed: {e}")
+            print(f"\n{'='*60}")
+            print("❌ Write-behind tests failed.")
+            sys.exit(1)
+    print(f"\n{'='*60}")
+    print("✅ All write-behind tests passed!")
+    sys.exit(0)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,3 +1,256 @@
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import httpx
+from ollama import AsyncClient
+
+from logs import Sampler
+from metrics import record_llm_call
+
+logger = logging.getLogger(__name__)
+
+# Connection settings for the shared Ollama clients
+OLLAMA_HOST = os.environ.get("OLLAMA_HOST")
+OLLAMA_TIMEOUT = httpx.Timeout(connect=5.0, read=30.0, write=30.0, pool=5.0)
+OLLAMA_POOL_LIMITS = httpx.Limits(
+    max_connections=int(os.environ.get("OLLAMA_MAX_CONNECTIONS", 20)),
+    max_keepalive_connections=int(os.environ.get("OLLAMA_MAX_KEEPALIVE_CONNECTIONS", 10)),
+    keepalive_expiry=float(os.environ.get("OLLAMA_KEEPALIVE_EXPIRY", 120.0)),
+)
+# How long Ollama keeps a model in memory after each request (Ollama duration string or seconds)
+OLLAMA_KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+# Requests a loaded model serves in parallel, each with its own cached prompt prefix
+OLLAMA_NUM_PARALLEL = int(os.environ.get("OLLAMA_NUM_PARALLEL", 1))
+
+# (host, event loop) -> AsyncClient. httpx pools are bound to the loop that created them.
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_client(host=None):
+    """
+    Returns the shared Ollama client for this host on the running event loop,
+    creating it on first use so later calls reuse its warm keep-alive connections.
+
+    Args:
+        host : Ollama server URL, defaults to OLLAMA_HOST (or ollama's own default)
+
+    Returns:
+        An ollama.AsyncClient owned by the running loop
+    """
+    loop = asyncio.get_running_loop()
+    key = (host or OLLAMA_HOST, loop)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            # Forget clients whose loop is gone, their sockets can't be reused anyway
+            for stale in [k for k in _clients if k[1].is_closed()]:
+                del _clients[stale]
+            client = AsyncClient(host=key[0], timeout=OLLAMA_TIMEOUT, limits=OLLAMA_POOL_LIMITS)
+            _clients[key] = client
+    return client
+
+async def close_clients():
+    """Closes every shared client owned by the running loop. Await it before the loop shuts down."""
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        owned = [k for k in _clients if k[1] is loop]
+        clients = [_clients.pop(k) for k in owned]
+    for client in clients:
+        try:
+            await client.close()
+        except Exception as e:
+            logger.warning("Error closing Ollama client: %s", e)
+
+def estimate_tokens(text):
+    """
+    Rough token count for budgeting prompts, about four characters per token
+    for English text with Llama-family tokenizers. Never tokenizes.
+    """
+    return (len(text) + 3) // 4
+
+class ContextBudget:
+    """
+    Tracks how big the prompt of a conversation is getting, in estimated tokens,
+    and says when the history should be compressed: once the prompt crosses
+    `high_water` of `context_tokens`.
+
+    Starts at estimate_tokens' four characters per token and calibrates the ratio
+    from the prompt_eval_count Ollama reports for real prompts.
+    """
+
+    def __init__(self, context_tokens=4096, high_water=0.75, chars_per_token=4.0):
+        self.context_tokens = context_tokens
+        self.high_water = high_water
+        self.chars_per_token = chars_per_token
+
+    @property
+    def limit(self):
+        return int(self.context_tokens * self.high_water)
+
+    @staticmethod
+    def _chars(messages):
+        # Role names and message framing add a few tokens per message
+        return sum(len(message.get("content") or "") + 16 for message in messages)
+
+    def estimate(self, messages):
+        """Estimated prompt tokens for a list of chat messages."""
+        return int(self._chars(messages) / self.chars_per_token)
+
+    def over(self, messages):
+        return self.estimate(messages) > self.limit
+
+    def calibrate(self, messages, prompt_tokens):
+        """Folds in the token count Ollama reported for `messages`."""
+        if not isinstance(prompt_tokens, int) or prompt_tokens <= 0:
+            return
+        ratio = self._chars(messages) / prompt_tokens
+        # Ignore counts that can't be the full prompt (e.g. only the uncached part of it)
+        if 1.5 <= ratio <= 8.0:
+            self.chars_per_token += 0.2 * (ratio - self.chars_per_token)
+
+# Prompt assembly
+# Ollama only keeps the KV cache of a prompt prefix that is byte-for-byte the same as
+# the previous request's, so prompts are laid out as a stable, append-only prefix
+# (system prompt, then history) followed by a tail that may change on every call.
+OLLAMA_ROLES = {"agent": "assistant"}
+
+def to_chat_message(message):
+    """A history entry as Ollama expects it: known role, and nothing but role and content."""
+    role = message.get("role", "user")
+    return {"role": OLLAMA_ROLES.get(role, role), "content": message.get("content") or ""}
+
+def assemble_messages(system_prompt, history, tail=None):
+    """
+    [system prompt] + history + tail. History is only ever appended to between
+    compressions, so everything before the tail is reused from Ollama's cache;
+    per-call context (e.g. retrieved memory) belongs in `tail`.
+    """
+    messages = [{"role": "system", "content": system_prompt}]
+    messages.extend(to_chat_message(message) for message in history)
+    messages.extend(to_chat_message(message) for message in tail or ())
+    return messages
+
+def _response_field(response, name):
+    """An integer count/duration from an Ollama response or chunk, dict or object; None if absent."""
+    value = response.get(name) if isinstance(response, dict) else getattr(response, name, None)
+    return value if isinstance(value, int) else None
+
+def llm_call_metrics(model, response, started, first_chunk=None):
+    """
+    One request's metrics, from the final response/chunk (None if the stream was
+    closed before Ollama finished) and the client-side perf_counter() times.
+    Ollama reports durations in nanoseconds; these are milliseconds.
+    """
+    fields = {name: _response_field(response, name) if response is not None else None
+              for name in ("prompt_eval_count", "prompt_eval_duration", "eval_count", "eval_duration",
+                           "load_duration", "total_duration")}
+    return {
+        "model": model,
+        "done": response is not None,
+        "ttft_ms": (first_chunk - started) * 1000 if first_chunk is not None else None,
+        "prompt_eval_count": fields["prompt_eval_count"] or 0,
+        "prompt_eval_ms": (fields["prompt_eval_duration"] or 0) / 1e6,
+        "eval_count": fields["eval_count"] or 0,
+        "eval_ms": (fields["eval_duration"] or 0) / 1e6,
+        "load_ms": (fields["load_duration"] or 0) / 1e6,
+        "total_ms": (fields["total_duration"] / 1e6 if fields["total_duration"] is not None
+                     else (time.perf_counter() - started) * 1000),
+    }
+
+class PromptCacheStats:
+    """
+    Prefix reuse of the prompts sent to Ollama. For each call it records the prefix
+    Ollama could reuse (longest run of leading messages shared with one of the last
+    `slots` prompts of that model) and, from the response, how many prompt tokens
+    Ollama actually evaluated (prompt_eval_count counts only the uncached part).
+    """
+
+    def __init__(self, slots=OLLAMA_NUM_PARALLEL, max_models=16):
+        self.slots = slots
+        self.max_models = max_models
+        self.calls = 0
+        self.measured_calls = 0
+        self.prompt_tokens = 0
+        self.expected_cached_tokens = 0
+        self.measured_prompt_tokens = 0
+        self.evaluated_tokens = 0
+        self.prompt_eval_ns = 0
+        # model -> recent prompts, each a list of per-message digests
+        self._recent = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _digests(messages):
+        return [hashlib.sha1(f"{m['role']}\0{m['content']}".encode("utf-8")).digest() for m in messages]
+
+    def _shared(self, model, digests):
+        shared = 0
+        for previous in self._recent.get(model, ()):
+            n = 0
+            while n < min(len(previous), len(digests)) and previous[n] == digests[n]:
+                n += 1
+            shared = max(shared, n)
+        return shared
+
+    def shared_prefix(self, model, messages):
+        """Leading messages of `messages` Ollama should still have cached for `model`."""
+        digests = self._digests(messages)
+        with self._lock:
+            return self._shared(model, digests)
+
+    def expect(self, model, messages):
+        """Call before sending `messages`. Returns a handle for observe()."""
+        digests = self._digests(messages)
+        sizes = [estimate_tokens(m["content"]) + 4 for m in messages]
+        with self._lock:
+            shared = self._shared(model, digests)
+            recent = self._recent.setdefault(model, [])
+            self._recent.move_to_end(model)
+            while len(self._recent) > self.max_models:
+                self._recent.popitem(last=False)
+            recent.insert(0, digests)
+            del recent[self.slots:]
+            total, cached = sum(sizes), sum(sizes[:shared])
+            self.calls += 1
+            self.prompt_tokens += total
+            self.expected_cached_tokens += cached
+        return {"total": total, "cached": cached}
+
+    def observe(self, expected, response):
+        """Call with the final response (or stream chunk) of the request."""
+        evaluated = _response_field(response, "prompt_eval_count")
+        if evaluated is None:
+            return
+        with self._lock:
+            self.measured_calls += 1
+            self.measured_prompt_tokens += expected["total"]
+            self.evaluated_tokens += evaluated
+            self.prompt_eval_ns += _response_field(response, "prompt_eval_duration") or 0
+
+    def report(self):
+        with self._lock:
+            expected = self.expected_cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+            observed = None
+            if self.measured_prompt_tokens:
+                observed = max(0.0, min(1.0, 1 - self.evaluated_tokens / self.measured_prompt_tokens))
+            return {
+                "calls": self.calls,
+                "prompt_tokens": self.prompt_tokens,
+                "expected_prefix_hit_rate": expected,
+                "measured_calls": self.measured_calls,
+                "evaluated_tokens": self.evaluated_tokens,
+                "observed_prefix_hit_rate": observed,
+                "prompt_eval_ms": self.prompt_eval_ns / 1e6,
+            }
+
+# Every prompt sent through call_llm / call_llm_stream is accounted here
+prompt_cache = PromptCacheStats()
+
 def remove_system(conv_list):
     """
     Simply removes system prompts and whatnot to avoid confusing the memory agent 
@@ -11,61 +264,70 @@ def remove_system(conv_list):
     """
     return [message for message in conv_list if message['role'] != 'system']
 
-async def call_llm(messages, model="llama2"):
-    """Non-streaming LLM call"""
-    from ollama import AsyncClient 
-    import httpx
-    
-    # Set timeout for connection and reads
-    timeout = httpx.Timeout(connect=5.0, read=30.0, write=30.0, pool=5.0)
-    client = AsyncClient(timeout=timeout)
+async def call_llm(messages, model="llama2", host=None, keep_alive=OLLAMA_KEEP_ALIVE):
+    """Non-streaming LLM call. Raises on failure, like call_llm_stream, so errors never pass for replies."""
+    client = get_client(host)
+    expected = prompt_cache.expect(model, messages)
+    started = time.perf_counter()
     
     try:
         response = await client.chat(
             model=model,
-            messages=messages
+            messages=messages,
+            keep_alive=keep_alive
         )
+        prompt_cache.observe(expected, response)
+        record_llm_call(llm_call_metrics(model, response, started))
         # The response object from ollama is a dictionary.
         # We are interested in the 'content' of the 'message'.
         return response['message']['content']
-    except ImportError:
-        return "Error: Ollama Python client not installed."
-    except httpx.ConnectError:
-        return "Error: Cannot connect to Ollama server. Please make sure Ollama is running (run 'ollama serve')."
-    except httpx.TimeoutException:
-        return f"Error: Timeout connecting to Ollama server after {timeout.connect} seconds. Is Ollama running?"
-    except Exception as e:
-        return f"Error during LLM call: {str(e)[:100]}"
+    except httpx.TimeoutException as e:
+        logger.error("Timeout connecting to Ollama: %s", e)
+        raise ConnectionError(f"Timeout connecting to Ollama server after {OLLAMA_TIMEOUT.connect} seconds. Is Ollama running?") from e
+    except httpx.ConnectError as e:
+        logger.error("Cannot connect to Ollama: %s", e)
+        raise
 
-async def call_llm_stream(messages, model="llama2"):
+async def call_llm_stream(messages, model="llama2", host=None, keep_alive=OLLAMA_KEEP_ALIVE):
     """Streaming LLM call"""
-    from ollama import AsyncClient 
-    import httpx
-    
-    # Set timeout for connection and reads
-    timeout = httpx.Timeout(connect=5.0, read=30.0, write=30.0, pool=5.0)
-    client = AsyncClient(timeout=timeout)
+    client = get_client(host)
+    expected = prompt_cache.expect(model, messages)
     
-    print(f"call_llm_stream: Calling ollama with model={model}, messages={len(messages)}")
+    logger.debug("Streaming from %s with %d messages", model, len(messages))
+    started, first_chunk, final = time.perf_counter(), None, None
+    chunk_log = Sampler(logger)
+    debug = chunk_log.enabled
     try:
         response = await client.chat(
             model=model,
             messages=messages,
-            stream=True
+            stream=True,
+            keep_alive=keep_alive
         )
-        print(f"call_llm_stream: Got response, iterating...")
-        async for chunk in response:
-            print(f"call_llm_stream: Yielding chunk type {type(chunk)}")
-            yield chunk
-        print(f"call_llm_stream: Finished iteration")
+        try:
+            async for chunk in response:
+                if debug:
+                    chunk_log.debug("Yielding chunk %r", chunk)
+                if first_chunk is None:
+                    first_chunk = time.perf_counter()
+                done = chunk.get("done") if isinstance(chunk, dict) else getattr(chunk, "done", None)
+                if done is True:
+                    # Only the final chunk carries the request's timings
+                    final = chunk
+                    prompt_cache.observe(expected, chunk)
+                yield chunk
+        finally:
+            # When the caller stops early this drops the HTTP stream, which makes
+            # Ollama stop generating instead of finishing a response nobody reads
+            await response.aclose()
+            record_llm_call(llm_call_metrics(model, final, started, first_chunk))
+        logger.debug("Stream from %s finished", model)
     except httpx.TimeoutException as e:
-        print(f"call_llm_stream: Timeout connecting to Ollama - {e}")
-        raise ConnectionError(f"Timeout connecting to Ollama server after {timeout.connect} seconds. Is Ollama running?") from e
+        logger.error("Timeout connecting to Ollama: %s", e)
+        raise ConnectionError(f"Timeout connecting to Ollama server after {OLLAMA_TIMEOUT.connect} seconds. Is Ollama running?") from e
     except httpx.ConnectError as e:
-        print(f"call_llm_stream: Cannot connect to Ollama - {e}")
+        logger.error("Cannot connect to Ollama: %s", e)
         raise
     except Exception as e:
-        print(f"call_llm_stream: Error: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error streaming from %s: %s", model, e)
         raise
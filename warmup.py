@@ -0,0 +1,107 @@
+import asyncio
+import logging
+import threading
+import time
+
+from utils import get_client, close_clients, OLLAMA_KEEP_ALIVE
+
+logger = logging.getLogger(__name__)
+
+class ModelWarmer:
+    """
+    Keeps the Ollama models used by the nodes resident, so the first user turn
+    doesn't pay for a full model load.
+
+    Every model is preloaded once at start, then Ollama's loaded models are polled:
+    anything that got unloaded is warmed again straight away, and everything is
+    refreshed every `refresh_interval` seconds so its keep_alive never runs out.
+    """
+
+    def __init__(self, models, keep_alive=OLLAMA_KEEP_ALIVE, poll_interval=30.0, refresh_interval=600.0, host=None):
+        self.models = list(dict.fromkeys(models))  # dedupe, keep order
+        self.keep_alive = keep_alive
+        self.poll_interval = poll_interval
+        self.refresh_interval = refresh_interval
+        self.host = host
+        self._lock = threading.Lock()
+        self._status = {model: {"state": "cold", "last_warmed": None, "load_duration_ms": None,
+                                "expires_at": None, "error": None} for model in self.models}
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def _update(self, model, **fields):
+        with self._lock:
+            self._status[model].update(fields)
+
+    def status(self):
+        """Snapshot of every model's load state, safe to call from any thread."""
+        with self._lock:
+            return {"keep_alive": self.keep_alive,
+                    "models": {model: dict(info) for model, info in self._status.items()}}
+
+    async def warm(self, model):
+        """Loads `model` (an empty chat makes Ollama load it without generating) and pins it with keep_alive."""
+        self._update(model, state="warming", error=None)
+        try:
+            response = await get_client(self.host).chat(model=model, messages=[], keep_alive=self.keep_alive)
+            load_ns = response.get("load_duration") or 0
+            self._update(model, state="loaded", last_warmed=time.time(), load_duration_ms=load_ns / 1e6)
+            logger.info("%s warm (load took %.0f ms)", model, load_ns / 1e6)
+        except Exception as e:
+            self._update(model, state="error", error=str(e)[:100])
+            logger.warning("Could not warm %s: %s", model, e)
+
+    async def check(self):
+        """Asks Ollama which models are loaded and re-warms the ones that are not."""
+        try:
+            running = await get_client(self.host).ps()
+        except Exception as e:
+            logger.warning("Could not list loaded models: %s", e)
+            return
+        loaded = {}
+        for info in running.models:
+            for name in (info.model, info.name):
+                if name:
+                    loaded[name] = info
+        for model in self.models:
+            # Ollama reports "phi4-mini:latest" for "phi4-mini"
+            info = loaded.get(model) or loaded.get(f"{model}:latest")
+            if info is None:
+                with self._lock:
+                    was_loaded = self._status[model]["state"] == "loaded"
+                if was_loaded:
+                    logger.info("%s was unloaded, re-warming", model)
+                    self._update(model, state="unloaded")
+                await self.warm(model)
+            else:
+                expires = info.expires_at.isoformat() if info.expires_at else None
+                self._update(model, state="loaded", expires_at=expires)
+
+    async def run(self):
+        """Preloads every model, then keeps them resident until stop() is called."""
+        await asyncio.gather(*(self.warm(model) for model in self.models))
+        last_refresh = time.monotonic()
+        while not self._stopped.is_set():
+            await asyncio.sleep(self.poll_interval)
+            if time.monotonic() - last_refresh >= self.refresh_interval:
+                await asyncio.gather(*(self.warm(model) for model in self.models))
+                last_refresh = time.monotonic()
+            else:
+                await self.check()
+
+    async def _run_standalone(self):
+        try:
+            await self.run()
+        finally:
+            await close_clients()
+
+    def start(self):
+        """Runs the warmer on its own daemon thread. Code that already owns a loop should schedule run() on it instead."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=asyncio.run, args=(self._run_standalone(),),
+                                            name="model-warmer", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()